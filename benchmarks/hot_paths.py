@@ -0,0 +1,288 @@
+'''
+Benchmark suite for the hot paths of the MFRC522 driver, running against the SimulatedSpi or a recorded session.
+
+Usage:
+    python -m benchmarks.hot_paths                                  # Run all benchmarks, print a table
+    python -m benchmarks.hot_paths --json results.json              # Also write the results as JSON
+    python -m benchmarks.hot_paths --compare old.json select_uid7   # Compare with an earlier run
+    python -m benchmarks.hot_paths --trace session.trace            # Replay a recorded session (see BinaryTracer)
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+from mfrc522 import (
+    MFRC522,
+    SimpleMFRC522,
+    StatusCode,
+    SimulatedSpi,
+    SimulatedPicc,
+    ReplayTransport
+)
+
+
+UID4 = [0x11, 0x22, 0x33, 0x44]
+UID7 = [0x04, 0x11, 0x22, 0x33, 0x44, 0x55, 0x66]
+UID10 = [0x04, 0x11, 0x22, 0x33, 0x44, 0x55, 0x66, 0x77, 0x88, 0x99]
+VALUE_BLOCK = 5
+
+
+def value_block(value, block_addr):
+    '''
+    @return: The 16 bytes of a value block with the given value
+    '''
+    data = list((value & 0xFFFFFFFF).to_bytes(4, 'little'))
+    return data + [~b & 0xFF for b in data] + data + [block_addr, ~block_addr & 0xFF, block_addr, ~block_addr & 0xFF]
+
+
+def create_reader(piccs, faults=None):
+    '''
+    @return: (MFRC522, SimulatedSpi) - initialized MFRC522 on a SimulatedSpi with the given PICCs (and optional FaultInjector)
+    '''
+    spi = SimulatedSpi(piccs, faults=faults)
+    rfid = MFRC522(pin_reset=0, pin_irq=0, spi=spi)
+    rfid.pcd_init()
+    return rfid, spi
+
+
+def create_simple_reader(piccs, faults=None):
+    '''
+    @return: (SimpleMFRC522, SimulatedSpi) - the PICC is woken up with WUPA instead of waiting for the IRQ
+    '''
+    simple = SimpleMFRC522(pin_reset=0, pin_irq=0)
+    simple.rfid, spi = create_reader(piccs, faults)
+    simple.wait_for_interrupt = simple.rfid.picc_is_card_present
+    return simple, spi
+
+
+class Benchmark(object):
+    '''
+    A benchmark: setup() returns (operation, spi), the operation is called repeatedly and must be repeatable
+    '''
+
+    def __init__(self, name, description, setup):
+        self.name = name
+        self.description = description
+        self.setup = setup
+
+    def run(self, min_time=1.0, min_ops=10):
+        '''
+        Calls the operation until min_time seconds and min_ops calls are reached
+
+        @return: dict with ops, ops_per_sec, cpu time, SPI transfers and bytes per operation
+        '''
+        operation, spi = self.setup()
+        operation()                                 # Warm up
+        transfers = spi.transfers
+        bytes_transferred = spi.bytes_transferred
+
+        ops = 0
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        while True:
+            operation()
+            ops += 1
+            wall = time.perf_counter() - wall_start
+            if wall >= min_time and ops >= min_ops:
+                break
+        cpu = time.process_time() - cpu_start
+
+        return {
+            'ops': ops,
+            'ops_per_sec': ops / wall,
+            'wall_time_per_op': wall / ops,
+            'cpu_time_per_op': cpu / ops,
+            'spi_transfers_per_op': (spi.transfers - transfers) / ops,
+            'spi_bytes_per_op': (spi.bytes_transferred - bytes_transferred) / ops,
+        }
+
+
+def _reqa_empty_field():
+    rfid, spi = create_reader([])
+    return rfid.picc_is_new_card_present, spi
+
+
+def _select(uid):
+    def setup():
+        rfid, spi = create_reader([SimulatedPicc(uid)])
+
+        def operation():
+            rfid.picc_is_card_present()             # WUPA
+            status, __ = rfid.picc_select()
+            assert status == StatusCode.STATUS_OK, status
+            rfid.picc_halt_a()
+        return operation, spi
+    return setup
+
+
+def _read(sak):
+    def setup():
+        simple, spi = create_simple_reader([SimulatedPicc(UID4, sak=sak)])
+
+        def operation():
+            status, __, __ = simple.read_bytes(terminal_byte=None)
+            assert status == StatusCode.STATUS_OK, status
+        return operation, spi
+    return setup
+
+
+def _write(sak, size):
+    def setup():
+        simple, spi = create_simple_reader([SimulatedPicc(UID4, sak=sak)])
+        data = [n & 0xFF for n in range(size)]
+
+        def operation():
+            status, __, __ = simple.write_bytes(data, terminal_byte=None, read_old_data=False, single_pass=True)
+            assert status == StatusCode.STATUS_OK, status
+        return operation, spi
+    return setup
+
+
+def _value_transaction():
+    picc = SimulatedPicc(UID4)
+    picc.memory[VALUE_BLOCK] = value_block(0, VALUE_BLOCK)
+    simple, spi = create_simple_reader([picc])
+
+    def operation():
+        status, __, __ = simple.value_transaction(VALUE_BLOCK, 1)
+        assert status == StatusCode.STATUS_OK, status
+    return operation, spi
+
+
+def _crc():
+    rfid, spi = create_reader([])
+    data = list(range(16))
+    return lambda: rfid.pcd_calulate_crc(data), spi
+
+
+BENCHMARKS = [
+    Benchmark('reqa_empty_field', 'picc_is_new_card_present without PICC (REQA poll rate)', _reqa_empty_field),
+    Benchmark('select_uid4', 'WUPA + picc_select + HLTA, 4 byte UID', _select(UID4)),
+    Benchmark('select_uid7', 'WUPA + picc_select + HLTA, 7 byte UID', _select(UID7)),
+    Benchmark('select_uid10', 'WUPA + picc_select + HLTA, 10 byte UID', _select(UID10)),
+    Benchmark('read_1k', 'SimpleMFRC522.read_bytes of a MIFARE 1K (all sectors)', _read(0x08)),
+    Benchmark('read_4k', 'SimpleMFRC522.read_bytes of a MIFARE 4K (all sectors)', _read(0x18)),
+    Benchmark('write_1k', 'SimpleMFRC522.write_bytes (single pass, key A) of 752 bytes to a MIFARE 1K', _write(0x08, 752)),
+    Benchmark('write_4k', 'SimpleMFRC522.write_bytes (single pass, key A) of 3440 bytes to a MIFARE 4K', _write(0x18, 3440)),
+    Benchmark('value_transaction', 'SimpleMFRC522.value_transaction (increment, transfer, read back)', _value_transaction),
+    Benchmark('crc', 'pcd_calulate_crc of 16 bytes', _crc),
+]
+
+
+class CountingTransport(object):
+    '''
+    Wraps a SPI transport and counts the transfers like SimulatedSpi does
+    '''
+
+    def __init__(self, spi):
+        self.spi = spi
+        self.transfers = 0
+        self.bytes_transferred = 0
+
+    def open(self, bus, device):
+        self.spi.open(bus, device)
+
+    def close(self):
+        self.spi.close()
+
+    def xfer2(self, data):
+        self.transfers += 1
+        self.bytes_transferred += len(data)
+        return self.spi.xfer2(data)
+
+
+def trace_benchmark(path):
+    '''
+    Benchmark replaying a recorded session (see BinaryTracer): one operation polls for a PICC and reads its serial,
+    the recording is restarted when it is consumed.
+    '''
+    records = ReplayTransport.from_file(path).records
+
+    def setup():
+        transport = CountingTransport(ReplayTransport(records))
+        rfid = MFRC522(pin_reset=0, pin_irq=0, spi=transport)
+
+        def operation():
+            if transport.spi.finished:
+                transport.spi = ReplayTransport(records)
+            if rfid.picc_is_new_card_present():
+                rfid.picc_read_card_serial()
+        return operation, transport
+    return Benchmark('replay', 'Replay of {}'.format(path), setup)
+
+
+def run_benchmarks(benchmarks, min_time=1.0):
+    '''
+    @return: dict with the environment and the results of the benchmarks (name -> dict)
+    '''
+    return {
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'min_time': min_time,
+        'results': {benchmark.name: benchmark.run(min_time) for benchmark in benchmarks},
+    }
+
+
+def format_results(results, baseline=None):
+    '''
+    @return: The results as table, with the change of ops/sec against the baseline results (if given)
+    '''
+    lines = ['{:<20} {:>12} {:>14} {:>14} {:>12}{}'.format('benchmark', 'ops/sec', 'cpu us/op', 'transfers/op', 'bytes/op', '  vs. baseline' if baseline else '')]
+    for name, result in results['results'].items():
+        line = '{:<20} {:>12.1f} {:>14.1f} {:>14.1f} {:>12.1f}'.format(
+            name, result['ops_per_sec'], result['cpu_time_per_op'] * 1e6, result['spi_transfers_per_op'], result['spi_bytes_per_op'])
+        old = baseline['results'].get(name) if baseline else None
+        if old:
+            line += '  {:+.1%} ops/sec, {:+.1f} transfers/op'.format(result['ops_per_sec'] / old['ops_per_sec'] - 1,
+                                                                    result['spi_transfers_per_op'] - old['spi_transfers_per_op'])
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of the MFRC522 driver hot paths (simulated transport)')
+    parser.add_argument('names', nargs='*', help='Benchmarks to run (default: all): {}'.format(', '.join(b.name for b in BENCHMARKS)))
+    parser.add_argument('--min-time', type=float, default=1.0, help='Minimum run time of each benchmark in seconds (default: %(default)s)')
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--trace', help='Also replay this recorded session (BinaryTracer file)')
+    args = parser.parse_args(argv)
+
+    benchmarks = [b for b in BENCHMARKS if not args.names or b.name in args.names]
+    if args.trace:
+        benchmarks.append(trace_benchmark(args.trace))
+    results = run_benchmarks(benchmarks, args.min_time)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print(format_results(results, baseline))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,314 @@
+'''
+Soak runner measuring throughput and tail latency of the driver under injected faults (SimulatedSpi + FaultInjector).
+
+Each workload runs for the given duration without faults (baseline), with each fault type alone and with
+all faults together. A failed attempt is retried up to max attempts times, the latency of an operation is the
+time until it succeeded (or finally failed), so it includes the retries.
+
+Usage:
+    python -m benchmarks.soak --duration 3600                           # One hour per workload and fault profile
+    python -m benchmarks.soak --duration 60 --json soak.json read_bytes
+    python -m benchmarks.soak --rate crc_error=0.05 --rate dead_spi=0    # Change the fault rates
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import argparse
+import collections
+import json
+import logging
+import sys
+import time
+
+from mfrc522 import (
+    ReaderService,
+    StatusCode,
+    SimulatedPicc,
+    FaultInjector,
+    FaultType
+)
+from .hot_paths import (
+    UID4,
+    create_reader,
+    create_simple_reader
+)
+
+
+# Default probability of each fault per frame (per SPI transfer for DEAD_SPI)
+DEFAULT_RATES = {
+    FaultType.PARITY_ERROR: 0.01,
+    FaultType.CRC_ERROR: 0.01,
+    FaultType.TIMEOUT: 0.01,
+    FaultType.COLLISION: 0.01,
+    FaultType.CARD_REMOVAL: 0.002,
+    FaultType.DEAD_SPI: 0.0002,
+}
+
+INVENTORY_UIDS = [[0x11, 0x22, 0x33, 0x44], [0x55, 0x66, 0x77, 0x88], [0x04, 0x11, 0x22, 0x33, 0x44, 0x55, 0x66]]
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class ReadBytesWorkload(object):
+    '''
+    SimpleMFRC522.read_bytes of a MIFARE 1K, the data is verified
+    '''
+
+    name = 'read_bytes'
+
+    def __init__(self, faults):
+        self.data = [n & 0xFF for n in range(752)]
+        self.simple, self.spi = create_simple_reader([SimulatedPicc(UID4)], faults)
+        self.simple.write_bytes(self.data, terminal_byte=None, read_old_data=False, single_pass=True)
+
+    def rfid(self):
+        return self.simple.rfid
+
+    def attempt(self):
+        status, __, data = self.simple.read_bytes(terminal_byte=None)
+        if status == StatusCode.STATUS_OK and data != self.data:
+            return StatusCode.STATUS_INVALID                    # Corrupted data
+        return status
+
+    def verify(self):
+        return self.attempt() == StatusCode.STATUS_OK
+
+    def close(self):
+        pass
+
+
+class WriteBytesWorkload(object):
+    '''
+    SimpleMFRC522.write_bytes (single pass) of a MIFARE 1K, alternating between two payloads.
+    A failed write leaves the old and the new payload mixed, only a successful last write is verified.
+    '''
+
+    name = 'write_bytes'
+
+    def __init__(self, faults):
+        self.payloads = [[n & 0xFF for n in range(752)], [~n & 0xFF for n in range(752)]]
+        self.writes = 0
+        self.written = None
+        self.simple, self.spi = create_simple_reader([SimulatedPicc(UID4)], faults)
+
+    def rfid(self):
+        return self.simple.rfid
+
+    def attempt(self):
+        payload = self.payloads[self.writes % 2]
+        self.writes += 1
+        status, __, __ = self.simple.write_bytes(payload, terminal_byte=None, read_old_data=False, single_pass=True)
+        self.written = payload if status == StatusCode.STATUS_OK else None
+        return status
+
+    def verify(self):
+        if self.written is None:
+            return True
+        status, __, data = self.simple.read_bytes(terminal_byte=None)
+        return status == StatusCode.STATUS_OK and data == self.written
+
+    def close(self):
+        pass
+
+
+class InventoryWorkload(object):
+    '''
+    ReaderService.inventory of three PICCs (4 and 7 byte UIDs), all PICCs must be found
+    '''
+
+    name = 'inventory'
+
+    def __init__(self, faults):
+        rfid, self.spi = create_reader([SimulatedPicc(uid) for uid in INVENTORY_UIDS], faults)
+        self.service = ReaderService(rfid, init=False)
+        self.service.start()
+
+    def rfid(self):
+        return self.service.rfid
+
+    def attempt(self):
+        for picc in self.spi.piccs:                             # The PICCs enter the field again
+            picc.power_on()
+        uids = self.service.inventory().result()
+        if len(uids) != len(INVENTORY_UIDS):
+            return StatusCode.STATUS_TIMEOUT
+        return StatusCode.STATUS_OK
+
+    def verify(self):
+        return self.attempt() == StatusCode.STATUS_OK
+
+    def close(self):
+        self.service.stop()
+
+
+WORKLOADS = [ReadBytesWorkload, WriteBytesWorkload, InventoryWorkload]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def soak(workload_class, rates, duration, max_attempts=5, seed=None):
+    '''
+    Runs a workload under the given fault rates
+
+    @param workload_class: One of the WORKLOADS
+    @param rates: dict FaultType -> rate (empty for the baseline)
+    @param duration: Duration in seconds
+    @param max_attempts: Maximum number of attempts of an operation (default = 5)
+    @param seed: Seed of the FaultInjector
+    @return: dict with operation, attempt and status counters, throughput, latency percentiles, driver error counters and injected faults
+    '''
+    faults = FaultInjector(rates, seed=seed)
+    faults.enabled = False                                      # Not while preparing the PICC
+    workload = workload_class(faults)
+    try:
+        rfid = workload.rfid()
+        rfid.metrics.reset()
+        transfers = workload.spi.transfers
+        faults.enabled = True
+
+        latencies = []
+        statuses = collections.Counter()
+        succeeded = failed = attempts = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            op_start = time.perf_counter()
+            for __ in range(max_attempts):
+                attempts += 1
+                status = workload.attempt()
+                statuses[status.name] += 1
+                if status == StatusCode.STATUS_OK:
+                    succeeded += 1
+                    break
+            else:
+                failed += 1
+            latencies.append(time.perf_counter() - op_start)
+        elapsed = time.perf_counter() - start
+
+        faults.enabled = False
+        faults.restore(workload.spi)
+        transfers = workload.spi.transfers - transfers
+        verified = workload.verify()
+    finally:
+        workload.close()
+
+    latencies.sort()
+    operations = succeeded + failed
+    metrics = rfid.metrics
+    return {
+        'operations': operations,
+        'succeeded': succeeded,
+        'failed': failed,
+        'attempts': attempts,
+        'retries': attempts - operations,
+        'statuses': dict(statuses),
+        'ops_per_sec': succeeded / elapsed,
+        'spi_transfers_per_op': transfers / operations if operations else None,
+        'latency': dict({'p{:g}'.format(p): percentile(latencies, p) for p in PERCENTILES}, max=latencies[-1] if latencies else None),
+        'driver_errors': {
+            'timeouts': metrics.timeouts,
+            'protocol_errors': metrics.protocol_errors,
+            'collisions': metrics.collisions,
+            'crc_errors': metrics.crc_errors,
+            'nacks': metrics.nacks,
+        },
+        'injected': {fault.value: count for fault, count in faults.injected.items() if count},
+        'verified': verified,
+    }
+
+
+def fault_profiles(rates):
+    '''
+    @return: List of (name, rates) - the baseline, each fault alone and all faults together
+    '''
+    profiles = [('baseline', {})]
+    profiles.extend((fault.value, {fault: rate}) for fault, rate in rates.items() if rate)
+    profiles.append(('all', {fault: rate for fault, rate in rates.items() if rate}))
+    return profiles
+
+
+def format_results(results):
+    '''
+    @return: Table with throughput, success rate and tail latency of each workload and fault profile, relative to the baseline
+    '''
+    lines = ['{:<12} {:<14} {:>9} {:>9} {:>8} {:>10} {:>10} {:>10} {:>9} {:>9}'.format(
+        'workload', 'faults', 'ops/sec', 'vs. base', 'success', 'p50 ms', 'p99 ms', 'max ms', 'p99 x', 'retries')]
+    for workload, profiles in results['results'].items():
+        baseline = profiles.get('baseline')
+        for profile, result in profiles.items():
+            latency = result['latency']
+            throughput = p99 = ''
+            if baseline and baseline['ops_per_sec'] and baseline['latency']['p99']:
+                throughput = '{:+.1%}'.format(result['ops_per_sec'] / baseline['ops_per_sec'] - 1)
+                p99 = '{:.2f}'.format(latency['p99'] / baseline['latency']['p99']) if latency['p99'] is not None else ''
+            lines.append('{:<12} {:<14} {:>9.1f} {:>9} {:>8.2%} {:>10.2f} {:>10.2f} {:>10.2f} {:>9} {:>9}{}'.format(
+                workload, profile, result['ops_per_sec'], throughput,
+                result['succeeded'] / result['operations'] if result['operations'] else 0,
+                (latency['p50'] or 0) * 1e3, (latency['p99'] or 0) * 1e3, (latency['max'] or 0) * 1e3, p99, result['retries'],
+                '' if result['verified'] else '  VERIFICATION FAILED'))
+    return '\n'.join(lines)
+
+
+def parse_rate(value):
+    fault, __, rate = value.partition('=')
+    return FaultType(fault), float(rate)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Soak test of the MFRC522 driver under injected faults (simulated transport)')
+    parser.add_argument('workloads', nargs='*', help='Workloads to run (default: all): {}'.format(', '.join(w.name for w in WORKLOADS)))
+    parser.add_argument('--duration', type=float, default=10.0, help='Duration of each workload and fault profile in seconds (default: %(default)s)')
+    parser.add_argument('--rate', type=parse_rate, action='append', default=[], metavar='FAULT=RATE',
+                        help='Fault rate, faults: {}'.format(', '.join(f.value for f in FaultType)))
+    parser.add_argument('--max-attempts', type=int, default=5, help='Maximum number of attempts of an operation (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the fault injection (default: %(default)s)')
+    parser.add_argument('--json', help='Write the results to this JSON file')
+    parser.add_argument('--verbose', action='store_true', help='Show the warnings of the driver')
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.getLogger('mfrc522').addHandler(logging.NullHandler())
+    rates = dict(DEFAULT_RATES)
+    rates.update(args.rate)
+
+    results = {
+        'timestamp': time.time(),
+        'duration': args.duration,
+        'max_attempts': args.max_attempts,
+        'seed': args.seed,
+        'rates': {fault.value: rate for fault, rate in rates.items()},
+        'results': {},
+    }
+    for workload_class in WORKLOADS:
+        if args.workloads and workload_class.name not in args.workloads:
+            continue
+        profiles = results['results'][workload_class.name] = {}
+        for profile, profile_rates in fault_profiles(rates):
+            print('{} / {} ...'.format(workload_class.name, profile), file=sys.stderr)
+            profiles[profile] = soak(workload_class, profile_rates, args.duration, args.max_attempts, args.seed)
+
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import logging
+import signal
+import sys
+
+from mfrc522 import MFRC522, LowPowerDetector, StatusCode
+
+
+logging.basicConfig(level=logging.INFO)
+run = True
+
+def end(signal, frame):
+    global run
+    print('Ctrl+C captured, ending example program.')
+    run = False
+    sys.exit()
+
+signal.signal(signal.SIGINT, end)
+
+
+def setup(rfid):
+    rfid.pcd_init()                     # Init MFRC522
+    rfid.pcd_dump_version_to_serial()   # Show details of PCD - MFRC522 Card Reader details
+    print('Scan PICC to see UID...')
+    print('(Press CTRL+C to quit)')
+
+def loop(rfid, detector):
+    # The MFRC522 sleeps in soft power down between two short REQA probes
+    if not detector.wait_for_card(timeout=5.0):
+        print(detector.get_stats())
+        return
+    status, uid = rfid.picc_select()
+    if status != StatusCode.STATUS_OK:
+        return
+    print('Card UID: {} (detected within {:.0f}ms)'.format(uid, (detector.last_detection_latency or 0) * 1000))
+    rfid.picc_halt_a()                  # A halted PICC does not answer the REQA probes
+
+
+rfid = MFRC522()
+detector = LowPowerDetector(rfid, duty_cycle=0.01, max_interval=0.3)
+try:
+    setup(rfid)
+    while run:
+        loop(rfid, detector)
+
+finally:
+    detector.power_up()
+    rfid.pcd_cleanup()
@@ -9,11 +9,117 @@ from .mfrc522 import (
     StatusCode,
     Uid,
     MIFARE_Key,
+    RegisterSnapshot,
 )
 
 from .simple_mfrc522 import SimpleMFRC522
 
+from .reader_service import (
+    ReaderService,
+    PRIORITY_HIGH,
+    PRIORITY_NORMAL,
+    PRIORITY_LOW,
+)
+
+from .multi_reader import (
+    ReaderManager,
+    ManagedReader,
+)
+
+from .simulator import (
+    SimulatedSpi,
+    SimulatedPicc,
+)
+
+from .faults import (
+    FaultInjector,
+    FaultType,
+)
+
+from .events import (
+    CardEvent,
+    CardEventType,
+)
+
+from .presence import (
+    PresenceTracker,
+    PresenceState,
+    KeepAlive,
+)
+
+from .health import (
+    HealthWatchdog,
+    HealthState,
+    RecoveryStep,
+)
+
+from .low_power import LowPowerDetector
+
+from .metrics import (
+    ReaderMetrics,
+    LatencyHistogram,
+)
+
+from .trace import (
+    Tracer,
+    MemoryTracer,
+    BinaryTracer,
+    LoggingTracer,
+    TraceRecord,
+    TraceDirection,
+    read_trace,
+    format_record,
+)
+
+from .flight_recorder import FlightRecorder
+
+from .replay import (
+    ReplayTransport,
+    ReplayError,
+)
+
+from .dedupe import DedupeCache
+
+from .content_cache import ContentCache
+
+from .access_bits import (
+    AccessOperation,
+    SectorTrailer,
+    AuthPlanner,
+    decode_access_bits,
+    encode_access_bits,
+)
+
 from .utils import (
     FormatString,
     format_hex
-)
\ No newline at end of file
+)
+
+import importlib
+
+# The service modules import asyncio, socketserver, http.server and multiprocessing, they are only
+# imported when one of their classes is used (import mfrc522 stays fast on small boards)
+_LAZY = {
+    'AsyncMFRC522': 'async_mfrc522',
+    'AsyncSimpleMFRC522': 'async_mfrc522',
+    'ReaderDaemon': 'daemon',
+    'ReaderClient': 'client',
+    'ReaderClientPool': 'client',
+    'FleetSupervisor': 'fleet',
+    'FleetEvent': 'fleet',
+    'EventRing': 'fleet',
+    'MetricsExporter': 'prometheus',
+}
+
+
+def __getattr__(name):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
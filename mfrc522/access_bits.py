@@ -0,0 +1,382 @@
+'''
+Codec for the sector trailer of MIFARE Classic PICCs and a planner that chooses the key to authenticate with.
+
+See http://www.mouser.com/ds/2/302/MF1S503x-89574.pdf sections 8.6 and 8.7 for the memory organisation and
+the access conditions.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import logging
+from enum import Enum
+
+from .utils import format_hex
+from .utils import FormatString as _F
+from .mfrc522 import (
+    PICC_Command,
+    StatusCode
+)
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+
+class AccessOperation(Enum):
+    '''
+    Operations on a block of a MIFARE Classic PICC that are controlled by the access conditions.
+    '''
+
+    READ                     = 0
+    WRITE                    = 1
+    INCREMENT                = 2
+    DECREMENT                = 3    # Also covers TRANSFER and RESTORE
+
+
+# Keys allowed for an operation
+_NEVER  = 0
+_KEY_A  = 1
+_KEY_B  = 2
+_KEY_AB = 3
+
+# Access conditions for data blocks (MF1S503x section 8.7.2, table 8)
+# [C1 C2 C3]: (read, write, increment, decrement/transfer/restore)
+DATA_BLOCK_ACCESS_CONDITIONS = {
+    0b000: (_KEY_AB, _KEY_AB, _KEY_AB, _KEY_AB),        # transport configuration
+    0b010: (_KEY_AB, _NEVER,  _NEVER,  _NEVER),         # read/write block
+    0b100: (_KEY_AB, _KEY_B,  _NEVER,  _NEVER),         # read/write block
+    0b110: (_KEY_AB, _KEY_B,  _KEY_B,  _KEY_AB),        # value block
+    0b001: (_KEY_AB, _NEVER,  _NEVER,  _KEY_AB),        # value block
+    0b011: (_KEY_B,  _KEY_B,  _NEVER,  _NEVER),         # read/write block
+    0b101: (_KEY_B,  _NEVER,  _NEVER,  _NEVER),         # read/write block
+    0b111: (_NEVER,  _NEVER,  _NEVER,  _NEVER),         # read/write block
+}
+
+# Access conditions for the sector trailer (MF1S503x section 8.7.1, table 7)
+# [C1 C2 C3]: (write key A, read access bits, write access bits, read key B, write key B)
+SECTOR_TRAILER_ACCESS_CONDITIONS = {
+    0b000: (_KEY_A,  _KEY_A,  _NEVER,  _KEY_A,  _KEY_A),    # key B may be read
+    0b010: (_NEVER,  _KEY_A,  _NEVER,  _KEY_A,  _NEVER),    # key B may be read
+    0b100: (_KEY_B,  _KEY_AB, _NEVER,  _NEVER,  _KEY_B),
+    0b110: (_NEVER,  _KEY_AB, _NEVER,  _NEVER,  _NEVER),
+    0b001: (_KEY_A,  _KEY_A,  _KEY_A,  _KEY_A,  _KEY_A),    # key B may be read, transport configuration
+    0b011: (_KEY_B,  _KEY_AB, _KEY_B,  _NEVER,  _KEY_B),
+    0b101: (_NEVER,  _KEY_AB, _KEY_B,  _NEVER,  _NEVER),
+    0b111: (_NEVER,  _KEY_AB, _NEVER,  _NEVER,  _NEVER),
+}
+
+
+def decode_access_bits(access_bytes):
+    '''
+    Decodes the access bits (bytes 6-8 of the sector trailer).
+
+    The access bits are stored in a peculiar fashion.
+    There are four groups:
+           g[3]    Access bits for the sector trailer, block 3 (for sectors 0-31) or block 15 (for sectors 32-39)
+           g[2]    Access bits for block 2 (for sectors 0-31) or blocks 10-14 (for sectors 32-39)
+           g[1]    Access bits for block 1 (for sectors 0-31) or blocks 5-9 (for sectors 32-39)
+           g[0]    Access bits for block 0 (for sectors 0-31) or blocks 0-4 (for sectors 32-39)
+    Each group has access bits [C1 C2 C3]. In this code C1 is MSB and C3 is LSB.
+    The four CX bits are stored together in a nible cx and an inverted nible cx_.
+
+    @param access_bytes: The 3 access bytes (bytes 6, 7 and 8 of the sector trailer)
+    @return: (groups, inverted_error) - groups is a list with the access bits [C1 C2 C3] of the four groups,
+             inverted_error is True if one of the inverted nibbles did not match
+    '''
+    c1  = access_bytes[1] >> 4
+    c2  = access_bytes[2] & 0xF
+    c3  = access_bytes[2] >> 4
+    c1_ = access_bytes[0] & 0xF
+    c2_ = access_bytes[0] >> 4
+    c3_ = access_bytes[1] & 0xF
+    inverted_error = (c1 != (~c1_ & 0xF)) or (c2 != (~c2_ & 0xF)) or (c3 != (~c3_ & 0xF))
+
+    g = [0] * 4
+    g[0] = ((c1 & 1) << 2) | ((c2 & 1) << 1) | ((c3 & 1) << 0)
+    g[1] = ((c1 & 2) << 1) | ((c2 & 2) << 0) | ((c3 & 2) >> 1)
+    g[2] = ((c1 & 4) << 0) | ((c2 & 4) >> 1) | ((c3 & 4) >> 2)
+    g[3] = ((c1 & 8) >> 1) | ((c2 & 8) >> 2) | ((c3 & 8) >> 3)
+    return g, inverted_error
+
+def encode_access_bits(groups):
+    '''
+    Calculates the bit pattern needed for the specified access bits. In the [C1 C2 C3] tuples C1 is MSB (=4) and C3 is LSB (=1).
+    Port of MIFARE_SetAccessBits() from the Arduino library.
+
+    @param groups: List with the access bits [C1 C2 C3] of the four groups (see decode_access_bits)
+    @return: The 3 access bytes (bytes 6, 7 and 8 of the sector trailer)
+    '''
+    g0, g1, g2, g3 = groups
+    c1 = ((g3 & 4) << 1) | ((g2 & 4) << 0) | ((g1 & 4) >> 1) | ((g0 & 4) >> 2)
+    c2 = ((g3 & 2) << 2) | ((g2 & 2) << 1) | ((g1 & 2) << 0) | ((g0 & 2) >> 1)
+    c3 = ((g3 & 1) << 3) | ((g2 & 1) << 2) | ((g1 & 1) << 1) | ((g0 & 1) << 0)
+
+    return [((~c2 & 0xF) << 4) | (~c1 & 0xF),
+            (c1 << 4) | (~c3 & 0xF),
+            (c3 << 4) | c2]
+
+def get_block_position(block_addr):
+    '''
+    Returns the sector, the offset of the block inside the sector and the number of blocks of the sector
+    for the given block address.
+
+    @param block_addr: The block (0-0xff) number.
+    @return: (sector, block_offset, no_of_blocks)
+    '''
+    if block_addr < 128:                        # Sectors 0..31 has 4 blocks each
+        return block_addr // 4, block_addr % 4, 4
+    # Sectors 32-39 has 16 blocks each
+    return 32 + (block_addr - 128) // 16, (block_addr - 128) % 16, 16
+
+def get_access_group(block_offset, no_of_blocks):
+    '''
+    Returns the access group (see decode_access_bits) of a block.
+
+    @param block_offset: The offset of the block inside of the sector
+    @param no_of_blocks: Number of blocks in the sector (4 or 16)
+    @return: Access group 0..3, 3 is the sector trailer
+    '''
+    if no_of_blocks == 4:
+        return block_offset
+    if block_offset == 15:
+        return 3
+    return block_offset // 5
+
+
+class SectorTrailer(object):
+    '''
+    Sector trailer of a MIFARE Classic PICC:
+            Bytes 0-5:   Key A
+            Bytes 6-8:   Access Bits
+            Bytes 9:     User data
+            Bytes 10-15: Key B (or user data)
+    Key A is never readable, the PICC returns 0x00 bytes instead. Key B is only readable, if the access conditions
+    of the sector trailer allow it.
+    '''
+
+    def __init__(self, key_a=None, groups=None, user_byte=0x69, key_b=None):
+        '''
+        Create a new sector trailer, defaults to the transport configuration
+
+        @param key_a: List of 6 bytes (default = [0xFF] * 6)
+        @param groups: List with the access bits [C1 C2 C3] of the four groups (default = [0b000, 0b000, 0b000, 0b001])
+        @param user_byte: Value of byte 9 (default = 0x69)
+        @param key_b: List of 6 bytes (default = [0xFF] * 6)
+        '''
+        self.key_a = list(key_a) if key_a is not None else [0xFF] * 6
+        self.groups = list(groups) if groups is not None else [0b000, 0b000, 0b000, 0b001]
+        self.user_byte = user_byte
+        self.key_b = list(key_b) if key_b is not None else [0xFF] * 6
+        self.inverted_error = False
+
+    @classmethod
+    def from_bytes(cls, data):
+        '''
+        Parses the 16 bytes of a sector trailer.
+        Check inverted_error afterwards, the PICC would refuse a sector trailer with a format violation.
+
+        @param data: The data read from the sector trailer block (at least 16 bytes)
+        @return: SectorTrailer
+        '''
+        groups, inverted_error = decode_access_bits(data[6:9])
+        trailer = cls(key_a=data[0:6], groups=groups, user_byte=data[9], key_b=data[10:16])
+        trailer.inverted_error = inverted_error
+        return trailer
+
+    def to_bytes(self):
+        '''
+        Builds the 16 bytes of the sector trailer.
+
+        @return: List of 16 bytes
+        '''
+        return self.key_a[:6] + encode_access_bits(self.groups) + [self.user_byte] + self.key_b[:6]
+
+    def get_access_bits(self, block_offset, no_of_blocks=4):
+        '''
+        Returns the access bits [C1 C2 C3] of the given block.
+
+        @param block_offset: The offset of the block inside of the sector
+        @param no_of_blocks: Number of blocks in the sector (4 or 16)
+        @return: Access bits, C1 is MSB and C3 is LSB
+        '''
+        return self.groups[get_access_group(block_offset, no_of_blocks)]
+
+    def is_key_b_readable(self):
+        '''
+        If key B may be read, it cannot serve for authentication (all data blocks of the sector are then
+        only accessible with key A).
+
+        @return: True if key B can be read from the sector trailer
+        '''
+        return SECTOR_TRAILER_ACCESS_CONDITIONS[self.groups[3]][3] != _NEVER
+
+    def is_value_block(self, block_offset, no_of_blocks=4):
+        '''
+        @return: True if the block is configured as value block (access bits [C1 C2 C3] = [110] or [001])
+        '''
+        if get_access_group(block_offset, no_of_blocks) == 3:
+            return False
+        return self.get_access_bits(block_offset, no_of_blocks) in (0b110, 0b001)
+
+    def get_allowed_keys(self, operation, block_offset, no_of_blocks=4):
+        '''
+        Returns the authentication commands that allow the given operation on a block of this sector.
+
+        For the sector trailer READ means reading the access bits and WRITE means writing the whole trailer
+        (key A, access bits and key B). INCREMENT and DECREMENT are never allowed on the sector trailer.
+
+        @param operation: One of the AccessOperation enums
+        @param block_offset: The offset of the block inside of the sector
+        @param no_of_blocks: Number of blocks in the sector (4 or 16)
+        @return: List of PICC_CMD_MF_AUTH_KEY_A and/or PICC_CMD_MF_AUTH_KEY_B, key A first. Empty if the operation is never allowed.
+        '''
+        if get_access_group(block_offset, no_of_blocks) == 3:
+            conditions = SECTOR_TRAILER_ACCESS_CONDITIONS[self.groups[3]]
+            if operation == AccessOperation.READ:
+                keys = conditions[1]
+            elif operation == AccessOperation.WRITE:
+                keys = conditions[0] & conditions[2] & conditions[4]
+            else:
+                keys = _NEVER
+        else:
+            keys = DATA_BLOCK_ACCESS_CONDITIONS[self.get_access_bits(block_offset, no_of_blocks)][operation.value]
+
+        if self.is_key_b_readable():
+            keys &= _KEY_A
+
+        result = []
+        if keys & _KEY_A:
+            result.append(PICC_Command.PICC_CMD_MF_AUTH_KEY_A)
+        if keys & _KEY_B:
+            result.append(PICC_Command.PICC_CMD_MF_AUTH_KEY_B)
+        return result
+
+    def __str__(self):
+        return '<SectorTrailer: [{}], Access bits: [{}]{}>'.format(
+            format_hex(self.to_bytes()),
+            ' '.join(format(g, '03b') for g in self.groups),
+            ' Inverted access bits did not match!' if self.inverted_error else '')
+
+
+class AuthPlanner(object):
+    '''
+    Decides which key (A or B) is needed for an operation on a block, based on the sector trailers
+    of the PICC. Trying the wrong key type first costs a failed authentication (timeout of 25ms) and
+    requires the PICC to be selected again.
+
+    Sector trailers are cached per sector, call clear() if another PICC is selected.
+    '''
+
+    def __init__(self, preferred_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A):
+        '''
+        Create a new AuthPlanner
+
+        @param preferred_command: Authentication command used if both keys are allowed or if the sector trailer is unknown (default = PICC_CMD_MF_AUTH_KEY_A)
+        '''
+        self.preferred_command = preferred_command
+        self.sector_trailers = {}
+
+    def clear(self):
+        '''
+        Forget all known sector trailers
+        '''
+        self.sector_trailers.clear()
+
+    def set_sector_trailer(self, sector, trailer):
+        '''
+        @param sector: The sector number
+        @param trailer: The SectorTrailer of the sector
+        '''
+        self.sector_trailers[sector] = trailer
+
+    def load_sector_trailer(self, rfid, uid, sector, key, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A):
+        '''
+        Authenticates the sector and reads its sector trailer.
+        The access bits of the sector trailer are readable with key A in all access conditions.
+        The sector stays authenticated with the given key.
+
+        @param rfid: The MFRC522 instance
+        @param uid: UID from the selected PICC
+        @param sector: The sector number
+        @param key: MIFARE_Key for the sector
+        @param auth_command: PICC_CMD_MF_AUTH_KEY_A or PICC_CMD_MF_AUTH_KEY_B (default = PICC_CMD_MF_AUTH_KEY_A)
+        @return: (StatusCode, SectorTrailer)
+        '''
+        first_block, trailer_block, __ = uid.get_picc_type().get_sector_definition(sector)
+        status = rfid.pcd_authenticate(auth_command, trailer_block, key, uid)
+        if status != StatusCode.STATUS_OK:
+            return status, None
+
+        status, data = rfid.mifare_read(trailer_block)
+        if status != StatusCode.STATUS_OK:
+            return status, None
+
+        trailer = SectorTrailer.from_bytes(data[:16])
+        if trailer.inverted_error:
+            logger_debug.warn(_F('Inverted access bits did not match (sector: {}, trailer: {})', sector, trailer))
+            return StatusCode.STATUS_ERROR, trailer
+
+        self.set_sector_trailer(sector, trailer)
+        return StatusCode.STATUS_OK, trailer
+
+    def get_auth_command(self, block_addr, operation):
+        '''
+        Returns the authentication command to use for the operation on the given block.
+
+        @param block_addr: The block (0-0xff) number.
+        @param operation: One of the AccessOperation enums
+        @return: PICC_CMD_MF_AUTH_KEY_A or PICC_CMD_MF_AUTH_KEY_B, None if the operation is never allowed
+        '''
+        sector, block_offset, no_of_blocks = get_block_position(block_addr)
+        trailer = self.sector_trailers.get(sector)
+        if trailer is None:
+            return self.preferred_command
+
+        allowed = trailer.get_allowed_keys(operation, block_offset, no_of_blocks)
+        if not allowed:
+            return None
+        if self.preferred_command in allowed:
+            return self.preferred_command
+        return allowed[0]
+
+    def get_common_auth_command(self, block_addrs, operations):
+        '''
+        Returns an authentication command that allows all given operations on all given blocks of one sector,
+        so that they can be executed in a single authenticated session.
+
+        @param block_addrs: List of block numbers (of the same sector)
+        @param operations: List of AccessOperation enums
+        @return: PICC_CMD_MF_AUTH_KEY_A or PICC_CMD_MF_AUTH_KEY_B, None if no single key allows everything
+        '''
+        return self.get_session_auth_command([(block_addr, operations) for block_addr in block_addrs])
+
+    def get_session_auth_command(self, block_operations):
+        '''
+        Returns an authentication command that allows the given operations of each block of one sector,
+        so that they can be executed in a single authenticated session.
+
+        @param block_operations: List of (block number, list of AccessOperation enums)
+        @return: PICC_CMD_MF_AUTH_KEY_A or PICC_CMD_MF_AUTH_KEY_B, None if no single key allows everything
+        '''
+        candidates = [self.preferred_command] + [c for c in (PICC_Command.PICC_CMD_MF_AUTH_KEY_A, PICC_Command.PICC_CMD_MF_AUTH_KEY_B) if c != self.preferred_command]
+        for block_addr, operations in block_operations:
+            sector, block_offset, no_of_blocks = get_block_position(block_addr)
+            trailer = self.sector_trailers.get(sector)
+            if trailer is None:
+                continue
+            for operation in operations:
+                allowed = trailer.get_allowed_keys(operation, block_offset, no_of_blocks)
+                candidates = [c for c in candidates if c in allowed]
+        return candidates[0] if candidates else None
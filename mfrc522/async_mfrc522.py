@@ -0,0 +1,341 @@
+'''
+asyncio interface to the NFC reader Module MFRC522 on the Raspberry Pi.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import FormatString as _F
+from .mfrc522 import (
+    MFRC522,
+    StatusCode
+)
+from .simple_mfrc522 import SimpleMFRC522
+from .presence import (
+    PresenceTracker,
+    PresenceState
+)
+from .events import CardEventType
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+
+def get_shared_executor():
+    '''
+    @return: The single thread executor shared by all AsyncMFRC522 instances without an own executor
+    '''
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mfrc522-async')
+        return _shared_executor
+
+
+class AsyncMFRC522(object):
+    '''
+    Runs the operations of a MFRC522 from an asyncio event loop.
+
+    Operations wait for the PICC (e. g. a timeout of 25ms), therefore they never run on the event loop thread:
+    by default all instances share one worker thread (see get_shared_executor), that way readers on the same
+    SPI bus are never accessed concurrently and no thread per reader is needed. Pass an executor to use an own
+    thread (pool) instead.
+
+    IRQ edges are delivered to the event loop with call_soon_threadsafe and can be awaited with wait_for_irq().
+    '''
+
+    def __init__(self, rfid=None, executor=None, **kwargs):
+        '''
+        Create a new AsyncMFRC522 instance
+
+        @param rfid: Optional MFRC522 instance, if not given a new instance is created with the given keyword arguments
+        @param executor: Optional concurrent.futures.Executor used to run the blocking operations (default = None, the shared single thread executor)
+        '''
+        self.rfid = rfid if rfid else MFRC522(**kwargs)
+        self.executor = executor if executor else get_shared_executor()
+        self.loop = None
+        self.irq = None
+
+    async def init(self):
+        '''
+        Initializes the MFRC522 and registers the IRQ callback (if the IRQ pin is connected).
+        Must be called from the event loop that uses this instance.
+        '''
+        self.loop = asyncio.get_running_loop()
+        self.irq = asyncio.Event()
+        await self.run(self.rfid.pcd_init)
+        if self.rfid.pin_irq != 0:
+            self.rfid.gpio.add_event_detect(self.rfid.pin_irq, self.rfid.gpio.FALLING, callback=self._interrupt_callback)
+
+    def cleanup(self):
+        if self.rfid.pin_irq != 0 and self.rfid.gpio is not None:         # GPIO is set up by init()
+            self.rfid.gpio.remove_event_detect(self.rfid.pin_irq)
+        self.rfid.pcd_cleanup()
+
+    async def run(self, func, *args, **kwargs):
+        '''
+        Executes the given (blocking) function in the executor.
+
+        @return: The result of the function
+        '''
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def __getattr__(self, name):
+        '''
+        All public methods of MFRC522 are available as coroutines, e. g.
+        >>> status, uid = await reader.picc_select()
+        '''
+        if name == 'rfid':
+            raise AttributeError(name)
+        attr = getattr(self.rfid, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        async def wrapper(*args, **kwargs):
+            return await self.run(attr, *args, **kwargs)
+        return wrapper
+
+    async def wait_for_irq(self, timeout=None):
+        '''
+        Waits for a falling edge on the IRQ pin.
+
+        @param timeout: Timeout in seconds (default = None, wait forever)
+        @return: True if an IRQ was received, False on timeout
+        '''
+        try:
+            await asyncio.wait_for(self.irq.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.irq.clear()
+        return True
+
+    def clear_irq(self):
+        if self.irq:
+            self.irq.clear()
+
+    def _interrupt_callback(self, __):
+        # Called from the RPi.GPIO thread
+        self.rfid.trace_irq()
+        self.loop.call_soon_threadsafe(self.irq.set)
+
+
+class AsyncSimpleMFRC522(object):
+    '''
+    asyncio version of SimpleMFRC522.
+
+    Example:
+    >>> reader = AsyncSimpleMFRC522()
+    >>> await reader.init()
+    >>> async for event in reader.cards():
+    >>>     print(event)
+    '''
+
+    def __init__(self, bus=0, device=0, speed=1000000, pin_reset=25, pin_ce=0, pin_irq=24, pin_mode=None, executor=None, dedupe=None, content_cache=None):
+        '''
+        Create a new AsyncSimpleMFRC522 instance
+
+        @param bus: The SPI bus (default = 0)
+        @param device: The SPI device (default = 0)
+        @param speed: The max speed in Hz for the SPI device (default = 1000000)
+        @param pin_reset: The GPIO reset pin number (default = 25)
+        @param pin_ce: The GPIO chip select pin number (default = 0, not connected)
+        @param pin_irq: The GPIO IRQ pin number (default = 24, 0 if not connected - then the PICC is polled)
+        @param pin_mode: GPIO pin numbering mode (default = None, GPIO.BCM)
+        @param executor: Optional concurrent.futures.Executor used to run the blocking operations (default = None, the shared single thread executor)
+        @param dedupe: Optional DedupeCache, a PICC seen again within its ttl is ignored by read_bytes and read_text (see SimpleMFRC522)
+        @param content_cache: Optional ContentCache used by read_bytes (see SimpleMFRC522)
+        '''
+        self.simple = SimpleMFRC522(bus=bus, device=device, speed=speed, pin_reset=pin_reset, pin_ce=pin_ce, pin_irq=pin_irq, pin_mode=pin_mode, dedupe=dedupe,
+                                    content_cache=content_cache)
+        self.reader = AsyncMFRC522(rfid=self.simple.rfid, executor=executor)
+        self.rfid = self.simple.rfid
+        self.poll_interval = 0.1
+
+    async def init(self):
+        await self.reader.init()
+
+    def cleanup(self):
+        self.reader.cleanup()
+        if self.simple.content_cache is not None:
+            self.simple.content_cache.close()
+
+    async def wait_for_interrupt(self, timeout=None):
+        '''
+        Waits until an interrupt is detected (PICC found). If the IRQ pin is not connected, the PICC is polled with REQA.
+        The reception is re-armed every 100ms while waiting.
+
+        @param timeout: Timeout in seconds (default = None, wait forever)
+        @return: True if a card is present, False on timeout
+        '''
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        try:
+            while True:
+                wait = self.poll_interval
+                if deadline is not None:
+                    wait = min(wait, deadline - loop.time())
+                    if wait <= 0:
+                        return False
+
+                if self.rfid.pin_irq == 0:
+                    if await self.reader.run(self.rfid.picc_is_new_card_present):
+                        return True
+                    await asyncio.sleep(wait)
+                else:
+                    # The receiving block needs regular retriggering (tell the tag it should transmit??)
+                    await self.reader.run(self.simple._activate_reception)
+                    if await self.reader.wait_for_irq(wait):
+                        return True
+        finally:
+            if self.rfid.pin_irq != 0:
+                await self.reader.run(self.simple._clear_interrupt)
+            self.reader.clear_irq()
+
+    async def wait_for_card(self, mifare_classic=True, dedupe=False):
+        '''
+        Waits until a card is present and selects it. Other PICCs are halted.
+
+        @param mifare_classic: Only accept MIFARE Classic PICCs (default = True)
+        @param dedupe: Ignore PICCs reported as duplicate by the DedupeCache (default = False)
+        @return: Uid of the selected PICC
+        '''
+        while True:
+            await self.wait_for_interrupt()
+            status, uid = await self.reader.run(self.rfid.picc_read_card_serial)
+            if not status:
+                continue
+            if dedupe and self.simple.dedupe is not None and self.simple.dedupe.is_duplicate(uid):
+                logger_debug.debug(_F('Duplicate PICC ignored (uid: {})', uid))
+                await self.reader.run(self.rfid.picc_halt_a)
+                continue
+            if not mifare_classic or uid.get_picc_type().is_mifare_classic():
+                self.simple.last_uid = uid
+                return uid
+            logger_debug.warn(_F('Unsupported PICC type (type: {}, uid: {})', uid.get_picc_type(), uid))
+            await self.reader.run(self.rfid.picc_halt_a)
+
+    async def cards(self, removed_events=True, removal_latency=0.2, miss_threshold=3, dedupe=None):
+        '''
+        Asynchronous generator of CardEvents. An ARRIVED event is yielded when a PICC is selected and (optionally)
+        a REMOVED event when it leaves the field (see PresenceTracker).
+        While no PICC is present the IRQ is awaited (or REQA is polled if the IRQ pin is not connected).
+
+        >>> async for event in reader.cards():
+        >>>     print(event)
+
+        @param removed_events: Also yield REMOVED events (default = True)
+        @param removal_latency: Target latency in seconds for detecting the removal (default = 0.2)
+        @param miss_threshold: Number of consecutive failed probes before the PICC is reported as removed (default = 3)
+        @param dedupe: Optional DedupeCache, the events of a PICC seen again within its ttl are suppressed (default = the DedupeCache of this reader)
+        '''
+        tracker = PresenceTracker(self.rfid, removal_latency=removal_latency, miss_threshold=miss_threshold,
+                                  dedupe=dedupe if dedupe is not None else self.simple.dedupe)
+        while True:
+            if tracker.state == PresenceState.ABSENT:
+                await self.wait_for_interrupt()
+            else:
+                await asyncio.sleep(tracker.next_poll_delay())
+
+            for event in await self.reader.run(tracker.poll):
+                if event.event_type == CardEventType.REMOVED and not removed_events:
+                    continue
+                yield event
+
+    async def read_text(self, terminal_byte=0x00, encoding='UTF-8', errors='ignore', timeout=None):
+        '''
+        See SimpleMFRC522.read_text
+
+        @param timeout: Timeout in seconds for waiting for a card (default = None, wait forever)
+        @return: (StatusCode, Uid, Text) - STATUS_TIMEOUT if no card was presented in time
+        '''
+        status, uid, data = await self.read_bytes(terminal_byte=terminal_byte, timeout=timeout)
+        if status != StatusCode.STATUS_OK:
+            return status, uid, None
+        return StatusCode.STATUS_OK, uid, bytearray(data).decode(encoding=encoding, errors=errors)
+
+    async def read_bytes(self, terminal_byte=0x00, timeout=None):
+        '''
+        See SimpleMFRC522.read_bytes
+
+        @param terminal_byte: Byte value that indicates end of data (default = 0x00), set to None if all data should be returned
+        @param timeout: Timeout in seconds for waiting for a card (default = None, wait forever)
+        @return: (StatusCode, Uid, data) - STATUS_TIMEOUT if no card was presented in time
+        '''
+        try:
+            uid = await asyncio.wait_for(self.wait_for_card(dedupe=True), timeout)
+        except asyncio.TimeoutError:
+            return StatusCode.STATUS_TIMEOUT, None, None
+
+        status, data = await self.reader.run(self.simple._read_cached_mifare_classic, uid, terminal_byte=terminal_byte)
+        await self.reader.run(self._halt)
+        if status != StatusCode.STATUS_OK:
+            return status, uid, None
+        return status, uid, data
+
+    async def write_text(self, text, terminal_byte=0x00, encoding='UTF-8', errors='ignore', read_old_data=True, single_pass=False, timeout=None):
+        '''
+        See SimpleMFRC522.write_text
+
+        @param timeout: Timeout in seconds for waiting for a card (default = None, wait forever)
+        @return: (StatusCode, Uid, text) - STATUS_TIMEOUT if no card was presented in time
+        '''
+        data = list(bytearray(text, encoding=encoding))
+        status, uid, old_data = await self.write_bytes(data, terminal_byte=terminal_byte, read_old_data=read_old_data, single_pass=single_pass, timeout=timeout)
+        if status != StatusCode.STATUS_OK or old_data is None:
+            return status, uid, None
+        return StatusCode.STATUS_OK, uid, bytearray(old_data).decode(encoding=encoding, errors=errors)
+
+    async def write_bytes(self, data, terminal_byte=0x00, read_old_data=True, single_pass=False, timeout=None):
+        '''
+        See SimpleMFRC522.write_bytes
+
+        @param timeout: Timeout in seconds for waiting for a card (default = None, wait forever)
+        @return: (StatusCode, Uid, old_data) - STATUS_TIMEOUT if no card was presented in time
+        '''
+        try:
+            uid = await asyncio.wait_for(self.wait_for_card(), timeout)
+        except asyncio.TimeoutError:
+            return StatusCode.STATUS_TIMEOUT, None, None
+
+        old_data = None
+        if single_pass:
+            status, old_data = await self.reader.run(self.simple._read_write_mifare_classic, uid, data, terminal_byte=terminal_byte, read_old_data=read_old_data)
+        else:
+            status = StatusCode.STATUS_OK
+            if read_old_data:
+                status, old_data = await self.reader.run(self.simple._read_mifare_classic, uid, terminal_byte=terminal_byte)
+            if status == StatusCode.STATUS_OK:
+                status = await self.reader.run(self.simple._write_mifare_classic, uid, data, terminal_byte=terminal_byte)
+        self.simple._forget_cached_content(uid)
+        await self.reader.run(self._halt)
+
+        if status != StatusCode.STATUS_OK:
+            return status, uid, None
+        return status, uid, old_data
+
+    def _halt(self):
+        # Halt PICC
+        self.rfid.picc_halt_a()
+        # Stop encryption on PCD
+        self.rfid.pcd_stop_crypto1()
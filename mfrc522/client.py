@@ -0,0 +1,267 @@
+'''
+Client library for the mfrc522d reader daemon.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import collections
+import contextlib
+import itertools
+import json
+import queue
+import socket
+import threading
+
+from .mfrc522 import (
+    PICC_Command,
+    StatusCode,
+    Uid
+)
+from .events import (
+    CardEvent,
+    CardEventType
+)
+from .daemon import (
+    DEFAULT_SOCKET_PATH,
+    encode_message
+)
+
+
+_AUTH_NAMES = {
+    PICC_Command.PICC_CMD_MF_AUTH_KEY_A: 'A',
+    PICC_Command.PICC_CMD_MF_AUTH_KEY_B: 'B',
+}
+
+
+def _decode_uid(message):
+    if not message.get('uid'):
+        return None
+    return Uid(list(bytes.fromhex(message['uid'])), message.get('sak'))
+
+def _decode_event(message):
+    return CardEvent(CardEventType[message['event']], _decode_uid(message), message['timestamp'], message.get('latency'))
+
+
+class ReaderClient(object):
+    '''
+    Connection to the mfrc522d daemon. Requests are sent one at a time (a client is not thread safe, use
+    a ReaderClientPool to share connections between threads).
+
+    Example:
+    >>> client = ReaderClient()
+    >>> status, uid, blocks = client.read_blocks([4, 5, 6])
+    >>> client.subscribe()
+    >>> while True:
+    >>>     print(client.get_event())
+    '''
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=5.0):
+        '''
+        Connects to the daemon
+
+        @param socket_path: Path of the Unix domain socket of the daemon (default = /run/mfrc522d.sock)
+        @param timeout: Timeout in seconds for the responses (default = 5.0)
+        '''
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self._buffer = bytearray()
+        self.events = collections.deque()       # Events received while waiting for a response
+        self._ids = itertools.count(1)
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def request(self, op, **params):
+        '''
+        Sends a request and waits for its response.
+
+        @param op: The operation (see mfrc522.daemon)
+        @return: The response (dict), status is converted to a StatusCode
+        '''
+        request_id = next(self._ids)
+        message = dict(params, op=op, id=request_id)
+        self.sock.sendall(encode_message(message))
+        while True:
+            response = self._receive(self.timeout)
+            if 'event' in response:
+                self.events.append(_decode_event(response))
+                continue
+            if response.get('id') == request_id:
+                response['status'] = StatusCode[response['status']]
+                return response
+
+    def ping(self):
+        return self.request('ping')['status']
+
+    def select(self):
+        '''
+        @return: (StatusCode, Uid)
+        '''
+        response = self.request('select')
+        return response['status'], _decode_uid(response)
+
+    def inventory(self, max_cards=8):
+        '''
+        @return: List of Uids
+        '''
+        response = self.request('inventory', max_cards=max_cards)
+        return [_decode_uid(uid) for uid in response.get('uids', [])]
+
+    def read_blocks(self, block_addrs, key=None, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A):
+        '''
+        See ReaderService.read_blocks
+
+        @param key: Optional MIFARE_Key (default = default key of the daemon)
+        @return: (StatusCode, Uid, blocks) - blocks is a dict block number -> list of 16 bytes
+        '''
+        response = self.request('read_blocks', blocks=list(block_addrs), auth=_AUTH_NAMES[auth_command], **self._key_param(key))
+        blocks = None
+        if 'blocks' in response:
+            blocks = {int(block_addr): list(bytes.fromhex(data)) for block_addr, data in response['blocks'].items()}
+        return response['status'], _decode_uid(response), blocks
+
+    def write_blocks(self, blocks, key=None, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A):
+        '''
+        See ReaderService.write_blocks
+
+        @param blocks: dict block number -> list of 16 bytes
+        @param key: Optional MIFARE_Key (default = default key of the daemon)
+        @return: (StatusCode, Uid)
+        '''
+        response = self.request('write_blocks', blocks={str(block_addr): bytes(data).hex() for block_addr, data in blocks.items()},
+                                auth=_AUTH_NAMES[auth_command], **self._key_param(key))
+        return response['status'], _decode_uid(response)
+
+    def subscribe(self):
+        '''
+        Subscribes to card events, they are returned by get_event()
+        '''
+        return self.request('subscribe')['status']
+
+    def unsubscribe(self):
+        return self.request('unsubscribe')['status']
+
+    def stats(self):
+        return self.request('stats').get('stats')
+
+    def get_event(self, timeout=None):
+        '''
+        Waits for the next card event (subscribe() first).
+
+        @param timeout: Timeout in seconds (default = None, wait forever)
+        @return: CardEvent or None on timeout
+        '''
+        if self.events:
+            return self.events.popleft()
+        while True:
+            try:
+                message = self._receive(timeout)
+            except socket.timeout:
+                return None
+            if 'event' in message:
+                return _decode_event(message)
+
+    def _key_param(self, key):
+        return {'key': bytes(key.key_byte).hex()} if key else {}
+
+    def _receive(self, timeout):
+        # Own line buffer, a timeout would leave the buffer of socket.makefile() in an undefined state
+        self.sock.settimeout(timeout)
+        while b'\n' not in self._buffer:
+            data = self.sock.recv(4096)
+            if not data:
+                raise ConnectionError('Connection to mfrc522d closed')
+            self._buffer += data
+        line, __, self._buffer = self._buffer.partition(b'\n')
+        return json.loads(line)
+
+
+class ReaderClientPool(object):
+    '''
+    Thread safe pool of connections to the mfrc522d daemon. Connections are opened on demand (up to size) and reused.
+
+    Example:
+    >>> pool = ReaderClientPool(size=4)
+    >>> status, uid, blocks = pool.read_blocks([4])
+    >>> with pool.client() as client:
+    >>>     client.select()
+    '''
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, size=4, timeout=5.0):
+        '''
+        @param socket_path: Path of the Unix domain socket of the daemon (default = /run/mfrc522d.sock)
+        @param size: Maximum number of connections (default = 4)
+        @param timeout: Timeout in seconds for the responses (default = 5.0)
+        '''
+        self.socket_path = socket_path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextlib.contextmanager
+    def client(self):
+        '''
+        Context manager lending a ReaderClient, blocks if all connections are in use.
+        The connection is closed instead of being returned to the pool if the block raises an exception.
+        '''
+        self._slots.acquire()
+        try:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                client = ReaderClient(self.socket_path, self.timeout)
+            try:
+                yield client
+            except BaseException:
+                client.close()
+                raise
+            else:
+                self._idle.put(client)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def select(self):
+        with self.client() as client:
+            return client.select()
+
+    def inventory(self, max_cards=8):
+        with self.client() as client:
+            return client.inventory(max_cards)
+
+    def read_blocks(self, block_addrs, key=None, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A):
+        with self.client() as client:
+            return client.read_blocks(block_addrs, key, auth_command)
+
+    def write_blocks(self, blocks, key=None, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A):
+        with self.client() as client:
+            return client.write_blocks(blocks, key, auth_command)
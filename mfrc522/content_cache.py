@@ -0,0 +1,225 @@
+'''
+Cache for the content of MIFARE Classic PICCs, keyed by UID and validated with a one block probe.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import collections
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+from .utils import FormatString as _F
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+
+class ContentCache(object):
+    '''
+    Bounded LRU cache of the data read from MIFARE Classic PICCs (see SimpleMFRC522.read_bytes).
+
+    Each entry is validated with a probe: a single block whose checksum is stored together with the data.
+    If the checksum of the probe block read from the PICC matches, the cached data is returned after one
+    authentication and one read instead of reading all sectors.
+
+    The probe block should be a "version block" the writing application changes (e. g. increments a counter)
+    with each update of the data, or a block that changes whenever the data changes (e. g. the first data block
+    for short records). Writes through SimpleMFRC522 invalidate the entry of the PICC.
+
+    If a path is given, the cache is loaded from and saved to a JSON file, that way it survives restarts.
+    Changes are saved at most every save_interval seconds (with the next change after the interval) and by
+    close(), call close() (or SimpleMFRC522.cleanup()) before the application exits.
+
+    Example:
+    >>> cache = ContentCache(probe_block=1, max_size=512, path='/var/cache/mfrc522.json')
+    >>> rfid = SimpleMFRC522(content_cache=cache)
+    >>> status, uid, data = rfid.read_bytes()
+    >>> rfid.cleanup()                                  # Saves the cache
+    '''
+
+    def __init__(self, probe_block=1, max_size=128, path=None, save_interval=5.0):
+        '''
+        Create a new ContentCache
+
+        @param probe_block: Address of the block used to detect changes (default = 1, the first data block)
+        @param max_size: Maximum number of cached PICCs (default = 128)
+        @param path: Optional path of the JSON file the cache is persisted to (default = None, memory only)
+        @param save_interval: Minimum seconds between two saves caused by changes, 0 to save each change (default = 5.0)
+        '''
+        self.probe_block = probe_block
+        self.max_size = max(1, max_size)
+        self.path = path
+        self.save_interval = save_interval
+        self._entries = collections.OrderedDict()      # UID bytes -> (checksum, terminal byte, data), least recently used first
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()             # Serializes the writes of the file
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self.reset_stats()
+        if path and os.path.exists(path):
+            self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def checksum(block_data):
+        '''
+        @param block_data: The data of the probe block
+        @return: CRC32 of the 16 data bytes of the block
+        '''
+        return zlib.crc32(bytes(block_data[:16]))
+
+    def lookup(self, uid, checksum, terminal_byte=0x00):
+        '''
+        @param uid: Uid of the PICC
+        @param checksum: Checksum of the probe block read from the PICC
+        @param terminal_byte: Terminal byte the data must have been read with
+        @return: The cached data (list of bytes) or None if the PICC is unknown or its content changed
+        '''
+        key = uid.to_bytes()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != checksum or entry[1] != terminal_byte:
+                del self._entries[key]
+                self._dirty = True
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[2])
+
+    def store(self, uid, checksum, data, terminal_byte=0x00):
+        '''
+        Adds the data read from a PICC, the least recently used entry is evicted if the cache is full.
+        The cache file is updated if a path is configured and save_interval passed since the last save.
+
+        @param uid: Uid of the PICC
+        @param checksum: Checksum of the probe block read in the same session as the data
+        @param data: The data (list of bytes)
+        @param terminal_byte: Terminal byte the data was read with
+        '''
+        with self._lock:
+            key = uid.to_bytes()
+            self._entries[key] = (checksum, terminal_byte, bytes(data))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+        self._save_if_due()
+
+    def forget(self, uid):
+        '''
+        Removes the entry of a PICC (e. g. after its data was written)
+        '''
+        with self._lock:
+            if self._entries.pop(uid.to_bytes(), None) is not None:
+                self._dirty = True
+        self._save_if_due()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+        self._save_if_due()
+
+    def close(self):
+        '''
+        Saves the pending changes (if a path is configured)
+        '''
+        if self.path and self._dirty:
+            self.save()
+
+    def save(self):
+        '''
+        Writes the cache to the file given by path (atomically, through a temporary file)
+        '''
+        with self._save_lock:
+            with self._lock:
+                entries = [[key.hex(), checksum, terminal_byte, data.hex()] for key, (checksum, terminal_byte, data) in self._entries.items()]
+                self._dirty = False
+                self._last_save = time.monotonic()
+            directory, name = os.path.split(os.path.abspath(self.path))
+            f = tempfile.NamedTemporaryFile('w', dir=directory, prefix=name + '.', suffix='.tmp', delete=False)
+            try:
+                with f:
+                    json.dump({'probe_block': self.probe_block, 'entries': entries}, f)
+                os.replace(f.name, self.path)
+            except Exception:
+                self._dirty = True
+                os.unlink(f.name)
+                raise
+
+    def _save_if_due(self):
+        if self.path and self._dirty and time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+
+    def load(self):
+        '''
+        Reads the cache from the file given by path. A file written with another probe block or an invalid file is ignored.
+
+        @return: True if the cache was loaded
+        '''
+        try:
+            with open(self.path) as f:
+                content = json.load(f)
+            if content.get('probe_block') != self.probe_block:
+                logger_debug.info(_F('Content cache {} ignored, it uses another probe block', self.path))
+                return False
+            entries = [(bytes.fromhex(key), (checksum, terminal_byte, bytes.fromhex(data))) for key, checksum, terminal_byte, data in content['entries']]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger_debug.warn(_F('Failed to load content cache {} ({})', self.path, e))
+            return False
+        with self._lock:
+            self._entries = collections.OrderedDict(entries[-self.max_size:])
+        return True
+
+    def get_stats(self):
+        '''
+        @return: dict with the number of hits, misses, stale entries (probe changed), evictions and the cache size
+        '''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'size': len(self._entries),
+            }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
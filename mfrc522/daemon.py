@@ -0,0 +1,424 @@
+'''
+Reader daemon serving a MFRC522 to several processes over a Unix domain socket.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+Protocol (JSON lines, UTF-8, one object per line):
+
+    Request:   {"id": 1, "op": "read_blocks", "blocks": [4, 5], "key": "ffffffffffff", "auth": "A"}
+    Response:  {"id": 1, "status": "STATUS_OK", "uid": "11223344", "sak": 8, "blocks": {"4": "00...", "5": "00..."}}
+    Event:     {"event": "ARRIVED", "uid": "11223344", "sak": 8, "timestamp": 1234.5, "latency": null}
+
+Operations:
+    ping                                    -> {}
+    select                                  -> uid, sak
+    inventory                               -> uids: [{"uid", "sak"}]
+    read_blocks   blocks, [key], [auth]     -> uid, sak, blocks
+    write_blocks  blocks, [key], [auth]     -> uid, sak
+    subscribe / unsubscribe                 -> events are sent to the connection until unsubscribed
+    stats                                   -> stats: statistics of the reader service, the presence tracker, the dedupe cache and the health watchdog
+
+Bytes (UIDs, keys, block data) are hex encoded. auth is "A" or "B" (default "A").
+Errors of the protocol are reported with status "STATUS_INVALID" and an "error" message.
+'''
+
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import socketserver
+import threading
+
+from .utils import FormatString as _F
+from .mfrc522 import (
+    MFRC522,
+    PICC_Command,
+    StatusCode,
+    MIFARE_Key
+)
+from .reader_service import (
+    ReaderService,
+    PRIORITY_LOW
+)
+from .presence import PresenceTracker
+from .dedupe import DedupeCache
+from .prometheus import MetricsExporter
+from .health import HealthWatchdog
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+
+DEFAULT_SOCKET_PATH = '/run/mfrc522d.sock'
+
+_AUTH_COMMANDS = {
+    'A': PICC_Command.PICC_CMD_MF_AUTH_KEY_A,
+    'B': PICC_Command.PICC_CMD_MF_AUTH_KEY_B,
+}
+
+
+def encode_message(message):
+    '''
+    @return: The message as JSON line (bytes)
+    '''
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode('utf-8')
+
+def encode_uid(uid):
+    '''
+    @return: dict with the hex encoded UID and the SAK (empty dict if uid is None)
+    '''
+    if uid is None:
+        return {}
+    return {'uid': uid.to_bytes().hex(), 'sak': uid.sak}
+
+def encode_event(event):
+    message = {'event': event.event_type.name, 'timestamp': event.timestamp, 'latency': event.latency}
+    message.update(encode_uid(event.uid))
+    return message
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    '''
+    Handles one client connection, requests are answered in order
+    '''
+
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()
+        self.events = None                  # Queue of the event messages, sent by the event sender thread
+
+    def handle(self):
+        daemon = self.server.daemon
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                self.send(daemon.handle_request(self, line))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            daemon.unsubscribe(self)
+
+    def send(self, message):
+        '''
+        Sends a message, called from the connection thread and from the event sender thread
+        '''
+        data = encode_message(message)
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def start_events(self, max_queued):
+        '''
+        Starts the thread sending the events of the connection, a slow client only blocks this thread
+        '''
+        if self.events is not None:
+            return
+        self.events = queue.Queue(max_queued)
+        threading.Thread(target=self._send_events, args=(self.events,), name='mfrc522d-sender', daemon=True).start()
+
+    def stop_events(self):
+        events, self.events = self.events, None
+        if events is not None:
+            try:
+                events.put_nowait(None)
+            except queue.Full:
+                pass                        # The sender stops when it gets to the end of the queue
+
+    def queue_event(self, message):
+        '''
+        @return: False if the client does not keep up with its events (queue full)
+        '''
+        events = self.events
+        if events is None:
+            return True
+        try:
+            events.put_nowait(message)
+        except queue.Full:
+            return False
+        return True
+
+    def close_connection(self):
+        '''
+        Shuts the socket down, a blocked send fails and the connection thread ends
+        '''
+        try:
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _send_events(self, events):
+        while True:
+            message = events.get()
+            if message is None or self.events is not events:
+                return
+            try:
+                self.send(message)
+            except (ConnectionError, OSError):
+                return
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ReaderDaemon(object):
+    '''
+    Owns a MFRC522 (through a ReaderService) and serves it to several processes over a Unix domain socket.
+    Clients share the reader without contention and without initializing the MFRC522 themselves.
+
+    Card events are detected with a PresenceTracker while at least one client is subscribed. Each subscriber
+    has a bounded queue of events, a client that does not read its events is disconnected when it is full.
+
+    Example:
+    >>> daemon = ReaderDaemon(MFRC522(pin_irq=0), socket_path='/tmp/mfrc522d.sock')
+    >>> daemon.serve_forever()
+    '''
+
+    def __init__(self, rfid, socket_path=DEFAULT_SOCKET_PATH, socket_mode=0o660, key=None, removal_latency=0.2, dedupe=None, watchdog=None, max_queued_events=64):
+        '''
+        Create a new ReaderDaemon
+
+        @param rfid: The MFRC522 instance
+        @param socket_path: Path of the Unix domain socket (default = /run/mfrc522d.sock)
+        @param socket_mode: File mode of the socket (default = 0o660)
+        @param key: Default MIFARE_Key if a request does not contain a key (default = factory key FFFFFFFFFFFFh)
+        @param removal_latency: Target latency in seconds for detecting the removal of a PICC (default = 0.2)
+        @param dedupe: Optional DedupeCache, the events of a PICC seen again within its ttl are not broadcast
+        @param watchdog: Optional HealthWatchdog of the MFRC522, requests wait while it recovers the MFRC522
+        @param max_queued_events: Maximum number of events waiting to be sent to a subscriber before it is disconnected (default = 64)
+        '''
+        self.service = ReaderService(rfid, key=key, watchdog=watchdog)
+        self.dedupe = dedupe
+        self.watchdog = watchdog
+        self.tracker = PresenceTracker(rfid, removal_latency=removal_latency, dedupe=dedupe)
+        self.socket_path = socket_path
+        self.socket_mode = socket_mode
+        self.max_queued_events = max_queued_events
+        self.server = None
+
+        self._subscribers = set()
+        self._subscribers_lock = threading.Lock()
+        self._subscribed = threading.Event()
+        self._stop = threading.Event()
+        self._event_thread = None
+
+    def start(self):
+        '''
+        Starts the reader service, the event thread and binds the socket (requests are served by serve_forever)
+        '''
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)                 # Stale socket of a previous run
+        self.server = _Server(self.socket_path, _RequestHandler)
+        self.server.daemon = self
+        os.chmod(self.socket_path, self.socket_mode)
+
+        self._stop.clear()
+        self.service.start()
+        self._event_thread = threading.Thread(target=self._run_events, name='mfrc522d-events', daemon=True)
+        self._event_thread.start()
+        logger_debug.info(_F('mfrc522d listening on {}', self.socket_path))
+
+    def serve_forever(self):
+        '''
+        Starts the daemon (if not started yet) and serves requests until shutdown() is called
+        '''
+        if self.server is None:
+            self.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self._close()
+
+    def shutdown(self):
+        '''
+        Stops serve_forever(), can be called from any thread except the serving thread (e. g. a signal handler thread)
+        '''
+        self._stop.set()
+        self._subscribed.set()
+        if self.server:
+            self.server.shutdown()
+
+    def handle_request(self, connection, line):
+        '''
+        @param connection: The connection (_RequestHandler) the request was received on
+        @param line: The request (JSON line)
+        @return: The response message (dict)
+        '''
+        try:
+            request = json.loads(line)
+            op = request['op']
+        except (ValueError, KeyError, TypeError) as e:
+            return {'status': StatusCode.STATUS_INVALID.name, 'error': 'Invalid request: {}'.format(e)}
+
+        response = {'id': request.get('id')}
+        try:
+            response.update(self._execute(connection, op, request))
+        except (ValueError, KeyError, TypeError) as e:
+            response.update({'status': StatusCode.STATUS_INVALID.name, 'error': 'Invalid request: {}'.format(e)})
+        return response
+
+    def subscribe(self, connection):
+        with self._subscribers_lock:
+            connection.start_events(self.max_queued_events)
+            self._subscribers.add(connection)
+            self._subscribed.set()
+
+    def unsubscribe(self, connection):
+        with self._subscribers_lock:
+            self._subscribers.discard(connection)
+            connection.stop_events()
+            if not self._subscribers and not self._stop.is_set():
+                self._subscribed.clear()
+
+    def _execute(self, connection, op, request):
+        if op == 'ping':
+            return {'status': StatusCode.STATUS_OK.name}
+        if op == 'subscribe':
+            self.subscribe(connection)
+            return {'status': StatusCode.STATUS_OK.name}
+        if op == 'unsubscribe':
+            self.unsubscribe(connection)
+            return {'status': StatusCode.STATUS_OK.name}
+        if op == 'stats':
+            stats = {'service': self.service.get_stats(), 'presence': self.tracker.get_stats()}
+            if self.dedupe is not None:
+                stats['dedupe'] = self.dedupe.get_stats()
+            if self.watchdog is not None:
+                stats['health'] = self.watchdog.get_stats()
+            return {'status': StatusCode.STATUS_OK.name, 'stats': stats}
+        if op == 'select':
+            status, uid = self.service.select().result()
+            return dict(status=status.name, **encode_uid(uid))
+        if op == 'inventory':
+            uids = self.service.inventory(int(request.get('max_cards', 8))).result()
+            return {'status': StatusCode.STATUS_OK.name, 'uids': [encode_uid(uid) for uid in uids]}
+
+        key = self._decode_key(request.get('key'))
+        auth = request.get('auth', 'A')
+        if not isinstance(auth, str):
+            raise TypeError('auth must be a string')
+        auth_command = _AUTH_COMMANDS[auth.upper()]
+        if op == 'read_blocks':
+            if not isinstance(request['blocks'], list):
+                raise TypeError('blocks must be a list')
+            blocks = [int(block_addr) for block_addr in request['blocks']]
+            status, uid, data = self.service.read_blocks(blocks, key=key, auth_command=auth_command).result()
+            response = dict(status=status.name, **encode_uid(uid))
+            if data is not None:
+                response['blocks'] = {str(block_addr): bytes(block).hex() for block_addr, block in data.items()}
+            return response
+        if op == 'write_blocks':
+            if not isinstance(request['blocks'], dict):
+                raise TypeError('blocks must be an object')
+            blocks = {int(block_addr): list(bytes.fromhex(data)) for block_addr, data in request['blocks'].items()}
+            for data in blocks.values():
+                if len(data) != 16:
+                    raise ValueError('blocks must have 16 bytes')
+            status, uid = self.service.write_blocks(blocks, key=key, auth_command=auth_command).result()
+            return dict(status=status.name, **encode_uid(uid))
+        raise ValueError('unknown op {!r}'.format(op))
+
+    def _decode_key(self, key):
+        if key is None:
+            return None
+        mifare_key = MIFARE_Key()
+        mifare_key.key_byte = list(bytes.fromhex(key))
+        if len(mifare_key.key_byte) != 6:
+            raise ValueError('key must have 6 bytes')
+        return mifare_key
+
+    def _run_events(self):
+        while not self._stop.is_set():
+            self._subscribed.wait()
+            if self._stop.is_set():
+                break
+            try:
+                events = self.service.submit(lambda rfid: self.tracker.poll(), priority=PRIORITY_LOW).result()
+            except Exception:
+                logger_debug.exception('Presence tracking failed')
+                events = []
+            for event in events:
+                self._broadcast(encode_event(event))
+            self._stop.wait(self.tracker.next_poll_delay())
+
+    def _broadcast(self, message):
+        with self._subscribers_lock:
+            subscribers = list(self._subscribers)
+        for connection in subscribers:
+            if not connection.queue_event(message):
+                logger_debug.warn(_F('Subscriber does not read its events, disconnected after {} queued events', self.max_queued_events))
+                self.unsubscribe(connection)
+                connection.close_connection()
+
+    def _close(self):
+        self._stop.set()
+        self._subscribed.set()
+        self.server.server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        if self._event_thread:
+            self._event_thread.join()
+        self.service.stop()
+        self.service.rfid.pcd_cleanup()
+        self.server = None
+
+
+def main(argv=None):
+    '''
+    Entry point of the mfrc522d script
+    '''
+    parser = argparse.ArgumentParser(prog='mfrc522d', description='Serves a MFRC522 reader over a Unix domain socket (JSON lines)')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help='Path of the Unix domain socket (default: %(default)s)')
+    parser.add_argument('--socket-mode', default='660', help='File mode of the socket, octal (default: %(default)s)')
+    parser.add_argument('--bus', type=int, default=0, help='SPI bus (default: %(default)s)')
+    parser.add_argument('--device', type=int, default=0, help='SPI device (default: %(default)s)')
+    parser.add_argument('--speed', type=int, default=1000000, help='Max SPI speed in Hz (default: %(default)s)')
+    parser.add_argument('--pin-reset', type=int, default=25, help='GPIO reset pin, 0 if not connected (default: %(default)s)')
+    parser.add_argument('--pin-ce', type=int, default=0, help='GPIO chip select pin, 0 if not used (default: %(default)s)')
+    parser.add_argument('--removal-latency', type=float, default=0.2, help='Target latency in seconds for detecting removed cards (default: %(default)s)')
+    parser.add_argument('--dedupe-ttl', type=float, default=0.0, help='Suppress the events of a card seen again within this many seconds, 0 to disable (default: %(default)s)')
+    parser.add_argument('--watchdog-interval', type=float, default=0.0, help='Probe the MFRC522 every this many seconds and recover it if needed, 0 to disable (default: %(default)s)')
+    parser.add_argument('--metrics-port', type=int, default=0, help='Serve the reader metrics in Prometheus format on this local port, 0 to disable (default: %(default)s)')
+    parser.add_argument('--log-level', default='WARNING', help='Log level (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper())
+
+    rfid = MFRC522(bus=args.bus, device=args.device, speed=args.speed, pin_reset=args.pin_reset, pin_ce=args.pin_ce, pin_irq=0)
+    dedupe = DedupeCache(ttl=args.dedupe_ttl) if args.dedupe_ttl > 0 else None
+    watchdog = HealthWatchdog(rfid, interval=args.watchdog_interval) if args.watchdog_interval > 0 else None
+    daemon = ReaderDaemon(rfid, socket_path=args.socket, socket_mode=int(args.socket_mode, 8), removal_latency=args.removal_latency, dedupe=dedupe, watchdog=watchdog)
+
+    exporter = None
+    if args.metrics_port > 0:
+        exporter = MetricsExporter([rfid], port=args.metrics_port, watchdogs=[watchdog] if watchdog else None)
+        exporter.start()
+
+    def stop(signum, frame):
+        # shutdown() blocks until serve_forever() returns, it must not run on the serving thread
+        threading.Thread(target=daemon.shutdown).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        daemon.serve_forever()
+    finally:
+        if exporter:
+            exporter.stop()
@@ -0,0 +1,133 @@
+'''
+TTL / LRU cache suppressing duplicate reads of the same PICC.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import collections
+import threading
+import time
+
+
+class DedupeCache(object):
+    '''
+    Remembers the UIDs of recently seen PICCs. A PICC that is seen again within ttl seconds of its
+    last sighting is a duplicate, each sighting extends the window. That way a PICC that stays on the
+    reader (e. g. a clone that ignores HLTA and answers every REQA) is reported only once.
+
+    The number of entries is bounded by max_size, the least recently seen UID is evicted first.
+    The cache is thread safe.
+
+    Example:
+    >>> dedupe = DedupeCache(ttl=2.0)
+    >>> status, uid = rfid.picc_read_card_serial()
+    >>> if status == StatusCode.STATUS_OK and not dedupe.is_duplicate(uid):
+    >>>     process(uid)
+    '''
+
+    def __init__(self, ttl=2.0, max_size=256, clock=time.monotonic):
+        '''
+        Create a new DedupeCache
+
+        @param ttl: Time in seconds after the last sighting until a PICC is reported again (default = 2.0)
+        @param max_size: Maximum number of remembered UIDs (default = 256)
+        @param clock: Function returning the current time in seconds (default = time.monotonic)
+        '''
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self.clock = clock
+        self._entries = collections.OrderedDict()      # UID bytes -> time of the last sighting, least recently seen first
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, uid):
+        with self._lock:
+            return self._is_fresh(uid.to_bytes(), self.clock())
+
+    def is_duplicate(self, uid):
+        '''
+        Records a sighting of a PICC
+
+        @param uid: Uid of the PICC
+        @return: True if the PICC was already seen within ttl seconds (suppress it), False if it is new
+        '''
+        key = uid.to_bytes()
+        now = self.clock()
+        with self._lock:
+            duplicate = self._is_fresh(key, now)
+            self._touch(key, now)
+            self.seen += 1
+            if duplicate:
+                self.duplicates += 1
+            return duplicate
+
+    def touch(self, uid, timestamp=None):
+        '''
+        Extends the window of a PICC without counting a sighting (e. g. a PICC still answering keep-alive probes)
+
+        @param uid: Uid of the PICC
+        @param timestamp: Time of the sighting (default = now)
+        '''
+        with self._lock:
+            self._touch(uid.to_bytes(), self.clock() if timestamp is None else timestamp)
+
+    def forget(self, uid):
+        '''
+        Removes a PICC, its next sighting is reported again
+        '''
+        with self._lock:
+            self._entries.pop(uid.to_bytes(), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        '''
+        @return: dict with the number of sightings, suppressed duplicates, the duplicate rate, evictions and the cache size
+        '''
+        with self._lock:
+            return {
+                'seen': self.seen,
+                'duplicates': self.duplicates,
+                'duplicate_rate': self.duplicates / self.seen if self.seen else None,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+            }
+
+    def reset_stats(self):
+        self.seen = 0
+        self.duplicates = 0
+        self.evictions = 0
+
+    def _is_fresh(self, key, now):
+        last_seen = self._entries.get(key)
+        return last_seen is not None and now - last_seen < self.ttl
+
+    def _touch(self, key, now):
+        self._entries[key] = now
+        self._entries.move_to_end(key)
+        # Expired entries are at the front, drop them first - then the least recently seen ones
+        while self._entries:
+            oldest_key, oldest = next(iter(self._entries.items()))
+            if now - oldest < self.ttl and len(self._entries) <= self.max_size:
+                break
+            del self._entries[oldest_key]
+            if now - oldest < self.ttl:
+                self.evictions += 1
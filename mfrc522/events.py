@@ -0,0 +1,55 @@
+'''
+Card events emitted by the presence tracker and the higher level reader APIs
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+from enum import Enum
+
+from .utils import format_hex
+
+
+class CardEventType(Enum):
+    '''
+    Type of a CardEvent
+    '''
+
+    ARRIVED                 = 0    # A PICC entered the field and was selected
+    REMOVED                 = 1    # The PICC left the field
+
+
+class CardEvent(object):
+    '''
+    A struct describing a card arriving at or leaving the reader.
+    '''
+
+    def __init__(self, event_type, uid, timestamp, latency=None):
+        '''
+        @param event_type: One of the CardEventType enums
+        @param uid: Uid of the PICC
+        @param timestamp: Time (time.monotonic()) the event was detected
+        @param latency: Detection latency in seconds, for REMOVED events the time since the PICC last answered
+        '''
+        self.event_type = event_type
+        self.uid = uid
+        self.timestamp = timestamp
+        self.latency = latency
+
+    def __str__(self):
+        return '<CardEvent: {}, UID: [{}], latency: {}>'.format(
+            self.event_type.name,
+            format_hex(self.uid.uid()) if self.uid else '',
+            '{:.1f}ms'.format(self.latency * 1000) if self.latency is not None else '-')
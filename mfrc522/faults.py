@@ -0,0 +1,135 @@
+'''
+Fault injection for the SimulatedSpi: RF errors, card removal and a dead SPI bus.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import random
+from enum import Enum
+
+
+class FaultType(Enum):
+    '''
+    Faults injected by a FaultInjector
+    '''
+
+    PARITY_ERROR            = 'parity_error'        # ParityErr in ErrorReg
+    CRC_ERROR               = 'crc_error'           # A bit of the answer of the PICC is flipped
+    TIMEOUT                 = 'timeout'             # The answer of the PICC is lost
+    COLLISION               = 'collision'           # CollErr in ErrorReg
+    CARD_REMOVAL            = 'card_removal'        # A PICC leaves the field before a frame and comes back later
+    DEAD_SPI                = 'dead_spi'            # MISO is stuck at 0x00 or 0xFF for a number of transfers
+
+
+# Faults applied to the answer of a PICC, in the order they are drawn
+_FRAME_FAULTS = (FaultType.TIMEOUT, FaultType.PARITY_ERROR, FaultType.CRC_ERROR, FaultType.COLLISION)
+
+
+class FaultInjector(object):
+    '''
+    Injects faults into the communication of a SimulatedSpi with configurable rates. The RF faults are drawn
+    per frame sent to the PICCs, DEAD_SPI per SPI transfer. A removed PICC comes back into the field
+    (powered on, state IDLE) after removal_frames frames. During a dead SPI period the writes still reach the
+    MFRC522, only the received bytes are stuck.
+
+    Example:
+    >>> faults = FaultInjector({FaultType.CRC_ERROR: 0.01, FaultType.TIMEOUT: 0.01}, seed=1)
+    >>> spi = SimulatedSpi([SimulatedPicc([0x01, 0x02, 0x03, 0x04])], faults=faults)
+    >>> ...
+    >>> print(faults.injected)
+    '''
+
+    def __init__(self, rates=None, seed=None, removal_frames=3, dead_spi_transfers=50):
+        '''
+        Create a new FaultInjector
+
+        @param rates: dict FaultType (or its value) -> probability per frame (per SPI transfer for DEAD_SPI)
+        @param seed: Seed of the random generator (default = None, not reproducible)
+        @param removal_frames: Number of frames a removed PICC stays out of the field (default = 3)
+        @param dead_spi_transfers: Number of SPI transfers of a dead SPI period (default = 50)
+        '''
+        self.rates = {FaultType(fault): rate for fault, rate in (rates or {}).items()}
+        self.random = random.Random(seed)
+        self.removal_frames = removal_frames
+        self.dead_spi_transfers = dead_spi_transfers
+        self.enabled = True
+
+        self.injected = {fault: 0 for fault in FaultType}
+        self._removed = []              # [picc, remaining frames]
+        self._dead_transfers = 0
+        self._stuck_value = 0x00
+
+    def _draw(self, fault):
+        rate = self.rates.get(fault)
+        if rate and self.random.random() < rate:
+            self.injected[fault] += 1
+            return True
+        return False
+
+    def spi_fault(self):
+        '''
+        Called by the SimulatedSpi for each transfer
+
+        @return: The stuck value of the received bytes (0x00 or 0xFF) or None if the SPI works
+        '''
+        if not self.enabled:
+            return None
+        if not self._dead_transfers and self._draw(FaultType.DEAD_SPI):
+            self._dead_transfers = self.dead_spi_transfers
+            self._stuck_value = self.random.choice((0x00, 0xFF))
+        if self._dead_transfers:
+            self._dead_transfers -= 1
+            return self._stuck_value
+        return None
+
+    def before_frame(self, spi):
+        '''
+        Called by the SimulatedSpi before a frame is sent: brings back removed PICCs and removes a PICC
+        '''
+        for removed in list(self._removed):
+            removed[1] -= 1
+            if removed[1] <= 0:
+                self._removed.remove(removed)
+                spi.add_picc(removed[0])
+        if self.enabled and spi.piccs and self._draw(FaultType.CARD_REMOVAL):
+            picc = self.random.choice(spi.piccs)
+            spi.remove_picc(picc)
+            self._removed.append([picc, self.removal_frames])
+
+    def frame_fault(self):
+        '''
+        Called by the SimulatedSpi when a PICC answered a frame
+
+        @return: One of the RF FaultTypes or None
+        '''
+        if not self.enabled:
+            return None
+        for fault in _FRAME_FAULTS:
+            if self._draw(fault):
+                return fault
+        return None
+
+    def restore(self, spi):
+        '''
+        Brings back all removed PICCs and ends a dead SPI period
+        '''
+        for picc, __ in self._removed:
+            spi.add_picc(picc)
+        self._removed = []
+        self._dead_transfers = 0
+
+    def reset_stats(self):
+        self.injected = {fault: 0 for fault in FaultType}
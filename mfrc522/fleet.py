@@ -0,0 +1,322 @@
+'''
+Reader fleet with one worker process per SPI bus, publishing card events into shared memory ring buffers.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import logging
+import math
+import multiprocessing
+import struct
+import zlib
+from multiprocessing import shared_memory
+
+from .utils import FormatString as _F
+from .mfrc522 import (
+    MFRC522,
+    StatusCode,
+    Uid
+)
+from .events import (
+    CardEvent,
+    CardEventType
+)
+from .multi_reader import ReaderManager
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+
+class FleetEvent(CardEvent):
+    '''
+    A CardEvent read from an EventRing, with the origin of the event
+    '''
+
+    def __init__(self, event_type, uid, timestamp, latency=None, bus=0, device=0, status=StatusCode.STATUS_OK):
+        super().__init__(event_type, uid, timestamp, latency)
+        self.bus = bus
+        self.device = device
+        self.status = status
+
+    def __str__(self):
+        return '<FleetEvent: bus: {}, device: {}, {}>'.format(self.bus, self.device, CardEvent.__str__(self))
+
+
+class EventRing(object):
+    '''
+    Single producer / single consumer ring buffer of fixed size event records in multiprocessing.shared_memory.
+    No locks are used: the producer owns the head index, the consumer owns the tail index.
+
+    Each record carries its sequence number (written last) and a CRC32 of its content. The consumer only accepts
+    the record it expects next with a matching checksum, that way a record that is not completely visible yet
+    (e. g. reordered stores on ARM) is picked up on the next read. A full ring drops new events and counts them.
+
+    Record layout (little endian, 48 bytes):
+        sequence (u64), crc32 (u32), timestamp (f64), latency (f64, NaN if none),
+        bus, device, event_type, status, sak, uid_size (u8), uid (10 bytes), 4 bytes padding
+    '''
+
+    RECORD = struct.Struct('<QIddBBBBBB10s4x')
+    _BODY = struct.Struct('<ddBBBBBB10s4x')
+    _U64 = struct.Struct('<Q')
+    _U32 = struct.Struct('<I')
+
+    # Header: capacity at 0, producer (head, dropped) at 64, consumer (tail) at 128 - separate cache lines
+    _CAPACITY_OFFSET = 0
+    _HEAD_OFFSET = 64
+    _DROPPED_OFFSET = 72
+    _TAIL_OFFSET = 128
+    _HEADER_SIZE = 192
+
+    def __init__(self, capacity=1024, name=None):
+        '''
+        Creates a new ring buffer, or attaches to an existing one if a name is given.
+
+        @param capacity: Number of records (default = 1024), ignored when attaching
+        @param name: Name of an existing shared memory block
+        '''
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=self._HEADER_SIZE + capacity * self.RECORD.size)
+            self.shm.buf[:self._HEADER_SIZE] = bytes(self._HEADER_SIZE)
+            self._U64.pack_into(self.shm.buf, self._CAPACITY_OFFSET, capacity)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.capacity = self._U64.unpack_from(self.shm.buf, self._CAPACITY_OFFSET)[0]
+
+    def __getstate__(self):
+        # Other processes attach to the shared memory by name
+        return {'name': self.name}
+
+    def __setstate__(self, state):
+        self.__init__(name=state['name'])
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def dropped(self):
+        return self._U64.unpack_from(self.shm.buf, self._DROPPED_OFFSET)[0]
+
+    def __len__(self):
+        '''
+        @return: Number of records waiting for the consumer
+        '''
+        buf = self.shm.buf
+        return self._U64.unpack_from(buf, self._HEAD_OFFSET)[0] - self._U64.unpack_from(buf, self._TAIL_OFFSET)[0]
+
+    def put(self, event_type, uid, timestamp, latency=None, bus=0, device=0, status=StatusCode.STATUS_OK):
+        '''
+        Publishes an event (producer side)
+
+        @param event_type: One of the CardEventType enums
+        @param uid: Uid of the PICC (or None)
+        @return: False if the ring is full and the event was dropped
+        '''
+        buf = self.shm.buf
+        head = self._U64.unpack_from(buf, self._HEAD_OFFSET)[0]
+        tail = self._U64.unpack_from(buf, self._TAIL_OFFSET)[0]
+        if head - tail >= self.capacity:
+            self._U64.pack_into(buf, self._DROPPED_OFFSET, self.dropped + 1)
+            return False
+
+        body = self._BODY.pack(timestamp, math.nan if latency is None else latency, bus, device, event_type.value, status.value,
+                               (uid.sak or 0) if uid else 0, uid.size if uid else 0, uid.to_bytes() if uid else b'')
+        offset = self._HEADER_SIZE + (head % self.capacity) * self.RECORD.size
+        buf[offset + 12:offset + self.RECORD.size] = body
+        self._U32.pack_into(buf, offset + 8, zlib.crc32(body))
+        self._U64.pack_into(buf, offset, head + 1)                     # The sequence number marks the record as complete
+        self._U64.pack_into(buf, self._HEAD_OFFSET, head + 1)
+        return True
+
+    def get(self, max_events=None):
+        '''
+        Reads the available events (consumer side)
+
+        @param max_events: Maximum number of events to read (default = all)
+        @return: List of FleetEvents
+        '''
+        buf = self.shm.buf
+        tail = self._U64.unpack_from(buf, self._TAIL_OFFSET)[0]
+        events = []
+        while max_events is None or len(events) < max_events:
+            offset = self._HEADER_SIZE + (tail % self.capacity) * self.RECORD.size
+            sequence, crc = struct.unpack_from('<QI', buf, offset)
+            if sequence != tail + 1:
+                break
+            body = bytes(buf[offset + 12:offset + self.RECORD.size])
+            if zlib.crc32(body) != crc:                                 # Not completely written yet
+                break
+            events.append(self._decode(body))
+            tail += 1
+        self._U64.pack_into(buf, self._TAIL_OFFSET, tail)
+        return events
+
+    def close(self):
+        '''
+        Detaches from the shared memory. The creator also removes it.
+        '''
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def _decode(self, body):
+        timestamp, latency, bus, device, event_type, status, sak, uid_size, uid_bytes = self._BODY.unpack(body)
+        uid = Uid(list(uid_bytes[:uid_size]), sak) if uid_size else None
+        return FleetEvent(CardEventType(event_type), uid, timestamp, None if math.isnan(latency) else latency,
+                          bus=bus, device=device, status=StatusCode(status))
+
+
+def default_reader_factory(bus, device):
+    '''
+    Creates the MFRC522 for a device of a bus in the worker process (IRQ pin not used, the PICCs are polled)
+    '''
+    return MFRC522(bus=bus, device=device, pin_irq=0)
+
+
+def _run_worker(bus, devices, ring, reader_factory, stop_event, poll_interval):
+    if ring.owner:
+        ring = EventRing(name=ring.name)            # Forked with the supervisor's ring, attach an own one (closing it must not unlink)
+    device_by_name = {}
+    manager = ReaderManager(callback=lambda reader, event: ring.put(event.event_type, event.uid, event.timestamp, event.latency, bus=bus, device=device_by_name[reader.name]))
+    for device in devices:
+        name = 'spi{}.{}'.format(bus, device)
+        manager.add_reader(reader_factory(bus, device), name=name)
+        device_by_name[name] = device
+    try:
+        manager.init()
+        while not stop_event.is_set():
+            manager.run_cycle()
+            if poll_interval > 0:
+                stop_event.wait(poll_interval)
+    finally:
+        manager.cleanup()
+        ring.close()
+
+
+class FleetSupervisor(object):
+    '''
+    Starts one worker process per SPI bus. Each worker polls the readers of its bus (see ReaderManager) and
+    publishes ARRIVED events into its own EventRing, so polling scales over the CPU cores and the consumer
+    reads the events without pickling. Crashed workers are restarted by supervise().
+
+    Example:
+    >>> with FleetSupervisor({0: [0, 1], 1: [0, 1, 2]}) as fleet:
+    >>>     while True:
+    >>>         for event in fleet.read_events():
+    >>>             print(event)
+    >>>         fleet.supervise()
+    >>>         time.sleep(0.05)
+    '''
+
+    def __init__(self, buses, reader_factory=default_reader_factory, capacity=1024, poll_interval=0.0, mp_context=None):
+        '''
+        Create a new FleetSupervisor
+
+        @param buses: dict SPI bus -> list of devices on that bus
+        @param reader_factory: Function reader_factory(bus, device) returning the MFRC522, called in the worker process (default = default_reader_factory)
+        @param capacity: Number of records of each EventRing (default = 1024)
+        @param poll_interval: Pause in seconds between two polling cycles of a worker (default = 0.0)
+        @param mp_context: Optional multiprocessing context (default = multiprocessing.get_context())
+        '''
+        self.buses = {bus: list(devices) for bus, devices in buses.items()}
+        self.reader_factory = reader_factory
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.context = mp_context if mp_context else multiprocessing.get_context()
+
+        self.rings = {}
+        self.processes = {}
+        self.restarts = {bus: 0 for bus in self.buses}
+        self.stop_event = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        '''
+        Creates the rings and starts the worker processes
+        '''
+        self.stop_event = self.context.Event()
+        for bus in self.buses:
+            self.rings[bus] = EventRing(self.capacity)
+            self._start_worker(bus)
+
+    def stop(self, timeout=2.0):
+        '''
+        Stops the workers and removes the rings
+        '''
+        if self.stop_event is None:
+            return
+        self.stop_event.set()
+        for process in self.processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for ring in self.rings.values():
+            ring.close()
+        self.processes.clear()
+        self.rings.clear()
+        self.stop_event = None
+
+    def supervise(self):
+        '''
+        Restarts crashed workers
+
+        @return: List of the restarted buses
+        '''
+        restarted = []
+        for bus, process in list(self.processes.items()):
+            if not process.is_alive() and not self.stop_event.is_set():
+                logger_debug.warn(_F('Worker of bus {} terminated (exit code: {}), restarting', bus, process.exitcode))
+                self.restarts[bus] += 1
+                self._start_worker(bus)
+                restarted.append(bus)
+        return restarted
+
+    def read_events(self):
+        '''
+        @return: List of the new FleetEvents of all buses, ordered by timestamp
+        '''
+        events = []
+        for ring in self.rings.values():
+            events.extend(ring.get())
+        events.sort(key=lambda event: event.timestamp)
+        return events
+
+    def get_stats(self):
+        '''
+        @return: dict bus -> worker state, restarts, pending and dropped events
+        '''
+        return {bus: {
+            'alive': self.processes[bus].is_alive() if bus in self.processes else False,
+            'restarts': self.restarts[bus],
+            'pending': len(self.rings[bus]) if bus in self.rings else 0,
+            'dropped': self.rings[bus].dropped if bus in self.rings else 0,
+        } for bus in self.buses}
+
+    def _start_worker(self, bus):
+        process = self.context.Process(target=_run_worker, name='mfrc522-bus{}'.format(bus), daemon=True,
+                                       args=(bus, self.buses[bus], self.rings[bus], self.reader_factory, self.stop_event, self.poll_interval))
+        process.start()
+        self.processes[bus] = process
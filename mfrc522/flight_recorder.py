@@ -0,0 +1,147 @@
+'''
+Always-on flight recorder of the recent SPI transactions and PICC frames.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import logging
+import time
+from array import array
+
+from .utils import FormatString as _F
+from .trace import (
+    TraceDirection,
+    TraceRecord,
+    format_record
+)
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+
+class FlightRecorder(object):
+    '''
+    Fixed size ring buffer of the last SPI transfers and PICC frames with their StatusCode of a MFRC522
+    (see MFRC522.flight_recorder).
+
+    All storage is preallocated. Recording only stores references to the transferred byte lists, decoding and
+    formatting is deferred to dump(), so the recorder can stay on in production.
+
+    dump() returns the content as TraceRecords (oldest first): register transactions (TraceDirection.WRITE / READ)
+    and the ends of PICC frames (TraceDirection.FRAME). If a frame ends with one of the dump_on status codes, the
+    content is passed to the dump callback (default: logged as warning to 'mfrc522.log'), at most every
+    min_dump_interval seconds.
+
+    Example:
+    >>> rfid = MFRC522(flight_recorder=512)
+    >>> rfid.flight_recorder.dump_callback = lambda records: save(records)
+    >>> for record in rfid.flight_recorder.dump():
+    >>>     print(format_record(record))
+    '''
+
+    def __init__(self, size=256, dump_on=None, dump_callback=None, min_dump_interval=10.0, clock=time.monotonic):
+        '''
+        Create a new FlightRecorder
+
+        @param size: Number of records kept (default = 256)
+        @param dump_on: StatusCodes of a frame that trigger a dump (default = STATUS_ERROR, STATUS_CRC_WRONG and STATUS_INTERNAL_ERROR)
+        @param dump_callback: Function called with the list of TraceRecords on an automatic dump (default = log the records)
+        @param min_dump_interval: Minimum time in seconds between two automatic dumps (default = 10.0)
+        @param clock: Function returning the current time in seconds, used for the dump interval (default = time.monotonic)
+        '''
+        if dump_on is None:
+            from .mfrc522 import StatusCode
+            dump_on = (StatusCode.STATUS_ERROR, StatusCode.STATUS_CRC_WRONG, StatusCode.STATUS_INTERNAL_ERROR)
+        self.size = max(1, size)
+        self.dump_on = frozenset(dump_on)
+        self.dump_callback = dump_callback if dump_callback else self._log_records
+        self.min_dump_interval = min_dump_interval
+        self.clock = clock
+
+        self.timestamps = array('d', bytes(8 * self.size))
+        self.sent = [None] * self.size      # Bytes sent over SPI, or the PICC command of a frame
+        self.received = [None] * self.size  # Bytes received over SPI, or the StatusCode of a frame
+        self.count = 0                      # Number of records written since the creation
+        self._next = 0                      # Index of the next record
+        self.dumps = 0
+        self._last_dump = None
+
+    def record_transfer(self, timestamp, tx, rx):
+        '''
+        Records a SPI transfer. The lists are stored, not copied, they must not be modified afterwards.
+
+        @param tx: List of bytes sent
+        @param rx: List of bytes received
+        '''
+        i = self._next
+        self._next = i + 1 if i + 1 < self.size else 0
+        self.count += 1
+        self.timestamps[i] = timestamp
+        self.sent[i] = tx
+        self.received[i] = rx
+
+    def record_frame(self, timestamp, command, status):
+        '''
+        Records the end of a PICC frame
+
+        @param command: Value of the PICC command the frame belongs to (data frames are recorded under their command)
+        @param status: StatusCode of the frame
+        '''
+        i = self._next
+        self._next = i + 1 if i + 1 < self.size else 0
+        self.count += 1
+        self.timestamps[i] = timestamp
+        self.sent[i] = command
+        self.received[i] = status
+        if status in self.dump_on:
+            self._auto_dump()
+
+    def dump(self):
+        '''
+        @return: List of the recorded TraceRecords, oldest first. The data of a FRAME record is [StatusCode value].
+        '''
+        count = min(self.count, self.size)
+        records = []
+        for n in range(self._next - count, self._next):
+            i = n % self.size
+            tx, rx = self.sent[i], self.received[i]
+            if isinstance(tx, int):
+                records.append(TraceRecord(self.timestamps[i], TraceDirection.FRAME, tx, [rx.value]))
+            elif tx[0] & 0x80:
+                records.append(TraceRecord(self.timestamps[i], TraceDirection.READ, tx[0] & 0x7E, list(rx[1:])))
+            else:
+                records.append(TraceRecord(self.timestamps[i], TraceDirection.WRITE, tx[0], list(tx[1:])))
+        return records
+
+    def clear(self):
+        self.count = 0
+        self._next = 0
+        self.sent = [None] * self.size
+        self.received = [None] * self.size
+
+    def _auto_dump(self):
+        now = self.clock()
+        if self._last_dump is not None and now - self._last_dump < self.min_dump_interval:
+            return
+        self._last_dump = now
+        self.dumps += 1
+        try:
+            self.dump_callback(self.dump())
+        except Exception:
+            logger_debug.exception('Flight recorder dump failed')
+
+    def _log_records(self, records):
+        logger_debug.warn(_F('Flight recorder ({} records):\n{}', len(records), '\n'.join(format_record(record) for record in records)))
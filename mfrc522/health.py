@@ -0,0 +1,312 @@
+'''
+Health watchdog of the MFRC522 with automatic recovery
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import logging
+import threading
+import time
+from enum import Enum
+
+from .utils import FormatString as _F
+from .mfrc522 import PCD_Register
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+
+class HealthState(Enum):
+    '''
+    States of the HealthWatchdog
+    '''
+
+    HEALTHY                 = 0    # The last probe succeeded
+    SUSPECT                 = 1    # Probes failed, but less than failure_threshold in a row
+    RECOVERING              = 2    # The recovery steps are running
+    FAILED                  = 3    # All recovery steps failed, the next attempt waits for the backoff
+
+
+class RecoveryStep(Enum):
+    '''
+    Recovery steps of the HealthWatchdog, tried in this order
+    '''
+
+    SOFT_RESET              = 0    # SoftReset command, then restore of the register snapshot
+    HARD_RESET              = 1    # Pulse on pin_reset, then restore of the register snapshot
+    REINIT                  = 2    # pcd_init(), then restore of the register snapshot
+
+
+class HealthWatchdog(object):
+    '''
+    Probes the MFRC522 on a schedule and recovers a wedged or vanished chip.
+
+    A probe is one SPI transfer reading VersionReg and the timer registers: a stuck bus reads 0x00 or 0xFF,
+    a chip that went through a brown-out or an unexpected reset lost its timer setup (then every
+    communication with a PICC runs into the timeout). After failure_threshold failed probes in a row the
+    recovery steps (see RecoveryStep) are tried until a probe succeeds again. If all steps fail, the next
+    attempt is made after an exponential backoff.
+
+    The register snapshot restored after a reset is taken with the first successful probe, call
+    take_snapshot() again after changing the configuration (e. g. pcd_set_antenna_gain).
+
+    All SPI transactions of the watchdog are done while holding bus_lock. Callers use the same lock for
+    their operations and wait_healthy() to pause while the MFRC522 is down instead of running into timeouts.
+
+    Example:
+    >>> rfid.pcd_init()
+    >>> watchdog = HealthWatchdog(rfid, bus_lock=lock)
+    >>> watchdog.start()
+    >>> while watchdog.wait_healthy():
+    >>>     with lock:
+    >>>         if rfid.picc_is_new_card_present():
+    >>>             ...
+    '''
+
+    _PROBE_REGISTERS = (PCD_Register.VersionReg, PCD_Register.TModeReg, PCD_Register.TPrescalerReg)
+
+    def __init__(self, rfid, interval=1.0, failure_threshold=2, retry_interval=0.05, backoff=0.5, max_backoff=60.0, bus_lock=None, callback=None, clock=time.monotonic):
+        '''
+        Create a new HealthWatchdog
+
+        @param rfid: The MFRC522 instance (pcd_init() must have been called)
+        @param interval: Interval in seconds between two probes of a healthy MFRC522 (default = 1.0)
+        @param failure_threshold: Number of failed probes in a row that start the recovery (default = 2)
+        @param retry_interval: Interval in seconds between the probes after a failed probe (default = 0.05)
+        @param backoff: Seconds to wait after the first failed recovery, doubled after each further failed recovery (default = 0.5)
+        @param max_backoff: Maximum seconds to wait between two recoveries (default = 60.0)
+        @param bus_lock: Lock that is held for the SPI transactions of the watchdog (default = new threading.RLock)
+        @param callback: Optional function called with the new HealthState on each state change
+        @param clock: Function returning the current time in seconds (default = time.monotonic)
+        '''
+        self.rfid = rfid
+        self.interval = interval
+        self.failure_threshold = max(1, failure_threshold)
+        self.retry_interval = retry_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bus_lock = bus_lock if bus_lock else threading.RLock()
+        self.callback = callback
+        self.clock = clock
+
+        self.state = HealthState.HEALTHY
+        self.snapshot = None
+        self.version = None
+        self.failures = 0                   # Failed probes in a row
+        self._backoff = backoff
+        self._next_attempt = None
+        self._down_since = None
+        self._healthy = threading.Event()
+        self._healthy.set()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Statistics
+        self.probes = 0
+        self.failed_probes = 0
+        self.recovery_attempts = 0
+        self.recoveries = 0
+        self.step_recoveries = {step: 0 for step in RecoveryStep}
+        self.last_recovery_step = None
+        self.downtime = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        '''
+        Starts the background thread probing the MFRC522
+        '''
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='mfrc522-health-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        '''
+        Stops the background thread
+
+        @param wait: Block until the thread terminated (default = True)
+        '''
+        if self._thread is None:
+            return
+        self._stop.set()
+        if wait:
+            self._thread.join()
+        self._thread = None
+
+    @property
+    def healthy(self):
+        return self.state == HealthState.HEALTHY
+
+    def wait_healthy(self, timeout=None):
+        '''
+        Blocks while the MFRC522 is not healthy
+
+        @param timeout: Optional timeout in seconds
+        @return: True if the MFRC522 is healthy, False on timeout
+        '''
+        return self._healthy.wait(timeout)
+
+    def take_snapshot(self):
+        '''
+        Saves the current register configuration, it is restored after a reset
+
+        @return: False if the MFRC522 does not answer
+        '''
+        with self.bus_lock:
+            version = self.rfid.pcd_read_register(PCD_Register.VersionReg)
+            if version in (0x00, 0xFF):
+                return False
+            self.snapshot = self.rfid.pcd_save_registers()
+            self.version = version
+        return True
+
+    def next_poll_delay(self):
+        '''
+        @return: Seconds to wait before the next call to poll()
+        '''
+        if self.state == HealthState.FAILED:
+            return max(0.0, self._next_attempt - self.clock())
+        if self.state == HealthState.HEALTHY:
+            return self.interval
+        return self.retry_interval
+
+    def poll(self):
+        '''
+        Performs one step: probes the MFRC522 and starts the recovery if needed
+
+        @return: The HealthState
+        '''
+        if self.state == HealthState.FAILED:
+            if self.clock() >= self._next_attempt:
+                self._recover()
+            return self.state
+
+        if self._probe():
+            self.failures = 0
+            if self.snapshot is None:
+                self.take_snapshot()
+            self._set_state(HealthState.HEALTHY)
+            return self.state
+
+        self.failed_probes += 1
+        self.failures += 1
+        if self.failures < self.failure_threshold:
+            self._set_state(HealthState.SUSPECT)
+        else:
+            self._recover()
+        return self.state
+
+    def get_stats(self):
+        '''
+        @return: dict with the state, the number of probes, failed probes, recovery attempts and recoveries (per step) and the downtime (seconds)
+        '''
+        downtime = self.downtime
+        if self._down_since is not None:
+            downtime += self.clock() - self._down_since
+        return {
+            'state': self.state.name,
+            'version': self.version,
+            'probes': self.probes,
+            'failed_probes': self.failed_probes,
+            'recovery_attempts': self.recovery_attempts,
+            'recoveries': self.recoveries,
+            'recoveries_by_step': {step.name: count for step, count in self.step_recoveries.items()},
+            'last_recovery_step': self.last_recovery_step.name if self.last_recovery_step else None,
+            'downtime': downtime,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll()
+            self._stop.wait(self.next_poll_delay())
+
+    def _probe(self):
+        self.probes += 1
+        try:
+            with self.bus_lock:
+                version, t_mode, t_prescaler = self.rfid.pcd_read_registers(self._PROBE_REGISTERS)
+        except Exception:
+            logger_debug.exception('Health probe failed')
+            return False
+        if version in (0x00, 0xFF):                 # Stuck bus, the MFRC522 does not answer
+            return False
+        if self.snapshot is None:
+            return True
+        return (version == self.version and t_mode == self.snapshot.values[PCD_Register.TModeReg]
+                and t_prescaler == self.snapshot.values[PCD_Register.TPrescalerReg])
+
+    def _recover(self):
+        self._set_state(HealthState.RECOVERING)
+        self.recovery_attempts += 1
+        for step in RecoveryStep:
+            if self._run_step(step):
+                logger_debug.info(_F('MFRC522 recovered ({})', step.name))
+                self.recoveries += 1
+                self.step_recoveries[step] += 1
+                self.last_recovery_step = step
+                self.failures = 0
+                self._backoff = self.backoff
+                if self.snapshot is None:
+                    self.take_snapshot()
+                self._set_state(HealthState.HEALTHY)
+                return
+
+        logger_debug.warn(_F('MFRC522 recovery failed, next attempt in {:.1f}s', self._backoff))
+        self._next_attempt = self.clock() + self._backoff
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+        self._set_state(HealthState.FAILED)
+
+    def _run_step(self, step):
+        rfid = self.rfid
+        try:
+            with self.bus_lock:
+                if step == RecoveryStep.REINIT:
+                    rfid.pcd_init()
+                elif self.snapshot is None:             # Nothing to restore, only pcd_init() helps
+                    return False
+                elif step == RecoveryStep.SOFT_RESET and not rfid.pcd_reset():
+                    return False
+                elif step == RecoveryStep.HARD_RESET and not rfid.pcd_hard_reset():
+                    return False
+                if self.snapshot is not None:
+                    rfid.pcd_restore_registers(self.snapshot)
+        except Exception:
+            logger_debug.exception(_F('Recovery step {} failed', step.name))
+            return False
+        return self._probe()
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        now = self.clock()
+        if state == HealthState.HEALTHY:
+            self.downtime += now - self._down_since
+            self._down_since = None
+            self._healthy.set()
+        elif self.state == HealthState.HEALTHY:
+            self._down_since = now
+            self._healthy.clear()
+        logger_debug.debug(_F('Health state: {} -> {}', self.state.name, state.name))
+        self.state = state
+        if self.callback:
+            self.callback(state)
@@ -0,0 +1,211 @@
+'''
+Duty-cycled low-power card detection
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import logging
+import threading
+import time
+
+from .mfrc522 import PCD_Register
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+
+class LowPowerDetector(object):
+    '''
+    Looks for a PICC with short REQA probes and keeps the MFRC522 in soft power down (oscillator and antenna
+    field off) in between, e. g. for battery powered readers.
+
+    Each probe wakes the MFRC522 up (waiting for the PowerDown bit to clear, see pcd_soft_power_up), sends
+    REQA with a short timeout (probe_timeout instead of the 25ms of pcd_init) and powers it down again if no
+    PICC answered. The pause between two probes follows from the measured on-time of the last probe and the
+    target duty cycle (on-time / period), limited by max_interval (the worst case detection latency).
+
+    If a PICC is detected the MFRC522 stays powered up with the timeout of pcd_init restored, so the PICC
+    can be selected right away. The next poll() continues with the low-power probes.
+
+    Example:
+    >>> detector = LowPowerDetector(rfid, duty_cycle=0.01, max_interval=0.3)
+    >>> while True:
+    >>>     if detector.wait_for_card():
+    >>>         status, uid = rfid.picc_select()
+    >>>         rfid.picc_halt_a()
+    '''
+
+    def __init__(self, rfid, duty_cycle=0.02, max_interval=0.5, probe_timeout=0.001, wakeup=False, bus_lock=None, clock=time.monotonic):
+        '''
+        Create a new LowPowerDetector
+
+        @param rfid: The MFRC522 instance (pcd_init() must have been called)
+        @param duty_cycle: Target fraction of the time the MFRC522 is powered up (default = 0.02)
+        @param max_interval: Maximum pause in seconds between two probes (default = 0.5)
+        @param probe_timeout: Timeout in seconds for the answer to REQA (default = 0.001, the ATQA follows after about 0.1ms)
+        @param wakeup: Probe with WUPA instead of REQA, then PICCs in state HALT are detected as well (default = False)
+        @param bus_lock: Lock that is held for the SPI transactions of a probe (default = new threading.RLock)
+        @param clock: Function returning the current time in seconds (default = time.monotonic)
+        '''
+        self.rfid = rfid
+        self.duty_cycle = duty_cycle
+        self.max_interval = max_interval
+        self.probe_timeout = probe_timeout
+        self.wakeup = wakeup
+        self.bus_lock = bus_lock if bus_lock else threading.RLock()
+        self.clock = clock
+
+        self.powered_down = False
+        self._reload = None                 # [TReloadRegH, TReloadRegL] of the normal timeout
+        self._probe_reload = None           # [TReloadRegH, TReloadRegL] of the probe timeout
+        self._probe_timer = False           # The probe timeout is set
+        self._last_probe_end = None
+        self._last_on_time = None
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        '''
+        Resets the statistics
+        '''
+        self.probes = 0
+        self.detections = 0
+        self.wakeup_failures = 0
+        self.on_time = 0.0
+        self.last_detection_latency = None
+        self.max_detection_latency = None
+        self.total_detection_latency = 0.0
+        self.measured_detections = 0        # Detections with a previous probe (latency known)
+        self.stats_start = None
+
+    def poll(self):
+        '''
+        Performs one probe
+
+        @return: True if a PICC answered (the MFRC522 stays powered up)
+        '''
+        rfid = self.rfid
+        with self.bus_lock:
+            start = self.clock()
+            if self.powered_down:
+                self.powered_down = False
+                if not rfid.pcd_soft_power_up():
+                    self.wakeup_failures += 1
+                    logger_debug.warn('MFRC522 did not wake up from soft power down')
+            self._set_probe_timer(True)
+            detected = rfid.picc_is_card_present() if self.wakeup else rfid.picc_is_new_card_present()
+            if detected:
+                self._set_probe_timer(False)
+            else:
+                rfid.pcd_soft_power_down()
+                self.powered_down = True
+            end = self.clock()
+
+        if self.stats_start is None:
+            self.stats_start = start
+        self.probes += 1
+        self._last_on_time = end - start
+        self.on_time += self._last_on_time
+        if detected:
+            self.detections += 1
+            if self._last_probe_end is not None:
+                # The PICC entered the field at some point after the previous probe
+                latency = end - self._last_probe_end
+                self.last_detection_latency = latency
+                self.total_detection_latency += latency
+                self.measured_detections += 1
+                if self.max_detection_latency is None or latency > self.max_detection_latency:
+                    self.max_detection_latency = latency
+        self._last_probe_end = end
+        return detected
+
+    def next_poll_delay(self):
+        '''
+        @return: Seconds to wait before the next call to poll()
+        '''
+        if self._last_on_time is None or self.duty_cycle >= 1:
+            return 0.0
+        return min(self.max_interval, self._last_on_time * (1 - self.duty_cycle) / self.duty_cycle)
+
+    def wait_for_card(self, cancel_event=None, timeout=None):
+        '''
+        Probes until a PICC is detected
+
+        @param cancel_event: Optional threading.Event, setting it cancels waiting
+        @param timeout: Optional timeout in seconds
+        @return: True if a PICC was detected, False if waiting was canceled or timed out
+        '''
+        cancel_event = cancel_event if cancel_event else threading.Event()
+        deadline = None if timeout is None else self.clock() + timeout
+        while not self.poll():
+            delay = self.next_poll_delay()
+            if deadline is not None:
+                delay = min(delay, deadline - self.clock())
+                if delay <= 0:
+                    return False
+            if cancel_event.wait(delay):
+                return False
+        return True
+
+    def power_up(self):
+        '''
+        Leaves the low-power mode: powers the MFRC522 up and restores the timeout of pcd_init
+
+        @return: False if the MFRC522 did not wake up
+        '''
+        with self.bus_lock:
+            ready = True
+            if self.powered_down:
+                self.powered_down = False
+                ready = self.rfid.pcd_soft_power_up()
+            self._set_probe_timer(False)
+        return ready
+
+    def get_stats(self):
+        '''
+        @return: dict with the number of probes, detections and wake-up failures, the on-time (seconds) and the measured
+                 duty cycle, and the detection latencies (seconds, upper bounds: time since the previous probe)
+        '''
+        elapsed = self.clock() - self.stats_start if self.stats_start is not None else 0.0
+        return {
+            'probes': self.probes,
+            'detections': self.detections,
+            'wakeup_failures': self.wakeup_failures,
+            'on_time': self.on_time,
+            'avg_on_time': self.on_time / self.probes if self.probes else None,
+            'duty_cycle': self.on_time / elapsed if elapsed > 0 else None,
+            'last_detection_latency': self.last_detection_latency,
+            'max_detection_latency': self.max_detection_latency,
+            'avg_detection_latency': self.total_detection_latency / self.measured_detections if self.measured_detections else None,
+        }
+
+    def _set_probe_timer(self, probe):
+        if probe == self._probe_timer:
+            return
+        if self._reload is None:
+            t_mode, t_prescaler, reload_h, reload_l = self.rfid.pcd_read_registers(
+                [PCD_Register.TModeReg, PCD_Register.TPrescalerReg, PCD_Register.TReloadRegH, PCD_Register.TReloadRegL])
+            # f_timer = 13.56 MHz / (2*TPreScaler+1), see pcd_init
+            f_timer = 13.56e6 / (2 * (((t_mode & 0x0F) << 8) | t_prescaler) + 1)
+            ticks = min(0xFFFF, max(1, int(round(self.probe_timeout * f_timer))))
+            self._reload = [reload_h, reload_l]
+            self._probe_reload = [ticks >> 8, ticks & 0xFF]
+
+        old, new = (self._reload, self._probe_reload) if probe else (self._probe_reload, self._reload)
+        for reg, old_value, value in zip((PCD_Register.TReloadRegH, PCD_Register.TReloadRegL), old, new):
+            if value != old_value:
+                self.rfid.pcd_write_register(reg, value)
+        self._probe_timer = probe
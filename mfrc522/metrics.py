@@ -0,0 +1,151 @@
+'''
+Performance counters and latency histograms of the MFRC522 driver.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import bisect
+import functools
+import time
+
+
+# Upper bounds (seconds) of the latency histogram buckets, the last bucket is unbounded
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class LatencyHistogram(object):
+    '''
+    Histogram with fixed buckets, observations are counted in the first bucket with value <= upper bound
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        '''
+        @return: dict with count, sum, max and the buckets as list of (upper bound, count) - not cumulative, the last bound is inf
+        '''
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'buckets': list(zip(self.buckets + (float('inf'),), self.counts)),
+        }
+
+
+class ReaderMetrics(object):
+    '''
+    Counters and latency histograms of one MFRC522, updated by the driver (see MFRC522.metrics).
+
+    The counters are plain attributes updated without locks, they are meant to be written by the thread
+    using the reader and read from anywhere - a snapshot taken from another thread may be slightly inconsistent.
+
+    Example:
+    >>> rfid = MFRC522()
+    >>> rfid.picc_is_new_card_present()
+    >>> print(rfid.metrics.snapshot())
+    >>> rfid.metrics.reset()
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        '''
+        @param buckets: Upper bounds in seconds of the latency histogram buckets (default = DEFAULT_BUCKETS)
+        '''
+        self.buckets = tuple(buckets)
+        # Health, not cleared by reset()
+        self.version = None             # Last value read from the VersionReg (see MFRC522.pcd_get_version)
+        self.version_time = None        # time.monotonic() of the last VersionReg read
+        self.last_select = None         # time.monotonic() of the last successful picc_select
+        self.reset()
+
+    def reset(self):
+        self.spi_transfers = 0
+        self.spi_bytes = 0
+        self.register_reads = 0
+        self.register_writes = 0
+        self.frames = {}                # PICC command byte -> number of frames sent with that command (data frames are not counted)
+        self.timeouts = 0
+        self.protocol_errors = 0        # BufferOvfl, ParityErr or ProtocolErr
+        self.collisions = 0
+        self.crc_errors = 0
+        self.nacks = 0
+        self.operations = {}            # Operation name -> LatencyHistogram
+        self.started = time.monotonic()
+
+    def count_frame(self, command):
+        self.frames[command] = self.frames.get(command, 0) + 1
+
+    def observe(self, operation, seconds):
+        histogram = self.operations.get(operation)
+        if histogram is None:
+            histogram = self.operations[operation] = LatencyHistogram(self.buckets)
+        histogram.observe(seconds)
+
+    def snapshot(self):
+        '''
+        @return: dict with all counters, the frames per PICC command (by name) and the latency histograms per operation
+        '''
+        from .mfrc522 import PICC_Command
+        names = {command.value: command.name for command in PICC_Command}
+
+        return {
+            'uptime': time.monotonic() - self.started,
+            'spi_transfers': self.spi_transfers,
+            'spi_bytes': self.spi_bytes,
+            'register_reads': self.register_reads,
+            'register_writes': self.register_writes,
+            'frames': {names.get(command, '{:#04x}'.format(command)): count for command, count in list(self.frames.items())},
+            'timeouts': self.timeouts,
+            'protocol_errors': self.protocol_errors,
+            'collisions': self.collisions,
+            'crc_errors': self.crc_errors,
+            'nacks': self.nacks,
+            'operations': {name: histogram.snapshot() for name, histogram in list(self.operations.items())},
+            'version': self.version,
+            'version_time': self.version_time,
+            'last_select': self.last_select,
+        }
+
+
+def timed(func):
+    '''
+    Decorator for the public operations of MFRC522: observes the duration of each call in the latency
+    histogram of the operation (named like the method) if metrics are enabled.
+    '''
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        metrics = self.metrics
+        if metrics is None:
+            return func(self, *args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            metrics.observe(name, time.perf_counter() - start)
+    return wrapper
@@ -118,14 +118,24 @@ MIFARE Ultralight C (MF0ICU2):
 '''
 
 import logging
-from time import sleep
+from time import (
+    sleep,
+    monotonic
+)
 
-import RPi.GPIO as GPIO
 from enum import Enum
-import spidev
 
 from .utils import format_hex
 from .utils import FormatString as _F
+from .metrics import (
+    ReaderMetrics,
+    timed
+)
+from .trace import (
+    LoggingTracer,
+    TraceDirection
+)
+from .flight_recorder import FlightRecorder
 
 
 
@@ -450,13 +460,36 @@ class Uid(object):
     '''
     A struct used for passing the UID of a PICC.
     '''
-    size = 0            # Number of bytes in the UID. 4, 7 or 10.
-    uid_byte = [0] * 10
-    sak = None          # The SAK (Select acknowledge) byte returned from the PICC after successful selection.
+    
+    def __init__(self, uid_bytes=None, sak=None):
+        '''
+        Create a new Uid
+        
+        @param uid_bytes: Optional list of the 4, 7 or 10 UID bytes
+        @param sak: Optional SAK byte
+        '''
+        self.size = 0               # Number of bytes in the UID. 4, 7 or 10.
+        self.uid_byte = [0] * 10
+        self.sak = sak              # The SAK (Select acknowledge) byte returned from the PICC after successful selection.
+        if uid_bytes:
+            self.size = len(uid_bytes)
+            self.uid_byte[:self.size] = uid_bytes
     
     def uid(self):
         return self.uid_byte[:self.size]
     
+    def to_bytes(self):
+        '''
+        @return: The UID bytes as immutable bytes object (e. g. usable as dictionary key)
+        '''
+        return bytes(self.uid())
+    
+    def copy(self):
+        '''
+        @return: A copy of this Uid
+        '''
+        return Uid(self.uid(), self.sak)
+    
     def to_num(self):
         n = 0
         uid = self.uid()
@@ -511,6 +544,84 @@ class MIFARE_Key(object):
     def __str__(self):
         return '<MIFARE_Key: [{}]>'.format(format_hex(self.key_byte))
 
+class RegisterSnapshot(object):
+    '''
+    The configuration registers of a MFRC522 (IRQ enables, CRC preset, framing, modulation, gain and timer),
+    taken with MFRC522.pcd_save_registers() and written back with MFRC522.pcd_restore_registers().
+
+    A snapshot can be converted to a dict of register names and values (e. g. to store a tuned antenna profile
+    as JSON and apply it on other units). A snapshot may contain only some of the registers.
+    '''
+
+    # Configuration registers in restore order, the antenna driver (TxControlReg) is enabled last
+    REGISTERS = (
+        PCD_Register.ComIEnReg,
+        PCD_Register.DivIEnReg,
+        PCD_Register.WaterLevelReg,
+        PCD_Register.ModeReg,
+        PCD_Register.TxModeReg,
+        PCD_Register.RxModeReg,
+        PCD_Register.TxASKReg,
+        PCD_Register.TxSelReg,
+        PCD_Register.RxSelReg,
+        PCD_Register.RxThresholdReg,
+        PCD_Register.DemodReg,
+        PCD_Register.MfTxReg,
+        PCD_Register.MfRxReg,
+        PCD_Register.ModWidthReg,
+        PCD_Register.RFCfgReg,
+        PCD_Register.GsNReg,
+        PCD_Register.CWGsPReg,
+        PCD_Register.ModGsPReg,
+        PCD_Register.TModeReg,
+        PCD_Register.TPrescalerReg,
+        PCD_Register.TReloadRegH,
+        PCD_Register.TReloadRegL,
+        PCD_Register.TxControlReg,
+    )
+
+    def __init__(self, values=None):
+        '''
+        Create a new RegisterSnapshot
+
+        @param values: Optional dict PCD_Register -> value
+        '''
+        self.values = dict(values) if values else {}
+
+    def to_dict(self):
+        '''
+        @return: dict register name -> value (in restore order)
+        '''
+        return {reg.name: self.values[reg] for reg in self._ordered()}
+
+    @classmethod
+    def from_dict(cls, registers):
+        '''
+        Creates a snapshot from a dict returned by to_dict()
+
+        @param registers: dict register name -> value
+        @return: RegisterSnapshot
+        @raise ValueError: If a register is not a configuration register or a value is not a byte
+        '''
+        values = {}
+        for name, value in registers.items():
+            reg = PCD_Register.__members__.get(name)
+            if reg not in cls.REGISTERS:
+                raise ValueError('Not a configuration register: {}'.format(name))
+            if not isinstance(value, int) or not 0 <= value <= 0xFF:
+                raise ValueError('Invalid value for {}: {!r}'.format(name, value))
+            values[reg] = value
+        return cls(values)
+
+    def _ordered(self):
+        return [reg for reg in self.REGISTERS if reg in self.values]
+
+    def __eq__(self, other):
+        return isinstance(other, RegisterSnapshot) and self.values == other.values
+
+    def __str__(self):
+        return '<RegisterSnapshot: {}>'.format(', '.join('{}: {:#04x}'.format(reg.name, self.values[reg]) for reg in self._ordered()))
+
 
 #====================================================================================
 # MFRC522
@@ -521,6 +632,28 @@ class MFRC522(object):
     TODO
     '''
     
+    # Register setup of pcd_init: (register, value, reset value). After a confirmed reset only the registers
+    # that differ from their reset value are written. Each write is one SPI transfer: the MFRC522 writes all
+    # bytes of a transfer to the same address, so several registers cannot be batched into one transfer.
+    _INIT_REGISTERS = (
+        (PCD_Register.TxModeReg, 0x00, 0x00),       # Reset baud rates
+        (PCD_Register.RxModeReg, 0x00, 0x00),
+        (PCD_Register.ModWidthReg, 0x26, 0x26),     # Reset ModWidthReg
+        # When communicating with a PICC we need a timeout if something goes wrong.
+        # f_timer = 13.56 MHz / (2*TPreScaler+1) where TPreScaler = [TPrescaler_Hi:TPrescaler_Lo].
+        # TPrescaler_Hi are the four low bits in TModeReg. TPrescaler_Lo is TPrescalerReg.
+        (PCD_Register.TModeReg, 0x80, 0x00),        # TAuto=1; timer starts automatically at the end of the transmission in all communication modes at all speeds
+        (PCD_Register.TPrescalerReg, 0xA9, 0x00),   # TPreScaler = TModeReg[3..0]:TPrescalerReg, ie 0x0A9 = 169 => f_timer=40kHz, ie a timer period of 25 micro seconds.
+        (PCD_Register.TReloadRegH, 0x03, 0x00),     # Reload timer with 0x3E8 = 1000, ie 25ms before timeout.
+        (PCD_Register.TReloadRegL, 0xE8, 0x00),
+        (PCD_Register.TxASKReg, 0x40, 0x00),        # Default 0x00. Force a 100 % ASK modulation independent of the ModGsPReg register setting
+        (PCD_Register.ModeReg, 0x3D, 0x3F),         # Default 0x3F. Set the preset value for the CRC coprocessor for the CalcCRC command to 0x6363 (ISO 14443-3 part 6.2.4)
+    )
+    
+    # Readiness polling after a reset (the datasheet gives the crystal start-up time + 37.74us)
+    _READY_TIMEOUT = 0.15
+    _READY_POLL_INTERVAL = 0.0005
+    
     # Firmware data for self-test
     # Reference values based on firmware version
     # Hint: if needed, you can remove unused self-test data to save flash memory
@@ -571,7 +704,7 @@ class MFRC522(object):
         0x56, 0x9A, 0x98, 0x82, 0x26, 0xEA, 0x2A, 0x62]
 
 
-    def __init__(self, bus=0, device=0, speed=1000000, pin_reset=25, pin_ce=0, pin_irq=24, pin_mode=GPIO.BCM):
+    def __init__(self, bus=0, device=0, speed=1000000, pin_reset=25, pin_ce=0, pin_irq=24, pin_mode=None, spi=None, metrics=True, tracer=None, flight_recorder=256):
         '''
         Create a new MFRC522 instance
         
@@ -581,10 +714,13 @@ class MFRC522(object):
         @param pin_reset: The GPIO reset pin number (default = 25)
         @param pin_ce: The GPIO chip select pin number (default = 0, not connected)
         @param pin_irq: The GPIO IRQ pin number (default = 24)
-        @param pin_mode: GPIO pin numbering mode (default = GPIO.BCM)
+        @param pin_mode: GPIO pin numbering mode (default = None, GPIO.BCM)
+        @param spi: Optional SPI transport with the interface of spidev.SpiDev (open, close, xfer2, max_speed_hz), e. g. a SimulatedSpi (default = spidev.SpiDev(), created on first use)
+        @param metrics: Collect counters and latency histograms in self.metrics (default = True, see ReaderMetrics)
+        @param tracer: Optional Tracer receiving each SPI transaction (default = a LoggingTracer if the logger 'mfrc522.spi' is enabled for DEBUG, otherwise None)
+        @param flight_recorder: Number of recent transactions and PICC frames kept in self.flight_recorder, 0 to disable (default = 256, see FlightRecorder)
         '''
         self.__log_trace = logger_trace.isEnabledFor(logging.DEBUG)
-        self.__log_spi = logger_spi.isEnabledFor(logging.DEBUG)
         self.__log_debug = logger_debug.isEnabledFor(logging.DEBUG)
         
         self.bus = bus
@@ -595,7 +731,39 @@ class MFRC522(object):
         self.pin_irq = pin_irq
         self.pin_mode = pin_mode
         
-        self.spi = spidev.SpiDev()
+        # RPi.GPIO and spidev are only imported when they are used, e. g. not with a SimulatedSpi and no pins
+        self.gpio = None
+        self._spi = spi
+        self.metrics = ReaderMetrics() if metrics else None
+        if tracer is None and logger_spi.isEnabledFor(logging.DEBUG):
+            tracer = LoggingTracer(logger_spi)
+        self.tracer = tracer
+        self.flight_recorder = FlightRecorder(flight_recorder) if flight_recorder else None
+        self._frame_command = 0
+
+
+    @property
+    def spi(self):
+        '''
+        The SPI transport, a spidev.SpiDev is created on first use if none was given
+        '''
+        if self._spi is None:
+            import spidev
+            self._spi = spidev.SpiDev()
+        return self._spi
+
+    @spi.setter
+    def spi(self, spi):
+        self._spi = spi
+
+    def _uses_gpio(self):
+        return self.pin_reset != 0 or self.pin_ce != 0 or self.pin_irq != 0
+
+    def _import_gpio(self):
+        if self.gpio is None:
+            import RPi.GPIO
+            self.gpio = RPi.GPIO
+        return self.gpio
 
 
     #====================================================================================
@@ -609,16 +777,46 @@ class MFRC522(object):
         @param data: List of bytes to write to the pcd
         @return: List of bytes read from the pcd
         '''
-        if self.pin_ce != 0:
-            GPIO.output(self.pin_ce, 0)     # release chip-select
-        rx = self.spi.xfer2(data)            # MSB == 0 is for writing. LSB is not used in address. Datasheet section 8.1.2.3.
-        if self.pin_ce != 0:
-            GPIO.output(self.pin_ce, 1)     # reactivated chip-select
+        spi = self._spi
+        if spi is None:
+            spi = self.spi                  # Creates the spidev.SpiDev
+        # The chip-select pin is set up by pcd_init(), a transfer before (e. g. on a given transport) goes without it
+        gpio = self.gpio if self.pin_ce != 0 else None
+        if gpio is not None:
+            gpio.output(self.pin_ce, 0)     # release chip-select
+        rx = spi.xfer2(data)                # MSB == 0 is for writing. LSB is not used in address. Datasheet section 8.1.2.3.
+        if gpio is not None:
+            gpio.output(self.pin_ce, 1)     # reactivated chip-select
+        
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.spi_transfers += 1
+            metrics.spi_bytes += len(data)
+            if data[0] & 0x80:
+                metrics.register_reads += len(data) - 1
+            else:
+                metrics.register_writes += len(data) - 1
         
-        if self.__log_spi:
-            logger_spi.debug(_F(' receive [{}]', ' '.join(format(x, '#04x') for x in rx)))
+        recorder = self.flight_recorder
+        if recorder is not None:
+            recorder.record_transfer(monotonic(), data, rx)
+        
+        tracer = self.tracer
+        if tracer is not None:
+            if data[0] & 0x80:
+                tracer.record(monotonic(), TraceDirection.READ, data[0] & 0x7E, rx[1:])
+            else:
+                tracer.record(monotonic(), TraceDirection.WRITE, data[0], data[1:])
         return rx
     
+    def trace_irq(self):
+        '''
+        Records an edge on the IRQ pin in the trace (called by the GPIO event callbacks)
+        '''
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.record(monotonic(), TraceDirection.IRQ, 0, [])
+    
     def pcd_write_register(self, reg, val):
         '''
         Writes a byte to the specified register in the MFRC522 chip.
@@ -627,9 +825,6 @@ class MFRC522(object):
         @param reg: The register to write to. One of the PCD_Register enums
         @param val: The value to write
         '''
-        if self.__log_spi:
-            logger_spi.debug(_F('write_register \'{reg_name}\': [{reg_val:#04x} {val:#04x}]', reg_name=reg.name, reg_val=reg.value, val=val))
-        
         self._spi_transfer([reg.value, val])
 
     def pcd_write_register2(self, reg, vals):
@@ -640,9 +835,6 @@ class MFRC522(object):
         @param reg: The register to write to. One of the PCD_Register enums
         @param vals: The list of values to write
         '''
-        if self.__log_spi:
-            logger_spi.debug(_F('write_register2 \'{reg_name}\': [{reg_val:#04x} {values}]', reg_name=reg.name, reg_val=reg.value, values=format_hex(vals)))
-        
         self._spi_transfer([reg.value] + vals)
 
     def pcd_read_register(self, reg):
@@ -655,12 +847,7 @@ class MFRC522(object):
         '''
         # MSB == 1 is for reading. LSB is not used in address. Datasheet section 8.1.2.3.
         # Send 0 to stop reading.
-        result = self._spi_transfer([reg.value | 0x80, 0])[1]
-
-        if self.__log_spi:
-            logger_spi.debug(_F('read_register \'{reg_name}\': {reg_val:#04x} result: [{result:#04x}]', reg_name=reg.name, reg_val=reg.value, result=result))
-
-        return result
+        return self._spi_transfer([reg.value | 0x80, 0])[1]
 
     def pcd_read_register2(self, reg, count, rx_align):
         '''
@@ -694,8 +881,7 @@ class MFRC522(object):
         
         tx.append(0)                            # Read the final byte. Send 0 to stop reading.
         
-        rx = self._spi_transfer(tx)
-        rx.pop(0)                               # Remove the first read byte (from initializing reading the register)
+        rx = self._spi_transfer(tx)[1:]         # Remove the first read byte (from initializing reading the register)
 
         if rx_align:                            # Only update bit positions rxAlign..7 in values[0]
             # Create bit mask for bit positions rxAlign..7
@@ -703,11 +889,22 @@ class MFRC522(object):
             # Apply mask to both current value of values[0] and the new data in value.
             rx[0] = (rx[0] & ~mask) | (rx[0] & mask)        # values[0] = (values[0] & ~mask) | (value & mask);
         
-        if self.__log_spi:
-            logger_spi.debug(_F('read_register2 \'{reg_name}\': {reg_val:#04x}, count: {count}, rx_align: {rx_align}, result: [{values}]', reg_name=reg.name, reg_val=reg.value, count=count, rx_align=rx_align, values=format_hex(rx)))
-        
         return rx
 
+    def pcd_read_registers(self, regs):
+        '''
+        Reads several registers in one SPI transfer: every byte of a read transfer is an address,
+        the value of an address is returned with the next byte. See datasheet section 8.1.2.1.
+        
+        @param regs: List of PCD_Register enums
+        @return: List of the register values (same order as regs)
+        '''
+        if not regs:
+            return []
+        tx = [reg.value | 0x80 for reg in regs]     # MSB == 1 is for reading. Datasheet section 8.1.2.3.
+        tx.append(0)                                # Send 0 to stop reading.
+        return self._spi_transfer(tx)[1:]
+
     def pcd_set_register_bitmask(self, reg, mask):
         '''
         Sets the bits given in mask in register reg..
@@ -770,6 +967,7 @@ class MFRC522(object):
     # Functions for manipulating the MFRC522
     #====================================================================================
 
+    @timed
     def pcd_init(self):
         '''
         Initializes the MFRC522 chip
@@ -785,15 +983,18 @@ class MFRC522(object):
         self.spi.max_speed_hz = self.speed
         
         # Setup GPIO
-        if self.__log_debug:
-            logger_debug.info(_F('Init GPIO with mode={mode}, pin_reset={pin_reset}, pin_ce={pin_ce}, pin_irq={pin_irq}', mode=self.pin_mode, pin_reset=self.pin_reset, pin_ce=self.pin_ce, pin_irq=self.pin_irq))
-        GPIO.setmode(self.pin_mode)
-        if self.pin_irq != 0:
-            GPIO.setup(self.pin_irq, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-        #GPIO.add_event_detect(self.pin_irq, GPIO.FALLING, callback=self.IRQ_Callback)
-        if self.pin_ce != 0:
-            GPIO.setup(self.pin_ce, GPIO.OUT)
-            GPIO.output(self.pin_ce, 1)
+        GPIO = self._import_gpio() if self._uses_gpio() else None
+        if GPIO is not None:
+            pin_mode = self.pin_mode if self.pin_mode is not None else GPIO.BCM
+            if self.__log_debug:
+                logger_debug.info(_F('Init GPIO with mode={mode}, pin_reset={pin_reset}, pin_ce={pin_ce}, pin_irq={pin_irq}', mode=pin_mode, pin_reset=self.pin_reset, pin_ce=self.pin_ce, pin_irq=self.pin_irq))
+            GPIO.setmode(pin_mode)
+            if self.pin_irq != 0:
+                GPIO.setup(self.pin_irq, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            #GPIO.add_event_detect(self.pin_irq, GPIO.FALLING, callback=self.IRQ_Callback)
+            if self.pin_ce != 0:
+                GPIO.setup(self.pin_ce, GPIO.OUT)
+                GPIO.output(self.pin_ce, 1)
 
         # If a valid pin number has been set, pull device out of power down / reset state.
         hard_reset = False
@@ -803,36 +1004,22 @@ class MFRC522(object):
             if GPIO.input(self.pin_reset) == GPIO.LOW:          # The MFRC522 chip is in power down mode.
                 if self.__log_debug:
                     logger_debug.debug('MFRC522 is in power down mode. Trigger a hard reset')
-                GPIO.setup(self.pin_reset, GPIO.OUT)            # Now set the resetPowerDownPin as digital output.
-                GPIO.output(self.pin_reset, 0)                  # Make shure we have a clean LOW state.
-                usleep(2)                                       # 8.8.1 Reset timing requirements says about 100ns. Let us be generous: 2μsl
-                GPIO.output(self.pin_reset, 1)                  # Exit power down mode. This triggers a hard reset.
-                # Section 8.8.2 in the datasheet says the oscillator start-up time is the start up time of the crystal + 37,74μs. Let us be generous: 50ms.
-                sleep(0.05)
+                ready = self.pcd_hard_reset()
                 hard_reset = True
     
         if not hard_reset:      # Perform a soft reset if we haven't triggered a hard reset above.
             if self.__log_debug:
                 logger_debug.debug('MFRC522 is not in power down mode. Perform a soft reset')
-            self.pcd_reset()
-        
-        # Reset baud rates
-        self.pcd_write_register(PCD_Register.TxModeReg, 0x00)
-        self.pcd_write_register(PCD_Register.RxModeReg, 0x00)
-        # Reset ModWidthReg
-        self.pcd_write_register(PCD_Register.ModWidthReg, 0x26)
-    
-        # When communicating with a PICC we need a timeout if something goes wrong.
-        # f_timer = 13.56 MHz / (2*TPreScaler+1) where TPreScaler = [TPrescaler_Hi:TPrescaler_Lo].
-        # TPrescaler_Hi are the four low bits in TModeReg. TPrescaler_Lo is TPrescalerReg.
-        self.pcd_write_register(PCD_Register.TModeReg, 0x80)        # TAuto=1; timer starts automatically at the end of the transmission in all communication modes at all speeds
-        self.pcd_write_register(PCD_Register.TPrescalerReg, 0xA9)   # TPreScaler = TModeReg[3..0]:TPrescalerReg, ie 0x0A9 = 169 => f_timer=40kHz, ie a timer period of 25 micro seconds.
-        self.pcd_write_register(PCD_Register.TReloadRegH, 0x03)     # Reload timer with 0x3E8 = 1000, ie 25ms before timeout.
-        self.pcd_write_register(PCD_Register.TReloadRegL, 0xE8)
-        
-        self.pcd_write_register(PCD_Register.TxASKReg, 0x40)        # Default 0x00. Force a 100 % ASK modulation independent of the ModGsPReg register setting
-        self.pcd_write_register(PCD_Register.ModeReg, 0x3D)         # Default 0x3F. Set the preset value for the CRC coprocessor for the CalcCRC command to 0x6363 (ISO 14443-3 part 6.2.4)
-        self.antenna_on()                                                # Enable the antenna driver pins TX1 and TX2 (they were disabled by the reset)
+            ready = self.pcd_reset()
+        
+        # Registers still holding their reset value are only written if the reset was not confirmed
+        for reg, value, reset_value in self._INIT_REGISTERS:
+            if not ready or value != reset_value:
+                self.pcd_write_register(reg, value)
+        if ready:
+            self.pcd_write_register(PCD_Register.TxControlReg, 0x83)    # Enable the antenna driver pins TX1 and TX2 (reset value 0x80)
+        else:
+            self.antenna_on()                                                # Enable the antenna driver pins TX1 and TX2 (they were disabled by the reset)
     
     def pcd_cleanup(self):
         '''
@@ -849,13 +1036,16 @@ class MFRC522(object):
         if self.pin_reset > 0:
             pins.append(self.pin_reset)
         
-        if len(pins) > 0:
-            GPIO.cleanup(pins)
+        if len(pins) > 0 and self.gpio is not None:
+            self.gpio.cleanup(pins)
         self.spi.close()
 
+    @timed
     def pcd_reset(self):
         '''
         Performs a soft reset on the MFRC522 chip and waits for it to be ready again.
+        
+        @return: True if the MFRC522 is ready, False if it did not come back within 150ms
         '''
         if self.__log_trace:
             logger_trace.debug('>> pcd_reset')
@@ -863,12 +1053,48 @@ class MFRC522(object):
         self.pcd_write_register(PCD_Register.CommandReg, PCD_Command.PCD_SoftReset.value)  # Issue the SoftReset command.
         # The datasheet does not mention how long the SoftRest command takes to complete.
         # But the MFRC522 might have been in soft power-down mode (triggered by bit 4 of CommandReg) 
-        # Section 8.8.2 in the datasheet says the oscillator start-up time is the start up time of the crystal + 37,74 micro seconds. Let us be generous: 50ms.
-        for __ in range(3):
-            # Wait for the PowerDown bit in CommandReg to be cleared (max 3x50ms)
-            sleep(0.05)
-            if not (self.pcd_read_register(PCD_Register.CommandReg) & (1 << 4)):
-                break
+        # Section 8.8.2 in the datasheet says the oscillator start-up time is the start up time of the crystal + 37,74 micro seconds.
+        return self._wait_until_ready()
+    
+    @timed
+    def pcd_hard_reset(self):
+        '''
+        Performs a hard reset through the reset pin (pin_reset) and waits for the MFRC522 to be ready again.
+        The GPIO must have been set up by pcd_init().
+        
+        @return: True if the MFRC522 is ready, False if there is no reset pin or it did not come back within 150ms
+        '''
+        if self.__log_trace:
+            logger_trace.debug('>> pcd_hard_reset')
+        
+        if self.pin_reset == 0 or self.gpio is None:
+            return False
+        GPIO = self.gpio
+        GPIO.setup(self.pin_reset, GPIO.OUT)            # Now set the resetPowerDownPin as digital output.
+        GPIO.output(self.pin_reset, 0)                  # Make shure we have a clean LOW state.
+        usleep(2)                                       # 8.8.1 Reset timing requirements says about 100ns. Let us be generous: 2μsl
+        GPIO.output(self.pin_reset, 1)                  # Exit power down mode. This triggers a hard reset.
+        # Section 8.8.2 in the datasheet says the oscillator start-up time is the start up time of the crystal + 37,74μs.
+        return self._wait_until_ready()
+    
+    def _wait_until_ready(self, mask=0x3F, ready=0x20):
+        '''
+        Polls CommandReg until it reads its reset value 0x20 (RcvOff, PowerDown bit cleared, Idle command).
+        A stuck SPI bus (0x00 or 0xFF) is not taken for a ready MFRC522.
+        
+        @param mask: Bits of CommandReg to check (default = 0x3F)
+        @param ready: Value of the masked bits of a ready MFRC522 (default = 0x20)
+        @return: True if the MFRC522 is ready, False on timeout
+        '''
+        deadline = monotonic() + self._READY_TIMEOUT
+        while True:
+            if self.pcd_read_register(PCD_Register.CommandReg) & mask == ready:
+                return True
+            if monotonic() > deadline:
+                if self.__log_debug:
+                    logger_debug.warn('MFRC522 not ready after reset')
+                return False
+            sleep(self._READY_POLL_INTERVAL)
 
     def antenna_on(self):
         '''
@@ -917,6 +1143,40 @@ class MFRC522(object):
             self.pcd_clear_register_bitmask(PCD_Register.RFCfgReg, (0x07<<4))        # clear needed to allow 000 pattern
             self.pcd_set_register_bitmask(PCD_Register.RFCfgReg, mask & (0x07<<4))   # only set RxGain[2:0] bits
 
+    def pcd_save_registers(self):
+        '''
+        Reads the configuration registers (see RegisterSnapshot.REGISTERS) in one SPI transfer.
+        
+        @return: RegisterSnapshot
+        '''
+        if self.__log_trace:
+            logger_trace.debug('>> pcd_save_registers')
+
+        regs = RegisterSnapshot.REGISTERS
+        return RegisterSnapshot(zip(regs, self.pcd_read_registers(regs)))
+
+    def pcd_restore_registers(self, snapshot):
+        '''
+        Writes a RegisterSnapshot back, e. g. after a soft reset, soft power down or brown-out of the MFRC522.
+        The current values are read in one SPI transfer and only the registers that differ are written.
+        Each write is one SPI transfer: the MFRC522 writes all bytes of a transfer to the same address.
+        
+        @param snapshot: RegisterSnapshot from pcd_save_registers() or RegisterSnapshot.from_dict()
+        @return: Number of registers written
+        '''
+        if self.__log_trace:
+            logger_trace.debug('>> pcd_restore_registers')
+
+        regs = snapshot._ordered()
+        written = 0
+        for reg, current in zip(regs, self.pcd_read_registers(regs)):
+            value = snapshot.values[reg]
+            if current != value:
+                self.pcd_write_register(reg, value)
+                written += 1
+        return written
+
+    @timed
     def pcd_perform_self_test(self):
         '''
         Performs a self-test of the MFRC522
@@ -969,7 +1229,7 @@ class MFRC522(object):
         self.pcd_write_register(PCD_Register.AutoTestReg, 0x00)
     
         # Determine firmware version (see section 9.3.4.8 in spec)
-        version = self.pcd_read_register(PCD_Register.VersionReg)
+        version = self.pcd_get_version()
     
         # Pick the appropriate reference values
         #const byte *reference;
@@ -1014,25 +1274,25 @@ class MFRC522(object):
     def pcd_soft_power_up(self):
         '''
         MFRC522::PCD_SoftPowerUp
+        
+        @return: True if the MFRC522 is ready, False if the PowerDown bit was not cleared within 150ms
         '''
         if self.__log_trace:
             logger_trace.debug('>> pcd_soft_power_up')
-        val = self.pcd_read_register(PCD_Register.CommandReg)    # Read state of the command register
-        val &= ~(1<<4)                                                  # set PowerDown bit ( bit 4 ) to 0 
-        self.pcd_write_register(PCD_Register.CommandReg, val)    # write new value to the command register
+        # Clear the PowerDown bit (bit 4) with the reset value of the command register (RcvOff, Idle command),
+        # the next command switches the receiver on again. A command running before the power down is aborted anyway.
+        self.pcd_write_register(PCD_Register.CommandReg, 0x20)
         
-        # wait until PowerDown bit is cleared (this indicates end of wake up procedure)
-        for __ in range(125):       # On Arduino timeout is set to 500 ms
-            val = self.pcd_read_register(PCD_Register.CommandReg)# Read state of the command register
-            if not (val & (1<<4)):                                      # if powerdown bit is 0 
-                break                                                   # wake up procedure is finished 
+        # wait until PowerDown bit is cleared (this indicates end of wake up procedure), the known value of the
+        # register tells a ready MFRC522 from a stuck bus (0x00 or 0xFF)
+        return self._wait_until_ready()
 
 
     #====================================================================================
     # Functions for communicating with PICCs
     #====================================================================================
 
-    def pcd_transceive_data(self, send_data, wants_back_data=False, tx_valid_bits=0, rx_align=0, check_crc=False):
+    def pcd_transceive_data(self, send_data, wants_back_data=False, tx_valid_bits=0, rx_align=0, check_crc=False, picc_command=None):
         '''
         Executes the Transceive command.
         CRC validation can only be done if backData and backLen are specified.
@@ -1042,15 +1302,17 @@ class MFRC522(object):
         @param tx_valid_bits: The number of valid bits in the last byte. 0 for 8 valid bits.
         @param rx_align: Defines the bit position in back_data[0] for the first bit received. Default 0.
         @param check_crc: True => The last two bytes of the response is assumed to be a CRC_A that must be validated.
+        @param picc_command: The PICC_Command sent with this frame (counted in the metrics), None for a data frame
         @return: (StatusCode, rx_back_data, rx_valid_bits)
         '''
         if self.__log_trace:
             logger_trace.debug('>> pcd_transceive_data')
         
         wait_irq = 0x30     # RxIRq and IdleIRq
-        return self.pcd_communicate_with_picc(PCD_Command.PCD_Transceive, wait_irq, send_data, wants_back_data, tx_valid_bits, rx_align, check_crc)
+        return self.pcd_communicate_with_picc(PCD_Command.PCD_Transceive, wait_irq, send_data, wants_back_data, tx_valid_bits, rx_align, check_crc, picc_command)
     
-    def pcd_communicate_with_picc(self, command, wait_irq, send_data, wants_back_data, tx_valid_bits, rx_align=0, check_crc=False):
+    @timed
+    def pcd_communicate_with_picc(self, command, wait_irq, send_data, wants_back_data, tx_valid_bits, rx_align=0, check_crc=False, picc_command=None):
         '''
         Transfers data to the MFRC522 FIFO, executes a command, waits for completion and transfers data back from the FIFO.
         CRC validation can only be done if backData and backLen are specified.
@@ -1062,11 +1324,54 @@ class MFRC522(object):
         @param tx_valid_bits: The number of valid bits in the last byte. 0 for 8 valid bits.
         @param rx_align: Defines the bit position in back_data[0] for the first bit received. Default 0.
         @param check_crc: True => The last two bytes of the response is assumed to be a CRC_A that must be validated.
+        @param picc_command: The PICC_Command sent with this frame (counted in the metrics), None for a data frame
         @return: (StatusCode, rx_back_data, rx_valid_bits)
         '''
         if self.__log_trace:
             logger_trace.debug('>> pcd_communicate_with_pic')
         
+        self.pcd_start_communication(command, send_data, tx_valid_bits, rx_align, picc_command)
+        
+        # Wait for the command to complete.
+        # In PCD_Init() we set the TAuto flag in TModeReg. This means the timer automatically starts when the PCD stops transmitting.
+        #    // Arduino Uno 16bit
+        #    // Wait for the command to complete. Each iteration of the while-loop takes 17.73us.
+        #    for (i = 2000; i > 0; i--) { ... }
+        for __ in range(125):
+            status = self.pcd_poll_communication(wait_irq)
+            if status is not None:
+                break
+        else:
+            # Timout (on Ardunion 35.7ms) and nothing happend. Communication with the MFRC522 might be down.
+            if self.metrics is not None:
+                self.metrics.timeouts += 1
+            self._record_frame(StatusCode.STATUS_TIMEOUT)
+            if self.__log_debug:
+                logger_debug.warn(_F('Timeout during communication with PICC (Command={}). Communication with the MFRC522 might be down', command.name))
+            return StatusCode.STATUS_TIMEOUT, None, None
+        
+        if status != StatusCode.STATUS_OK:
+            return status, None, None
+        return self.pcd_finish_communication(command, wants_back_data, rx_align, check_crc)
+    
+    def pcd_start_communication(self, command, send_data, tx_valid_bits, rx_align=0, picc_command=None):
+        '''
+        First phase of pcd_communicate_with_picc: transfers data to the MFRC522 FIFO and starts the command.
+        The command runs on the MFRC522 without further SPI traffic, so the bus can be used for other readers
+        until pcd_poll_communication reports the completion.
+        
+        @param command: The command to execute. One of the PCD_Command enums.
+        @param send_data: The data to transfer to the FIFO (list of bytes).
+        @param tx_valid_bits: The number of valid bits in the last byte. 0 for 8 valid bits.
+        @param rx_align: Defines the bit position in back_data[0] for the first bit received. Default 0.
+        @param picc_command: The PICC_Command sent with this frame (counted in the metrics), None for a data frame
+                             (e. g. step 2 of MIFARE WRITE), the flight recorder records it under the preceding command
+        '''
+        if picc_command is not None:
+            self._frame_command = picc_command.value
+            if self.metrics is not None:
+                self.metrics.count_frame(picc_command.value)
+        
         # Prepare values for BitFramingReg
         bit_framing = (rx_align << 4) + tx_valid_bits    # RxAlign = BitFramingReg[6..4]. TxLastBits = BitFramingReg[2..0]
         
@@ -1079,28 +1384,49 @@ class MFRC522(object):
         
         if command == PCD_Command.PCD_Transceive:
             self.pcd_set_register_bitmask(PCD_Register.BitFramingReg, 0x80);         # StartSend=1, transmission of data starts
+    
+    def pcd_poll_communication(self, wait_irq):
+        '''
+        Second phase of pcd_communicate_with_picc: checks once if the command started with pcd_start_communication completed.
         
-        # Wait for the command to complete.
-        # In PCD_Init() we set the TAuto flag in TModeReg. This means the timer automatically starts when the PCD stops transmitting.
-        #    // Arduino Uno 16bit
-        #    // Wait for the command to complete. Each iteration of the while-loop takes 17.73us.
-        #    for (i = 2000; i > 0; i--) { ... }
-        for i in range(125, 0, -1):
-            n = self.pcd_read_register(PCD_Register.ComIrqReg)   # ComIrqReg[7..0] bits are: Set1 TxIRq RxIRq IdleIRq HiAlertIRq LoAlertIRq ErrIRq TimerIRq
-            if n & wait_irq:                                            # One of the interrupts that signal success has been set.
-                break
-            if n & 0x01:                                                # Timer interrupt - nothing received in 25ms
-                return StatusCode.STATUS_TIMEOUT, None, None
-
-        # Timout (on Ardunion 35.7ms) and nothing happend. Communication with the MFRC522 might be down.
-        if i == 0:
-            if self.__log_debug:
-                logger_debug.warn(_F('Timeout during communication with PICC (Command={}). Communication with the MFRC522 might be down', command.name))
-            return StatusCode.STATUS_TIMEOUT, None, None
-
+        @param wait_irq: The bits in the ComIrqReg register that signals successful completion of the command.
+        @return: STATUS_OK if the command completed, STATUS_TIMEOUT if the timer expired (nothing received in 25ms) or None if the command is still running
+        '''
+        n = self.pcd_read_register(PCD_Register.ComIrqReg)   # ComIrqReg[7..0] bits are: Set1 TxIRq RxIRq IdleIRq HiAlertIRq LoAlertIRq ErrIRq TimerIRq
+        if n & wait_irq:                                            # One of the interrupts that signal success has been set.
+            return StatusCode.STATUS_OK
+        if n & 0x01:                                                # Timer interrupt - nothing received in 25ms
+            if self.metrics is not None:
+                self.metrics.timeouts += 1
+            self._record_frame(StatusCode.STATUS_TIMEOUT)
+            return StatusCode.STATUS_TIMEOUT
+        return None
+    
+    def pcd_finish_communication(self, command, wants_back_data, rx_align=0, check_crc=False):
+        '''
+        Last phase of pcd_communicate_with_picc: checks for errors and transfers data back from the FIFO
+        after pcd_poll_communication returned STATUS_OK.
+        
+        @param command: The executed command. One of the PCD_Command enums.
+        @param wants_back_data: True if data should be read back after executing the command.
+        @param rx_align: Defines the bit position in back_data[0] for the first bit received. Default 0.
+        @param check_crc: True => The last two bytes of the response is assumed to be a CRC_A that must be validated.
+        @return: (StatusCode, rx_back_data, rx_valid_bits)
+        '''
+        result = self._finish_communication(command, wants_back_data, rx_align, check_crc)
+        self._record_frame(result[0])
+        return result
+    
+    def _record_frame(self, status):
+        if self.flight_recorder is not None:
+            self.flight_recorder.record_frame(monotonic(), self._frame_command, status)
+    
+    def _finish_communication(self, command, wants_back_data, rx_align, check_crc):
         # Stop now if any errors except collisions were detected.
         error_reg_value = self.pcd_read_register(PCD_Register.ErrorReg)  # ErrorReg[7..0] bits are: WrErr TempErr reserved BufferOvfl CollErr CRCErr ParityErr ProtocolErr
         if error_reg_value & 0x13:                                              # BufferOvfl ParityErr ProtocolErr
+            if self.metrics is not None:
+                self.metrics.protocol_errors += 1
             if self.__log_debug:
                 logger_debug.warn(_F('Error detected during communication with PICC (Command={}). Error register value: {:#04x}', command.name, error_reg_value))
             return StatusCode.STATUS_ERROR, None, None
@@ -1121,6 +1447,8 @@ class MFRC522(object):
             
         # Tell about collisions
         if error_reg_value & 0x08:        # CollErr
+            if self.metrics is not None:
+                self.metrics.collisions += 1
             if self.__log_debug:
                 logger_debug.debug(_F('Collision detected during communication with PICC (Command={}). Error register value: {:#04x}', command.name, error_reg_value))
             return StatusCode.STATUS_COLLISION, rx_back_data, rx_valid_bits
@@ -1131,11 +1459,15 @@ class MFRC522(object):
                 logger_trace.debug('>> pcd_communicate_with_pic: CRC_A validation for back data')
             # In this case a MIFARE Classic NAK is not OK.
             if rx_back_data_len == 1 and rx_valid_bits == 4:
+                if self.metrics is not None:
+                    self.metrics.nacks += 1
                 if self.__log_debug:
                     logger_debug.warn(_F('Communication with PICC resulted in MIFARE Classic NAK (Command={})', command.name))
                 return StatusCode.STATUS_MIFARE_NACK, rx_back_data, rx_valid_bits
             # We need at least the CRC_A value and all 8 bits of the last byte must be received.
             if rx_back_data_len < 2 or rx_valid_bits != 0:
+                if self.metrics is not None:
+                    self.metrics.crc_errors += 1
                 if self.__log_debug:
                     logger_debug.warn(_F('Not enough bits for CRC_A calculation received from communication with PICC (Command={})', command.name))
                 return StatusCode.STATUS_CRC_WRONG, rx_back_data, rx_valid_bits
@@ -1144,6 +1476,8 @@ class MFRC522(object):
             if status != StatusCode.STATUS_OK:
                 return status, rx_back_data, rx_valid_bits
             if (rx_back_data[rx_back_data_len - 2] != control_buffer[0]) or (rx_back_data[rx_back_data_len - 1] != control_buffer[1]):
+                if self.metrics is not None:
+                    self.metrics.crc_errors += 1
                 if self.__log_debug:
                     logger_debug.warn(_F('Wrong CRC_A value received from communication with PICC (Command: {}, expected: [ {:#04x} {:#04x} ], actual: [ {:#04x} {:#04x} ])', 
                                          command.name, rx_back_data[rx_back_data_len - 2], rx_back_data[rx_back_data_len - 1], control_buffer[0], control_buffer[1]))
@@ -1151,6 +1485,7 @@ class MFRC522(object):
     
         return StatusCode.STATUS_OK, rx_back_data, rx_valid_bits
     
+    @timed
     def picc_request_a(self):
         '''
         Transmits a REQuest command, Type A. Invites PICCs in state IDLE to go to READY and prepare for anticollision or selection. 7 bit frame.
@@ -1163,6 +1498,7 @@ class MFRC522(object):
         
         return self.picc_reqa_or_wupa(PICC_Command.PICC_CMD_REQA)
 
+    @timed
     def picc_wakeup_a(self):
         '''
         Transmits a Wake-UP command, Type A. Invites PICCs in state IDLE and HALT to go to READY(*) and prepare for anticollision or selection. 7 bit frame.
@@ -1185,13 +1521,14 @@ class MFRC522(object):
         '''
         self.pcd_clear_register_bitmask(PCD_Register.CollReg, 0x80)  # ValuesAfterColl=1 => Bits received after collision are cleared.
         tx_valid_bits = 7                                                   # For REQA and WUPA we need the short frame format - transmit only 7 bits of the last (and only) byte. TxLastBits = BitFramingReg[2..0]
-        status, rx_back_data, rx_valid_bits = self.pcd_transceive_data([command.value], True, tx_valid_bits)
+        status, rx_back_data, rx_valid_bits = self.pcd_transceive_data([command.value], True, tx_valid_bits, picc_command=command)
         if status != StatusCode.STATUS_OK:
             return status, rx_back_data
         if len(rx_back_data) != 2 or rx_valid_bits != 0:                    # ATQA must be exactly 16 bits.
             return StatusCode.STATUS_ERROR, rx_back_data
         return StatusCode.STATUS_OK, rx_back_data
 
+    @timed
     def picc_select(self, uid=None, rx_valid_bits=0):
         '''
         Transmits SELECT/ANTICOLLISION commands to select a single PICC.
@@ -1271,15 +1608,18 @@ class MFRC522(object):
                 logger_trace.debug('>> picc_select: cascade loop iteration')
             # Set the Cascade Level in the SEL byte, find out if we need to use the Cascade Tag in byte 2.
             if cascade_level == 1:
-                _buffer[0] = PICC_Command.PICC_CMD_SEL_CL1.value
+                sel_command = PICC_Command.PICC_CMD_SEL_CL1
+                _buffer[0] = sel_command.value
                 uid_index = 0
                 use_cascade_tag = rx_valid_bits and _uid.size > 4    # When we know that the UID has more than 4 bytes
             elif cascade_level == 2:
-                _buffer[0] = PICC_Command.PICC_CMD_SEL_CL2.value
+                sel_command = PICC_Command.PICC_CMD_SEL_CL2
+                _buffer[0] = sel_command.value
                 uid_index = 3
                 use_cascade_tag = rx_valid_bits and _uid.size > 7    # When we know that the UID has more than 7 bytes
             elif cascade_level == 3:
-                _buffer[0] = PICC_Command.PICC_CMD_SEL_CL3.value
+                sel_command = PICC_Command.PICC_CMD_SEL_CL3
+                _buffer[0] = sel_command.value
                 uid_index = 6
                 use_cascade_tag = False                             # Never used in CL3.
             else:
@@ -1352,12 +1692,20 @@ class MFRC522(object):
                 self.pcd_write_register(PCD_Register.BitFramingReg, (rx_align << 4) + tx_last_bits)      # RxAlign = BitFramingReg[6..4]. TxLastBits = BitFramingReg[2..0]
     
                 # Transmit the _buffer and receive the response.
-                status, _rx_back_data, _rx_valid_bits = self.pcd_transceive_data(_buffer[:buffer_used], True, tx_last_bits, rx_align)
+                _buffer_first_byte = _buffer[response_buffer_index]
+                status, _rx_back_data, _rx_valid_bits = self.pcd_transceive_data(_buffer[:buffer_used], True, tx_last_bits, rx_align, picc_command=sel_command)
+                if _rx_back_data and len(_rx_back_data) > response_length:            # Garbage (e. g. stuck SPI bus), it does not fit into _buffer
+                    if self.__log_debug:
+                        logger_debug.error(_F('Error occured in picc_select anti collision loop. Response too long ({} > {} bytes)', len(_rx_back_data), response_length))
+                    return StatusCode.STATUS_NO_ROOM, _uid
                 if _rx_back_data:
                     if self.__log_trace:
                         logger_trace.debug(_F('>> picc_select: cascade loop iteration: anti collision loop iteration: copy data. data: [{}], buffer_index: {}', format_hex(_rx_back_data), response_buffer_index))
                     for i in range(len(_rx_back_data)):                             # copy _rx_back_data into _buffer starting from response_buffer_index
                         _buffer[response_buffer_index + i] = _rx_back_data[i]
+                    if rx_align:                                                    # Keep the known bits 0..rxAlign-1 of the first byte
+                        mask = (0xFF << rx_align) & 0xFF
+                        _buffer[response_buffer_index] = (_buffer_first_byte & ~mask) | (_rx_back_data[0] & mask)
                 else:
                     if self.__log_debug:
                         logger_debug.warn(_F('No back data received from transceive_data in picc_select anti collision loop. buffer: [{}], used: {}, tx_last_bits: {}, rx_align: {}', format_hex(_buffer), buffer_used, tx_last_bits, rx_align))
@@ -1440,10 +1788,14 @@ class MFRC522(object):
         
         if self.__log_trace:
             logger_trace.debug(_F('>> picc_select: cascade loop finished: uid: [{}]', format_hex(_uid.uid())))
+        
+        if self.metrics is not None:
+            self.metrics.last_select = monotonic()
     
         return StatusCode.STATUS_OK, _uid
     # End PICC_Select()
 
+    @timed
     def picc_halt_a(self):
         '''
         Instructs a PICC in state ACTIVE(*) to go to state HALT.
@@ -1468,7 +1820,7 @@ class MFRC522(object):
         #        If the PICC responds with any modulation during a period of 1 ms after the end of the frame containing the
         #        HLTA command, this response shall be interpreted as 'not acknowledge'.
         # We interpret that this way: Only STATUS_TIMEOUT is a success.
-        result = self.pcd_transceive_data(_buffer + crc_result, False, 0)
+        result, __, __ = self.pcd_transceive_data(_buffer + crc_result, False, 0, picc_command=PICC_Command.PICC_CMD_HLTA)
         if result == StatusCode.STATUS_TIMEOUT:
             return StatusCode.STATUS_OK
         if result == StatusCode.STATUS_OK:     # That is ironically NOT ok in this case ;-)
@@ -1480,6 +1832,7 @@ class MFRC522(object):
     # Functions for communicating with MIFARE PICCs
     #====================================================================================
 
+    @timed
     def pcd_authenticate(self, command, block_addr, key, uid):
         '''
         Executes the MFRC522 MFAuthent command.
@@ -1516,7 +1869,7 @@ class MFRC522(object):
             send_data[8+i] = uid.uid_byte[i+uid.size-4]
     
         # Start the authentication.
-        status, __, __ = self.pcd_communicate_with_picc(PCD_Command.PCD_MFAuthent, wait_irq, send_data, False, 0)
+        status, __, __ = self.pcd_communicate_with_picc(PCD_Command.PCD_MFAuthent, wait_irq, send_data, False, 0, picc_command=command)
         return status
 
     def pcd_stop_crypto1(self):
@@ -1530,6 +1883,7 @@ class MFRC522(object):
         # Clear MFCrypto1On bit
         self.pcd_clear_register_bitmask(PCD_Register.Status2Reg, 0x08)  # Status2Reg[7..0] bits are: TempSensClear I2CForceHS reserved reserved MFCrypto1On ModemState[2:0]
 
+    @timed
     def mifare_read(self, block_addr):
         '''
         Reads 16 bytes (+ 2 bytes CRC_A) from the active PICC.
@@ -1557,12 +1911,13 @@ class MFRC522(object):
         # Calculate CRC_A
         result, crc_result = self.pcd_calulate_crc(_buffer)
         if result != StatusCode.STATUS_OK:
-            return result
+            return result, None
     
         # Transmit the buffer and receive the response, validate CRC_A.
-        status, data, __ = self.pcd_transceive_data(_buffer + crc_result, True, 0, 0, True)
+        status, data, __ = self.pcd_transceive_data(_buffer + crc_result, True, 0, 0, True, PICC_Command.PICC_CMD_MF_READ)
         return status, data
 
+    @timed
     def mifare_write(self, block_addr, data):
         '''
         Writes 16 bytes to the active PICC.
@@ -1591,7 +1946,7 @@ class MFRC522(object):
         _cmd_buffer = []
         _cmd_buffer.append(PICC_Command.PICC_CMD_MF_WRITE.value)
         _cmd_buffer.append(block_addr)
-        result = self.pcd_mifare_transceive(_cmd_buffer)                         # Adds CRC_A and checks that the response is MF_ACK.
+        result = self.pcd_mifare_transceive(_cmd_buffer, picc_command=PICC_Command.PICC_CMD_MF_WRITE)     # Adds CRC_A and checks that the response is MF_ACK.
         if result != StatusCode.STATUS_OK:
             return result
     
@@ -1602,6 +1957,7 @@ class MFRC522(object):
         
         return StatusCode.STATUS_OK
 
+    @timed
     def mifare_ultralight_write(self, page, data):
         '''
         Writes a 4 byte page to the active MIFARE Ultralight PICC.
@@ -1624,12 +1980,13 @@ class MFRC522(object):
         _cmd_buffer += data[:4]
     
         # Perform the write
-        result = self.pcd_mifare_transceive(_cmd_buffer)                         # Adds CRC_A and checks that the response is MF_ACK.
+        result = self.pcd_mifare_transceive(_cmd_buffer, picc_command=PICC_Command.PICC_CMD_UL_WRITE)     # Adds CRC_A and checks that the response is MF_ACK.
         if result != StatusCode.STATUS_OK:
             return result
         
         return StatusCode.STATUS_OK
 
+    @timed
     def mifare_decrement(self, block_addr, delta):
         '''
         MIFARE Decrement subtracts the delta from the value of the addressed block, and stores the result in a volatile memory.
@@ -1646,6 +2003,7 @@ class MFRC522(object):
         
         return self._mifare_two_step_helper(PICC_Command.PICC_CMD_MF_DECREMENT, block_addr, delta)
 
+    @timed
     def mifare_increment(self, block_addr, delta):
         '''
         MIFARE Increment adds the delta to the value of the addressed block, and stores the result in a volatile memory.
@@ -1662,6 +2020,7 @@ class MFRC522(object):
         
         return self._mifare_two_step_helper(PICC_Command.PICC_CMD_MF_INCREMENT, block_addr, delta)
 
+    @timed
     def mifare_restore(self, block_addr):
         '''
         MIFARE Restore copies the value of the addressed block into a volatile memory.
@@ -1685,7 +2044,7 @@ class MFRC522(object):
         
         @param command: The command to use
         @param block_addr: The block (0-0xff) number.
-        @param data: The data to transfer in step 2
+        @param data: The data to transfer in step 2 (int32, transferred as 4 bytes, LSB first)
         @return: STATUS_OK on success, STATUS_??? otherwise.
         '''
         if self.__log_trace:
@@ -1695,17 +2054,19 @@ class MFRC522(object):
         _cmd_buffer = []
         _cmd_buffer.append(command.value)
         _cmd_buffer.append(block_addr)
-        result = self.pcd_mifare_transceive(_cmd_buffer)  # Adds CRC_A and checks that the response is MF_ACK.
+        result = self.pcd_mifare_transceive(_cmd_buffer, picc_command=command)     # Adds CRC_A and checks that the response is MF_ACK.
         if result != StatusCode.STATUS_OK:
             return result
     
         # Step 2: Transfer the data
-        result = self.pcd_mifare_transceive(data, True)   # Adds CRC_A and accept timeout as success.
+        _data_buffer = [(data >> (8 * i)) & 0xFF for i in range(4)]            # int32, LSB first
+        result = self.pcd_mifare_transceive(_data_buffer, True)   # Adds CRC_A and accept timeout as success.
         if result != StatusCode.STATUS_OK:
             return result
     
         return StatusCode.STATUS_OK
 
+    @timed
     def mifare_transfer(self, block_addr):
         '''
         MIFARE Transfer writes the value stored in the volatile memory into one MIFARE Classic block.
@@ -1723,11 +2084,12 @@ class MFRC522(object):
         # Tell the PICC we want to transfer the result into block blockAddr.
         _cmd_buffer.append(PICC_Command.PICC_CMD_MF_TRANSFER.value)
         _cmd_buffer.append(block_addr)
-        result = self.pcd_mifare_transceive(_cmd_buffer)  # Adds CRC_A and checks that the response is MF_ACK.
+        result = self.pcd_mifare_transceive(_cmd_buffer, picc_command=PICC_Command.PICC_CMD_MF_TRANSFER)  # Adds CRC_A and checks that the response is MF_ACK.
         if result != StatusCode.STATUS_OK:
             return result
         return StatusCode.STATUS_OK
 
+    @timed
     def mifare_get_value(self, block_addr):
         '''
         Helper routine to read the current value from a Value Block.
@@ -1748,9 +2110,12 @@ class MFRC522(object):
         if status == StatusCode.STATUS_OK:
             # Extract the value
             value = (data[3] << 24) | (data[2] << 16) | (data[1] << 8) | data[0]
+            if value & 0x80000000:                      # int32_t, two's complement
+                value -= 0x100000000
             return StatusCode.STATUS_OK, value
         return status, None
 
+    @timed
     def mifare_set_value(self, block_addr, value):
         '''
         Helper routine to write a specific value into a Value Block.
@@ -1773,18 +2138,174 @@ class MFRC522(object):
         _buffer[2] = _buffer[10] = (value & 0xFF0000) >> 16
         _buffer[3] = _buffer[11] = (value & 0xFF000000) >> 24
         # Inverse 4 bytes also found in value block
-        _buffer[4] = ~_buffer[0]
-        _buffer[5] = ~_buffer[1]
-        _buffer[6] = ~_buffer[2]
-        _buffer[7] = ~_buffer[3]
+        _buffer[4] = ~_buffer[0] & 0xFF
+        _buffer[5] = ~_buffer[1] & 0xFF
+        _buffer[6] = ~_buffer[2] & 0xFF
+        _buffer[7] = ~_buffer[3] & 0xFF
         # Address 2x with inverse address 2x
         _buffer[12] = _buffer[14] = block_addr
-        _buffer[13] = _buffer[15] = ~block_addr
+        _buffer[13] = _buffer[15] = ~block_addr & 0xFF
     
         # Write the whole data block
         return self.mifare_write(block_addr, _buffer)
 
 
+    @timed
+    def mifare_copy_value_block(self, src_block_addr, dst_block_addr):
+        '''
+        Copies a Value Block to another block of the same sector inside the PICC (Restore + Transfer).
+        The value is copied through the transfer buffer of the PICC, no data is transferred from or to the host.
+        
+        Only for MIFARE Classic and only for blocks in "value block" mode, that
+        is: with access bits [C1 C2 C3] = [110] or [001]. The sector containing
+        the blocks must be authenticated before calling this function.
+        
+        @param src_block_addr: The block (0x00-0xff) number to copy from.
+        @param dst_block_addr: The block (0x00-0xff) number to copy to.
+        @return: STATUS_OK on success, STATUS_??? otherwise.
+        '''
+        if self.__log_trace:
+            logger_trace.debug('>> mifare_copy_value_block')
+        
+        status = self.mifare_restore(src_block_addr)
+        if status != StatusCode.STATUS_OK:
+            return status
+        return self.mifare_transfer(dst_block_addr)
+
+    @timed
+    def mifare_backup_value_blocks(self, uid, key, block_pairs, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A):
+        '''
+        Copies Value Blocks of one sector to their backup blocks in the same sector inside the PICC,
+        with a single authentication (see mifare_copy_value_block). Costs three frames per block.
+        
+        @param uid: UID from the selected PICC
+        @param key: MIFARE_Key for the sector or None if the sector is already authenticated
+        @param block_pairs: List of (src_block_addr, dst_block_addr) tuples
+        @param auth_command: PICC_CMD_MF_AUTH_KEY_A or PICC_CMD_MF_AUTH_KEY_B, or an AuthPlanner that decides which key to use (default = PICC_CMD_MF_AUTH_KEY_A)
+        @return: STATUS_OK on success, STATUS_??? otherwise.
+        '''
+        if self.__log_trace:
+            logger_trace.debug('>> mifare_backup_value_blocks')
+        
+        from .access_bits import AccessOperation, get_block_position     # Imported here, access_bits depends on this module
+        
+        if not block_pairs:
+            return StatusCode.STATUS_OK
+        
+        # Sanity check
+        blocks = [block_addr for pair in block_pairs for block_addr in pair]
+        sectors = set(get_block_position(block_addr)[0] for block_addr in blocks)
+        if len(sectors) != 1:
+            if self.__log_debug:
+                logger_debug.error(_F('Blocks for mifare_backup_value_blocks are not in the same sector (blocks: [{}])', format_hex(blocks)))
+            return StatusCode.STATUS_INVALID
+        
+        if key is not None:
+            if not isinstance(auth_command, PICC_Command):          # Let the planner decide
+                auth_command = auth_command.get_common_auth_command(blocks, [AccessOperation.DECREMENT])
+                if auth_command is None:
+                    if self.__log_debug:
+                        logger_debug.error(_F('Access conditions do not allow restore/transfer with a single key (blocks: [{}])', format_hex(blocks)))
+                    return StatusCode.STATUS_INVALID
+            status = self.pcd_authenticate(auth_command, blocks[0], key, uid)
+            if status != StatusCode.STATUS_OK:
+                return status
+        
+        for src_block_addr, dst_block_addr in block_pairs:
+            status = self.mifare_copy_value_block(src_block_addr, dst_block_addr)
+            if status != StatusCode.STATUS_OK:
+                if self.__log_debug:
+                    logger_debug.error(_F('Error copying value block (src_block_addr: {:#04x}, dst_block_addr: {:#04x})', src_block_addr, dst_block_addr))
+                return status
+        
+        return StatusCode.STATUS_OK
+
+    @timed
+    def mifare_value_transaction(self, uid, key, block_addr, delta, backup_block_addr=None, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A, read_back=True):
+        '''
+        Changes the value of a Value Block by the given delta in a single authenticated session:
+                1. Authenticate the sector (skipped if key is None, then the sector must already be authenticated)
+                2. Increment (delta > 0), Decrement (delta < 0) or Restore (delta == 0) the value into the PICC's transfer buffer
+                3. Transfer the result into the block
+                4. Optionally mirror the new value into a backup block (Restore + Transfer)
+                5. Optionally read back the new value
+        No value data is transferred from or to the host except for the optional read back.
+        
+        Only for MIFARE Classic and only for blocks in "value block" mode, that
+        is: with access bits [C1 C2 C3] = [110] or [001]. The backup block must be in the same sector.
+        Increment requires access bits [110] and usually key B, a delta of 0 is also allowed with access bits [001].
+        
+        @param uid: UID from the selected PICC
+        @param key: MIFARE_Key for the sector or None if the sector is already authenticated
+        @param block_addr: The block (0x00-0xff) number.
+        @param delta: The value to add to the block (negative values are subtracted)
+        @param backup_block_addr: Optional block (in the same sector) that receives a copy of the new value
+        @param auth_command: PICC_CMD_MF_AUTH_KEY_A or PICC_CMD_MF_AUTH_KEY_B, or an AuthPlanner that decides which key to use (default = PICC_CMD_MF_AUTH_KEY_A)
+        @param read_back: If True the new value is read from the block (one additional READ)
+        @return: (StatusCode, value) - value is the new value of the block or None if read_back is False
+        '''
+        if self.__log_trace:
+            logger_trace.debug('>> mifare_value_transaction')
+        
+        from .access_bits import AccessOperation, get_block_position     # Imported here, access_bits depends on this module
+        
+        # Sanity checks
+        if delta < -0x80000000 or delta > 0x7FFFFFFF:
+            if self.__log_debug:
+                logger_debug.error(_F('Invalid delta for mifare_value_transaction (delta: {})', delta))
+            return StatusCode.STATUS_INVALID, None
+        if backup_block_addr is not None and get_block_position(backup_block_addr)[0] != get_block_position(block_addr)[0]:
+            if self.__log_debug:
+                logger_debug.error(_F('Backup block is not in the same sector (block_addr: {:#04x}, backup_block_addr: {:#04x})', block_addr, backup_block_addr))
+            return StatusCode.STATUS_INVALID, None
+        
+        if delta > 0:
+            command = PICC_Command.PICC_CMD_MF_INCREMENT
+            operation = AccessOperation.INCREMENT
+        elif delta < 0:
+            command = PICC_Command.PICC_CMD_MF_DECREMENT
+            operation = AccessOperation.DECREMENT
+        else:
+            command = PICC_Command.PICC_CMD_MF_RESTORE                 # Same value, allowed without increment access
+            operation = AccessOperation.DECREMENT
+        
+        # Step 1: Authenticate once for all operations
+        if key is not None:
+            if not isinstance(auth_command, PICC_Command):          # Let the planner decide
+                block_operations = [(block_addr, [operation, AccessOperation.DECREMENT])]     # DECREMENT covers TRANSFER and RESTORE
+                if backup_block_addr is not None:
+                    block_operations.append((backup_block_addr, [AccessOperation.DECREMENT]))      # Only TRANSFER
+                auth_command = auth_command.get_session_auth_command(block_operations)
+                if auth_command is None:
+                    if self.__log_debug:
+                        logger_debug.error(_F('Access conditions do not allow the value transaction with a single key (block_addr: {:#04x})', block_addr))
+                    return StatusCode.STATUS_INVALID, None
+            status = self.pcd_authenticate(auth_command, block_addr, key, uid)
+            if status != StatusCode.STATUS_OK:
+                return status, None
+        
+        # Step 2: Increment/Decrement/Restore into the transfer buffer
+        status = self._mifare_two_step_helper(command, block_addr, abs(delta))
+        if status != StatusCode.STATUS_OK:
+            return status, None
+        
+        # Step 3: Transfer the result into the block
+        status = self.mifare_transfer(block_addr)
+        if status != StatusCode.STATUS_OK:
+            return status, None
+        
+        # Step 4: Mirror the new value into the backup block
+        if backup_block_addr is not None:
+            status = self.mifare_copy_value_block(block_addr, backup_block_addr)
+            if status != StatusCode.STATUS_OK:
+                return status, None
+        
+        # Step 5: Read the new value
+        if not read_back:
+            return StatusCode.STATUS_OK, None
+        return self.mifare_get_value(block_addr)
+
+
     # TODO missing function: MFRC522::StatusCode MFRC522::PCD_NTAG216_AUTH(byte* passWord, byte pACK[]) //Authenticate with 32bit password
 
 
@@ -1792,13 +2313,14 @@ class MFRC522(object):
     # Support functions
     #====================================================================================
 
-    def pcd_mifare_transceive(self, send_data, accept_timeout=False):
+    def pcd_mifare_transceive(self, send_data, accept_timeout=False, picc_command=None):
         '''
         Wrapper for MIFARE protocol communication.
         Adds CRC_A, executes the Transceive command and checks that the response is MF_ACK or a timeout.
         
         @param send_data: Data to transfer to the FIFO. Do NOT include the CRC_A.
         @param accept_timeout: True => A timeout is also success
+        @param picc_command: The PICC_Command sent with this frame (counted in the metrics), None for a data frame
         @return STATUS_OK on success, STATUS_??? otherwise.
         '''
         if self.__log_trace:
@@ -1818,7 +2340,7 @@ class MFRC522(object):
         
         # Transceive the data, store the reply in cmdBuffer[]
         wait_irq = 0x30             # RxIRq and IdleIRq
-        result, rx_back_data, rx_valid_bits = self.pcd_communicate_with_picc(PCD_Command.PCD_Transceive, wait_irq, send_data + crc_result, True, 0)
+        result, rx_back_data, rx_valid_bits = self.pcd_communicate_with_picc(PCD_Command.PCD_Transceive, wait_irq, send_data + crc_result, True, 0, picc_command=picc_command)
         if accept_timeout and result == StatusCode.STATUS_TIMEOUT:
             return StatusCode.STATUS_OK
         if result != StatusCode.STATUS_OK:
@@ -1834,6 +2356,19 @@ class MFRC522(object):
             return StatusCode.STATUS_MIFARE_NACK
         return StatusCode.STATUS_OK
 
+    def pcd_get_version(self):
+        '''
+        Reads the VersionReg of the MFRC522. The value is recorded in the metrics as health probe
+        (0x00 or 0xFF means the communication with the MFRC522 failed).
+        
+        @return: The firmware version (e. g. 0x92 for version 2.0)
+        '''
+        version = self.pcd_read_register(PCD_Register.VersionReg)
+        if self.metrics is not None:
+            self.metrics.version = version
+            self.metrics.version_time = monotonic()
+        return version
+
     def get_status_code_name(self, code):
         '''
         Returns a __FlashStringHelper pointer to a status code name.
@@ -1885,7 +2420,7 @@ class MFRC522(object):
             logger_trace.debug('>> pcd_dump_version_to_serial')
         
         # Get the MFRC522 firmware version
-        v = self.pcd_read_register(PCD_Register.VersionReg)
+        v = self.pcd_get_version()
         print('Firmware Version: {:#x} = {}'.format(v, self.pcd_get_version_name(v)))
         # When 0x00 or 0xFF is returned, communication probably failed
         if (v == 0x00) or (v == 0xFF):
@@ -1997,22 +2532,14 @@ class MFRC522(object):
         if self.__log_trace:
             logger_trace.debug('>> picc_dump_mifare_classic_sector_to_serial')
         
+        from .access_bits import decode_access_bits, get_access_group     # Imported here, access_bits depends on this module
+        
         first_block = 0             # Address of lowest address to dump actually last block dumped)
         no_of_blocks = 0            # Number of blocks in sector
     
-        # The access bits are stored in a peculiar fashion.
-        # There are four groups:
-        #        g[3]    Access bits for the sector trailer, block 3 (for sectors 0-31) or block 15 (for sectors 32-39)
-        #        g[2]    Access bits for block 2 (for sectors 0-31) or blocks 10-14 (for sectors 32-39)
-        #        g[1]    Access bits for block 1 (for sectors 0-31) or blocks 5-9 (for sectors 32-39)
-        #        g[0]    Access bits for block 0 (for sectors 0-31) or blocks 0-4 (for sectors 32-39)
-        # Each group has access bits [C1 C2 C3]. In this code C1 is MSB and C3 is LSB.
-        # The four CX bits are stored together in a nible cx and an inverted nible cx_.
-        
-        #byte c1_, c2_, c3_;        # Inverted nibbles
+        # The access bits are decoded with decode_access_bits(), see there for the peculiar fashion they are stored in.
+        # There are four groups, g[3] for the sector trailer and g[0]..g[2] for the data blocks.
         g = [0] * 4                # Access bits for each of the four groups.
-        #byte group;               # 0-3 - active group for access bits
-        #bool firstInGroup;        # True for the first block dumped in the group
     
         # Determine position and size of sector.
         if sector < 32:                             # Sectors 0..31 has 4 blocks each
@@ -2046,29 +2573,15 @@ class MFRC522(object):
             
             # Parse sector trailer data
             if is_sector_trailer:
-                c1  = data[7] >> 4
-                c2  = data[8] & 0xF
-                c3  = data[8] >> 4
-                c1_ = data[6] & 0xF
-                c2_ = data[6] >> 4
-                c3_ = data[7] & 0xF
-                inverted_error = (c1 != (~c1_ & 0xF)) or (c2 != (~c2_ & 0xF)) or (c3 != (~c3_ & 0xF))
-                g[0] = ((c1 & 1) << 2) | ((c2 & 1) << 1) | ((c3 & 1) << 0)
-                g[1] = ((c1 & 2) << 1) | ((c2 & 2) << 0) | ((c3 & 2) >> 1)
-                g[2] = ((c1 & 4) << 0) | ((c2 & 4) >> 1) | ((c3 & 4) >> 2)
-                g[3] = ((c1 & 8) >> 1) | ((c2 & 8) >> 2) | ((c3 & 8) >> 3)
+                g, inverted_error = decode_access_bits(data[6:9])
                 is_sector_trailer = False
                 _sector = sector
             else:
                 _sector = ''
     
             # Which access group is this block in?
-            if no_of_blocks == 4:
-                group = block_offset
-                first_in_group = True
-            else:
-                group = block_offset // 5
-                first_in_group = (group == 3) or (group != (block_offset + 1) // 5)
+            group = get_access_group(block_offset, no_of_blocks)
+            first_in_group = (no_of_blocks == 4) or (group == 3) or (group != get_access_group(block_offset + 1, no_of_blocks))
     
             if first_in_group:
                 # Print access bits
@@ -2124,6 +2637,7 @@ class MFRC522(object):
     # Convenience functions - does not add extra functionality
     #====================================================================================
 
+    @timed
     def picc_is_new_card_present(self):
         '''
         Returns true if a PICC responds to PICC_CMD_REQA.
@@ -2143,6 +2657,7 @@ class MFRC522(object):
         result, __ = self.picc_request_a()
         return result == StatusCode.STATUS_OK or result == StatusCode.STATUS_COLLISION
 
+    @timed
     def picc_is_card_present(self):
         '''
         Returns true if a PICC responds to PICC_CMD_WUPA.
@@ -2162,6 +2677,7 @@ class MFRC522(object):
         result, __ = self.picc_wakeup_a()
         return result == StatusCode.STATUS_OK or result == StatusCode.STATUS_COLLISION
 
+    @timed
     def picc_read_card_serial(self):
         '''
         Simple wrapper around PICC_Select.
@@ -0,0 +1,249 @@
+'''
+Manager for several MFRC522 modules on one SPI bus.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import logging
+import threading
+import time
+
+from .utils import FormatString as _F
+from .mfrc522 import (
+    PCD_Register,
+    PCD_Command,
+    PICC_Command,
+    StatusCode
+)
+from .events import (
+    CardEvent,
+    CardEventType
+)
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+
+class ManagedReader(object):
+    '''
+    A MFRC522 registered at the ReaderManager together with its scheduling parameters and throughput counters
+    '''
+
+    def __init__(self, rfid, name, weight, time_slice):
+        self.rfid = rfid
+        self.name = name
+        self.weight = weight
+        self.time_slice = time_slice
+
+        self.started = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.polls = 0
+        self.cards = 0
+        self.duplicates = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self.stats_start = None
+
+    def get_stats(self, now):
+        elapsed = now - self.stats_start if self.stats_start is not None else 0.0
+        return {
+            'polls': self.polls,
+            'cards': self.cards,
+            'duplicates': self.duplicates,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'busy_time': self.busy_time,
+            'polls_per_second': self.polls / elapsed if elapsed > 0 else None,
+            'cards_per_second': self.cards / elapsed if elapsed > 0 else None,
+        }
+
+
+class ReaderManager(object):
+    '''
+    Polls several MFRC522 modules sharing one SPI bus (different devices or GPIO chip selects).
+
+    All SPI transactions are done while holding the shared bus lock. The polls are interleaved: REQA is started
+    on all readers of a round, then the readers are checked round-robin for the answer. That way the 25ms timeout
+    of a reader without PICC runs in parallel to the other readers instead of stalling them.
+
+    Each reader has a weight (number of polls per cycle, readers with a higher weight are polled more often)
+    and a time slice (maximum time in seconds to wait for the answer to REQA).
+
+    Example:
+    >>> manager = ReaderManager(callback=lambda reader, event: print(reader.name, event))
+    >>> for pin_ce in (5, 6, 13, 19):
+    >>>     manager.add_reader(MFRC522(pin_ce=pin_ce, pin_irq=0), name='gate-{}'.format(pin_ce))
+    >>> manager.init()
+    >>> manager.run()
+    '''
+
+    def __init__(self, bus_lock=None, callback=None, clock=time.monotonic, dedupe=None):
+        '''
+        Create a new ReaderManager
+
+        @param bus_lock: Lock that must be held for each SPI transaction (default = new threading.RLock)
+        @param callback: Optional function callback(reader, event) called for each selected PICC
+        @param clock: Function returning the current time in seconds (default = time.monotonic)
+        @param dedupe: Optional DedupeCache shared by all readers, a PICC seen again within its ttl is not reported
+        '''
+        self.bus_lock = bus_lock if bus_lock else threading.RLock()
+        self.callback = callback
+        self.clock = clock
+        self.dedupe = dedupe
+        self.readers = []
+        self._next = 0
+        self._stop = threading.Event()
+
+    def add_reader(self, rfid, name=None, weight=1, time_slice=0.03):
+        '''
+        Registers a MFRC522
+
+        @param rfid: The MFRC522 instance
+        @param name: Name of the reader (default = 'reader-<index>')
+        @param weight: Number of polls per cycle (default = 1)
+        @param time_slice: Maximum time in seconds to wait for the answer of a PICC (default = 0.03, slightly longer than the 25ms timer of the MFRC522)
+        @return: ManagedReader
+        '''
+        reader = ManagedReader(rfid, name if name else 'reader-{}'.format(len(self.readers)), max(1, weight), time_slice)
+        self.readers.append(reader)
+        return reader
+
+    def init(self):
+        '''
+        Initializes all readers
+        '''
+        now = self.clock()
+        for reader in self.readers:
+            with self.bus_lock:
+                reader.rfid.pcd_init()
+            reader.stats_start = now
+
+    def cleanup(self):
+        for reader in self.readers:
+            with self.bus_lock:
+                reader.rfid.pcd_cleanup()
+
+    def run_cycle(self):
+        '''
+        Polls every reader weight times. Readers are scheduled in rounds, round n contains all readers with weight > n.
+        The start of the readers in a round is rotated from cycle to cycle.
+
+        @return: List of (ManagedReader, CardEvent) for the PICCs selected in this cycle
+        '''
+        events = []
+        if not self.readers:
+            return events
+
+        start = self._next % len(self.readers)
+        order = self.readers[start:] + self.readers[:start]
+        self._next += 1
+
+        for n in range(max(r.weight for r in order)):
+            events.extend(self._run_round([r for r in order if r.weight > n]))
+        return events
+
+    def run(self, interval=0.0):
+        '''
+        Runs cycles until stop() is called
+
+        @param interval: Pause in seconds between two cycles (default = 0.0)
+        '''
+        self._stop.clear()
+        while not self._stop.is_set():
+            self.run_cycle()
+            if interval > 0:
+                self._stop.wait(interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def get_stats(self):
+        '''
+        @return: dict reader name -> throughput counters
+        '''
+        now = self.clock()
+        return {reader.name: reader.get_stats(now) for reader in self.readers}
+
+    def reset_stats(self):
+        now = self.clock()
+        for reader in self.readers:
+            reader.reset_stats()
+            reader.stats_start = now
+
+    def _run_round(self, readers):
+        for reader in readers:
+            self._start_request(reader)
+
+        events = []
+        waiting = list(readers)
+        while waiting:
+            for reader in list(waiting):
+                status = self._poll_request(reader)
+                if status is None:
+                    continue
+                waiting.remove(reader)
+                if status == StatusCode.STATUS_OK:
+                    event = self._select(reader)
+                    if event:
+                        events.append((reader, event))
+                        if self.callback:
+                            self.callback(reader, event)
+        return events
+
+    def _start_request(self, reader):
+        reader.polls += 1
+        reader.started = self.clock()
+        with self.bus_lock:
+            reader.rfid.pcd_clear_register_bitmask(PCD_Register.CollReg, 0x80)         # ValuesAfterColl=1 => Bits received after collision are cleared.
+            reader.rfid.pcd_start_communication(PCD_Command.PCD_Transceive, [PICC_Command.PICC_CMD_REQA.value], 7,
+                                               picc_command=PICC_Command.PICC_CMD_REQA)
+
+    def _poll_request(self, reader):
+        with self.bus_lock:
+            status = reader.rfid.pcd_poll_communication(0x30)                          # RxIRq and IdleIRq
+            if status is None and self.clock() - reader.started > reader.time_slice:
+                reader.rfid.pcd_write_register(PCD_Register.CommandReg, PCD_Command.PCD_Idle.value)
+                status = StatusCode.STATUS_TIMEOUT
+        if status is not None:
+            reader.busy_time += self.clock() - reader.started
+        if status == StatusCode.STATUS_TIMEOUT:
+            reader.timeouts += 1
+        return status
+
+    def _select(self, reader):
+        start = self.clock()
+        with self.bus_lock:
+            status, atqa, rx_valid_bits = reader.rfid.pcd_finish_communication(PCD_Command.PCD_Transceive, True)
+            if status != StatusCode.STATUS_OK or len(atqa) != 2 or rx_valid_bits != 0:     # ATQA must be exactly 16 bits.
+                reader.errors += 1
+                return None
+            status, uid = reader.rfid.picc_select()
+            if status == StatusCode.STATUS_OK:
+                reader.rfid.picc_halt_a()
+        now = self.clock()
+        reader.busy_time += now - start
+        if status != StatusCode.STATUS_OK:
+            reader.errors += 1
+            logger_debug.debug(_F('Select failed (reader: {}, status: {})', reader.name, status))
+            return None
+        if self.dedupe is not None and self.dedupe.is_duplicate(uid):
+            reader.duplicates += 1
+            return None
+        reader.cards += 1
+        return CardEvent(CardEventType.ARRIVED, uid, now)
@@ -0,0 +1,247 @@
+'''
+Presence tracking of a PICC in the field of the MFRC522
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import logging
+import threading
+import time
+from enum import Enum
+
+from .utils import FormatString as _F
+from .mfrc522 import StatusCode
+from .events import (
+    CardEvent,
+    CardEventType
+)
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+
+class PresenceState(Enum):
+    '''
+    States of the PresenceTracker
+    '''
+
+    ABSENT                  = 0    # No PICC is tracked
+    PRESENT                 = 1    # A PICC is tracked and answered the last keep-alive probe
+    MISSING                 = 2    # A PICC is tracked but did not answer the last keep-alive probe(s)
+
+
+class KeepAlive(Enum):
+    '''
+    Keep-alive probes sent to a tracked PICC
+    '''
+
+    RESELECT                = 0    # WUPA + SELECT of the known UID + HLTA, only the tracked PICC answers
+    WAKEUP                  = 1    # WUPA only, any PICC in the field answers
+
+
+class PresenceTracker(object):
+    '''
+    Follows a PICC in the field with cheap keep-alive probes and emits ARRIVED and REMOVED CardEvents.
+
+    While no PICC is tracked, the tracker looks for a new PICC every arrival_interval seconds.
+    A tracked PICC is probed every removal_latency / miss_threshold seconds. The PICC is reported
+    as removed after miss_threshold consecutive probes failed (debounce), so the removal is detected
+    within roughly removal_latency seconds.
+
+    The tracked PICC is left in state HALT after each probe, that way it does not answer to REQA
+    (e. g. picc_is_new_card_present) but to the WUPA of the next probe.
+
+    Example:
+    >>> tracker = PresenceTracker(rfid, removal_latency=0.1)
+    >>> while True:
+    >>>     for event in tracker.poll():
+    >>>         print(event)
+    >>>     time.sleep(tracker.next_poll_delay())
+    '''
+
+    def __init__(self, rfid, removal_latency=0.2, miss_threshold=3, arrival_interval=0.1, keep_alive=KeepAlive.RESELECT, callback=None, clock=time.monotonic, dedupe=None):
+        '''
+        Create a new PresenceTracker
+
+        @param rfid: The MFRC522 instance
+        @param removal_latency: Target latency in seconds for detecting the removal of the PICC (default = 0.2)
+        @param miss_threshold: Number of consecutive failed probes before the PICC is reported as removed (default = 3)
+        @param arrival_interval: Interval in seconds between looking for a new PICC (default = 0.1)
+        @param keep_alive: One of the KeepAlive enums (default = KeepAlive.RESELECT)
+        @param callback: Optional function called with each CardEvent
+        @param clock: Function returning the current time in seconds (default = time.monotonic)
+        @param dedupe: Optional DedupeCache, the events of a PICC seen again within its ttl are suppressed
+        '''
+        self.rfid = rfid
+        self.miss_threshold = max(1, miss_threshold)
+        self.probe_interval = removal_latency / self.miss_threshold
+        self.arrival_interval = arrival_interval
+        self.keep_alive = keep_alive
+        self.callback = callback
+        self.clock = clock
+        self.dedupe = dedupe
+
+        self.state = PresenceState.ABSENT
+        self.uid = None
+        self.misses = 0
+        self.last_seen = None
+        self.suppressed = False         # ARRIVED of the tracked PICC was a duplicate, REMOVED is suppressed as well
+
+        # Statistics
+        self.probes = 0
+        self.failed_probes = 0
+        self.removals = 0
+        self.last_removal_latency = None
+        self.max_removal_latency = None
+        self.total_removal_latency = 0.0
+
+    def track(self, uid):
+        '''
+        Start tracking an already selected PICC (no ARRIVED event is emitted).
+        The PICC should be halted (picc_halt_a) afterwards, the next probe wakes it up again.
+
+        @param uid: Uid of the PICC or None to track any PICC (then KeepAlive.WAKEUP is used)
+        '''
+        self.uid = uid.copy() if uid else None
+        self.suppressed = False
+        self.state = PresenceState.PRESENT
+        self.misses = 0
+        self.last_seen = self.clock()
+
+    def next_poll_delay(self):
+        '''
+        @return: Seconds to wait before the next call to poll()
+        '''
+        if self.state == PresenceState.ABSENT:
+            return self.arrival_interval
+        return self.probe_interval
+
+    def poll(self):
+        '''
+        Performs one step: looks for a new PICC or probes the tracked PICC.
+
+        @return: List of CardEvents (empty if nothing changed)
+        '''
+        if self.state == PresenceState.ABSENT:
+            return self._look_for_card()
+        return self._probe_card()
+
+    def wait_for_removal(self, cancel_event=None, timeout=None):
+        '''
+        Blocks until the tracked PICC is removed.
+
+        @param cancel_event: Optional threading.Event, setting it cancels waiting
+        @param timeout: Optional timeout in seconds
+        @return: True if the PICC was removed, False if waiting was canceled or timed out
+        '''
+        cancel_event = cancel_event if cancel_event else threading.Event()
+        deadline = None if timeout is None else self.clock() + timeout
+        while self.state != PresenceState.ABSENT:
+            for event in self.poll():
+                if event.event_type == CardEventType.REMOVED:
+                    return True
+            delay = self.next_poll_delay()
+            if deadline is not None:
+                delay = min(delay, deadline - self.clock())
+                if delay <= 0:
+                    return False
+            if cancel_event.wait(delay):
+                return False
+        return True
+
+    def get_stats(self):
+        '''
+        @return: dict with the number of probes, failed probes, removals and the measured removal detection latencies (seconds)
+        '''
+        return {
+            'state': self.state.name,
+            'probes': self.probes,
+            'failed_probes': self.failed_probes,
+            'removals': self.removals,
+            'last_removal_latency': self.last_removal_latency,
+            'max_removal_latency': self.max_removal_latency,
+            'avg_removal_latency': self.total_removal_latency / self.removals if self.removals else None,
+        }
+
+    def _look_for_card(self):
+        if not self.rfid.picc_is_card_present():
+            return []
+
+        status, uid = self.rfid.picc_select()
+        if status != StatusCode.STATUS_OK:
+            return []
+        self.rfid.picc_halt_a()
+
+        self.track(uid)
+        if self.dedupe is not None and self.dedupe.is_duplicate(uid):
+            logger_debug.debug(_F('Duplicate PICC suppressed (uid: {})', uid))
+            self.suppressed = True
+            return []
+        return self._emit(CardEvent(CardEventType.ARRIVED, self.uid.copy(), self.last_seen))
+
+    def _probe_card(self):
+        self.probes += 1
+        now = self.clock()
+        if self._send_keep_alive():
+            self.state = PresenceState.PRESENT
+            self.misses = 0
+            self.last_seen = now
+            return []
+
+        self.failed_probes += 1
+        self.misses += 1
+        self.state = PresenceState.MISSING
+        if self.misses < self.miss_threshold:
+            return []
+
+        # Debounce threshold reached, the PICC is gone
+        latency = now - self.last_seen
+        self.removals += 1
+        self.last_removal_latency = latency
+        self.total_removal_latency += latency
+        if self.max_removal_latency is None or latency > self.max_removal_latency:
+            self.max_removal_latency = latency
+
+        uid = self.uid
+        suppressed = self.suppressed
+        self.state = PresenceState.ABSENT
+        self.uid = None
+        self.misses = 0
+        self.suppressed = False
+        logger_debug.debug(_F('PICC removed (uid: {}, latency: {:.1f}ms)', uid, latency * 1000))
+        if self.dedupe is not None and uid:
+            self.dedupe.touch(uid, self.last_seen)      # The ttl starts when the PICC was seen the last time
+        if suppressed:
+            return []
+        return self._emit(CardEvent(CardEventType.REMOVED, uid, now, latency))
+
+    def _send_keep_alive(self):
+        if not self.rfid.picc_is_card_present():                        # WUPA
+            return False
+        if self.keep_alive == KeepAlive.WAKEUP or self.uid is None:
+            return True
+
+        # SELECT of the known UID - no anticollision needed, only the tracked PICC answers
+        status, __ = self.rfid.picc_select(self.uid.copy(), self.uid.size * 8)
+        if status != StatusCode.STATUS_OK:
+            return False
+        self.rfid.picc_halt_a()
+        return True
+
+    def _emit(self, event):
+        if self.callback:
+            self.callback(event)
+        return [event]
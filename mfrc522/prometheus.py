@@ -0,0 +1,206 @@
+'''
+HTTP exporter of the MFRC522 metrics in the Prometheus text format.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import logging
+import threading
+import time
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer
+)
+
+from .utils import FormatString as _F
+from .health import HealthState
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_COUNTERS = (
+    ('spi_transfers', 'SPI transfers'),
+    ('spi_bytes', 'Bytes transferred over SPI'),
+    ('register_reads', 'Registers read'),
+    ('register_writes', 'Registers written'),
+    ('timeouts', 'Commands without answer of the PICC'),
+    ('protocol_errors', 'Buffer overflow, parity or protocol errors'),
+    ('collisions', 'Bit collisions'),
+    ('crc_errors', 'Frames with wrong CRC_A'),
+    ('nacks', 'MIFARE NAKs'),
+)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(labels):
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in labels) + '}'
+
+def _format_float(value):
+    if isinstance(value, int):
+        return str(value)
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def render_metrics(readers, now=None, watchdogs=None):
+    '''
+    Renders the metrics of the given readers in the Prometheus text format.
+    Only the metrics attributes are read, no SPI communication is done.
+
+    @param readers: List of MFRC522 instances (readers without metrics are skipped)
+    @param now: time.monotonic() used for the ages (default = now)
+    @param watchdogs: Optional list of HealthWatchdog instances, labeled with the reader they watch
+    @return: The exposition as string
+    '''
+    now = time.monotonic() if now is None else now
+    families = {}           # Family name -> (type, help, samples)
+
+    def add(family, metric_type, help_text, labels, value, suffix=''):
+        samples = families.setdefault(family, (metric_type, help_text, []))[2]
+        samples.append('{}{}{} {}'.format(family, suffix, _labels(labels), _format_float(value)))
+
+    for rfid in readers:
+        metrics = getattr(rfid, 'metrics', None)
+        if metrics is None:
+            continue
+        snapshot = metrics.snapshot()
+        reader = [('bus', rfid.bus), ('device', rfid.device), ('pin_ce', rfid.pin_ce)]
+
+        for key, help_text in _COUNTERS:
+            add('mfrc522_{}_total'.format(key), 'counter', help_text, reader, snapshot[key])
+        for command, count in sorted(snapshot['frames'].items()):
+            add('mfrc522_frames_total', 'counter', 'Frames sent to PICCs by command', reader + [('command', command)], count)
+
+        for operation, histogram in sorted(snapshot['operations'].items()):
+            labels = reader + [('operation', operation)]
+            cumulative = 0
+            for bound, count in histogram['buckets']:
+                cumulative += count
+                add('mfrc522_operation_duration_seconds', 'histogram', 'Duration of the driver operations', labels + [('le', _format_float(bound))], cumulative, '_bucket')
+            add('mfrc522_operation_duration_seconds', 'histogram', 'Duration of the driver operations', labels, histogram['sum'], '_sum')
+            add('mfrc522_operation_duration_seconds', 'histogram', 'Duration of the driver operations', labels, histogram['count'], '_count')
+
+        if snapshot['version'] is not None:
+            add('mfrc522_version_register', 'gauge', 'Last value read from the VersionReg (0x00 or 0xFF: communication failed)', reader, snapshot['version'])
+            add('mfrc522_version_probe_age_seconds', 'gauge', 'Seconds since the VersionReg was read', reader, now - snapshot['version_time'])
+        if snapshot['last_select'] is not None:
+            add('mfrc522_last_select_age_seconds', 'gauge', 'Seconds since the last successful picc_select', reader, now - snapshot['last_select'])
+        add('mfrc522_metrics_uptime_seconds', 'gauge', 'Seconds since the metrics were reset', reader, snapshot['uptime'])
+
+    for watchdog in watchdogs or ():
+        stats = watchdog.get_stats()
+        rfid = watchdog.rfid
+        reader = [('bus', rfid.bus), ('device', rfid.device), ('pin_ce', rfid.pin_ce)]
+
+        for state in HealthState:
+            add('mfrc522_health_state', 'gauge', 'State of the health watchdog (1 for the current state)', reader + [('state', state.name)], int(state.name == stats['state']))
+        add('mfrc522_health_probes_total', 'counter', 'Health probes', reader, stats['probes'])
+        add('mfrc522_health_failed_probes_total', 'counter', 'Failed health probes', reader, stats['failed_probes'])
+        add('mfrc522_health_recovery_attempts_total', 'counter', 'Recovery attempts', reader, stats['recovery_attempts'])
+        for step, count in stats['recoveries_by_step'].items():
+            add('mfrc522_health_recoveries_total', 'counter', 'Successful recoveries by step', reader + [('step', step)], count)
+        add('mfrc522_health_downtime_seconds_total', 'counter', 'Seconds the MFRC522 was not healthy', reader, stats['downtime'])
+
+    lines = []
+    for family, (metric_type, help_text, samples) in families.items():
+        lines.append('# HELP {} {}'.format(family, help_text))
+        lines.append('# TYPE {} {}'.format(family, metric_type))
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        exporter = self.server.exporter
+        body = render_metrics(exporter.readers, watchdogs=exporter.watchdogs).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger_debug.debug(_F('Metrics exporter: {}', format % args))
+
+
+class MetricsExporter(object):
+    '''
+    Serves the metrics of one or more MFRC522 (see ReaderMetrics) over HTTP in the Prometheus text format,
+    labeled with bus, device and pin_ce of each reader. Only the standard library is used.
+
+    The exporter reads the metrics attributes of the readers, it never talks to the MFRC522 and never
+    takes a lock the reader has to wait for.
+
+    Example:
+    >>> exporter = MetricsExporter([rfid], port=9522)
+    >>> exporter.start()
+    >>> # curl http://localhost:9522/metrics
+    '''
+
+    def __init__(self, readers=None, host='127.0.0.1', port=9522, watchdogs=None):
+        '''
+        Create a new MetricsExporter
+
+        @param readers: List of MFRC522 instances (default = none, see add_reader)
+        @param host: Address to listen on (default = 127.0.0.1, local only)
+        @param port: TCP port, 0 for any free port (default = 9522)
+        @param watchdogs: Optional list of HealthWatchdog instances whose statistics are exported
+        '''
+        self.readers = list(readers) if readers else []
+        self.watchdogs = list(watchdogs) if watchdogs else []
+        self.host = host
+        self.port = port
+        self.server = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_reader(self, rfid):
+        self.readers = self.readers + [rfid]        # Replaced, not modified, the handler threads iterate over it
+
+    def start(self):
+        '''
+        Starts serving in a daemon thread
+        '''
+        self.server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self.server.daemon_threads = True
+        self.server.exporter = self
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, name='mfrc522-metrics', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+        self.server = None
+        self._thread = None
@@ -0,0 +1,408 @@
+'''
+Reader service that owns a MFRC522 and executes all operations on a single worker thread.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .utils import format_hex
+from .utils import FormatString as _F
+from .mfrc522 import (
+    PICC_Command,
+    StatusCode,
+    MIFARE_Key
+)
+from .access_bits import (
+    AccessOperation,
+    get_block_position
+)
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+
+PRIORITY_HIGH   = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW    = 20
+
+
+class _Operation(object):
+    '''
+    An operation waiting in the queue of the ReaderService
+    '''
+
+    def __init__(self, func, args, kwargs, coalesce_key):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.coalesce_key = coalesce_key
+        self.future = Future()
+        self.submit_time = time.monotonic()
+
+
+class ReaderService(object):
+    '''
+    Owns one MFRC522 and executes all operations on a single worker thread, so that SPI transactions of
+    different application threads cannot interleave.
+
+    Operations are queued with a priority (lower value first, FIFO for equal priorities) and return a
+    concurrent.futures.Future. Operations submitted with the same coalesce key while an equal operation is
+    still waiting in the queue share the Future of the waiting operation (e. g. several threads asking for the
+    card currently in the field trigger only one select).
+
+    With a HealthWatchdog the operations are executed while holding its bus_lock and wait while the
+    watchdog recovers the MFRC522. The watchdog is started after pcd_init() and stopped with the service.
+
+    Example:
+    >>> with ReaderService(MFRC522()) as service:
+    >>>     status, uid, blocks = service.read_blocks([4, 5, 6]).result()
+    '''
+
+    def __init__(self, rfid, key=None, init=True, watchdog=None):
+        '''
+        Create a new ReaderService
+
+        @param rfid: The MFRC522 instance, it must only be used through this service afterwards
+        @param key: Default MIFARE_Key for read and write operations (default = factory key FFFFFFFFFFFFh)
+        @param init: Call pcd_init() on the worker thread when the service is started (default = True)
+        @param watchdog: Optional HealthWatchdog of the same MFRC522
+        '''
+        self.rfid = rfid
+        self.key = key if key else MIFARE_Key()
+        self.init = init
+        self.watchdog = watchdog
+        self._bus_lock = watchdog.bus_lock if watchdog else threading.RLock()
+
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._pending = {}                  # coalesce key -> waiting _Operation
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = object()
+        self._stopped = False
+
+        self.reset_stats()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        '''
+        Starts the worker thread
+        '''
+        if self._thread is not None:
+            return
+        with self._lock:
+            self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='mfrc522-reader-service', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        '''
+        Stops the worker thread after all queued operations are executed. Afterwards submit() raises RuntimeError.
+
+        @param wait: Block until the worker thread terminated (default = True)
+        '''
+        if self._thread is None:
+            return
+        with self._lock:
+            self._stopped = True
+            self._queue.put((float('inf'), next(self._sequence), self._stop))     # After any priority
+        if wait:
+            self._thread.join()
+        self._thread = None
+
+    def submit(self, func, *args, priority=PRIORITY_NORMAL, coalesce_key=None, **kwargs):
+        '''
+        Queues an operation. The function is called on the worker thread with the MFRC522 instance as first argument.
+
+        @param func: Function func(rfid, *args, **kwargs)
+        @param priority: Priority of the operation, lower values are executed first (default = PRIORITY_NORMAL)
+        @param coalesce_key: Optional hashable key, operations with the same key that are waiting in the queue are executed only once
+        @return: concurrent.futures.Future with the result of the function
+        @raise RuntimeError: If the service is stopped
+        '''
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError('ReaderService is stopped')
+            self.submitted += 1
+            if coalesce_key is not None:
+                pending = self._pending.get(coalesce_key)
+                if pending is not None:
+                    self.coalesced += 1
+                    return pending.future
+
+            operation = _Operation(func, args, kwargs, coalesce_key)
+            if coalesce_key is not None:
+                self._pending[coalesce_key] = operation
+            self._queue.put((priority, next(self._sequence), operation))
+        return operation.future
+
+    def select(self, priority=PRIORITY_NORMAL, wakeup=True):
+        '''
+        Selects a PICC in the field and halts it again.
+
+        @param priority: Priority of the operation (default = PRIORITY_NORMAL)
+        @param wakeup: Use WUPA (also wakes halted PICCs) instead of REQA (default = True)
+        @return: Future of (StatusCode, Uid)
+        '''
+        return self.submit(_select, wakeup, priority=priority, coalesce_key=('select', wakeup))
+
+    def inventory(self, max_cards=8, priority=PRIORITY_NORMAL):
+        '''
+        Selects and halts PICCs until no more PICCs answer to REQA. PICCs that are already halted are not found.
+
+        @param max_cards: Maximum number of PICCs to select (default = 8)
+        @param priority: Priority of the operation (default = PRIORITY_NORMAL)
+        @return: Future of a list of Uids
+        '''
+        return self.submit(_inventory, max_cards, priority=priority, coalesce_key=('inventory', max_cards))
+
+    def read_blocks(self, block_addrs, key=None, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A, priority=PRIORITY_NORMAL):
+        '''
+        Selects a MIFARE Classic PICC and reads the given blocks (one authentication per sector).
+
+        @param block_addrs: List of block numbers
+        @param key: MIFARE_Key (default = key of the service)
+        @param auth_command: PICC_CMD_MF_AUTH_KEY_A or PICC_CMD_MF_AUTH_KEY_B, or an AuthPlanner (default = PICC_CMD_MF_AUTH_KEY_A)
+        @param priority: Priority of the operation (default = PRIORITY_NORMAL)
+        @return: Future of (StatusCode, Uid, blocks) - blocks is a dict block number -> list of 16 bytes
+        '''
+        key = key if key else self.key
+        return self.submit(_read_blocks, list(block_addrs), key, auth_command, priority=priority,
+                           coalesce_key=('read_blocks', tuple(block_addrs), tuple(key.key_byte), _coalesce_id(auth_command)))
+
+    def write_blocks(self, blocks, key=None, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A, priority=PRIORITY_NORMAL):
+        '''
+        Selects a MIFARE Classic PICC and writes the given blocks (one authentication per sector).
+        Write operations are never coalesced.
+
+        @param blocks: dict block number -> list of 16 bytes
+        @param key: MIFARE_Key (default = key of the service)
+        @param auth_command: PICC_CMD_MF_AUTH_KEY_A or PICC_CMD_MF_AUTH_KEY_B, or an AuthPlanner (default = PICC_CMD_MF_AUTH_KEY_A)
+        @param priority: Priority of the operation (default = PRIORITY_NORMAL)
+        @return: Future of (StatusCode, Uid)
+        '''
+        key = key if key else self.key
+        return self.submit(_write_blocks, dict(blocks), key, auth_command, priority=priority)
+
+    def queue_depth(self):
+        '''
+        @return: Number of operations waiting in the queue
+        '''
+        return self._queue.qsize()
+
+    def reset_stats(self):
+        '''
+        Resets the statistics
+        '''
+        self.submitted = 0
+        self.coalesced = 0
+        self.completed = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        self.total_wait_time = 0.0
+        self.total_service_time = 0.0
+        self.max_service_time = 0.0
+
+    def get_stats(self):
+        '''
+        @return: dict with the queue depth, the number of submitted, coalesced, completed and failed operations and the wait and service times (seconds)
+        '''
+        executed = self.completed + self.failed
+        return {
+            'queue_depth': self.queue_depth(),
+            'max_queue_depth': self.max_queue_depth,
+            'submitted': self.submitted,
+            'coalesced': self.coalesced,
+            'completed': self.completed,
+            'failed': self.failed,
+            'avg_wait_time': self.total_wait_time / executed if executed else None,
+            'avg_service_time': self.total_service_time / executed if executed else None,
+            'max_service_time': self.max_service_time,
+        }
+
+    def _run(self):
+        if self.init:
+            with self._bus_lock:
+                self.rfid.pcd_init()
+        if self.watchdog:
+            self.watchdog.start()
+
+        while True:
+            depth = self._queue.qsize()
+            if depth > self.max_queue_depth:
+                self.max_queue_depth = depth
+
+            __, __, operation = self._queue.get()
+            if operation is self._stop:
+                break
+
+            with self._lock:
+                if operation.coalesce_key is not None:
+                    self._pending.pop(operation.coalesce_key, None)
+            if self.watchdog and not self._wait_healthy():
+                operation.future.cancel()
+                continue
+            if not operation.future.set_running_or_notify_cancel():
+                continue
+
+            start = time.monotonic()
+            try:
+                with self._bus_lock:
+                    result = operation.func(self.rfid, *operation.args, **operation.kwargs)
+            except Exception as e:
+                logger_debug.exception(_F('Operation {} failed', getattr(operation.func, '__name__', operation.func)))
+                self.failed += 1
+                operation.future.set_exception(e)
+            else:
+                self.completed += 1
+                operation.future.set_result(result)
+            end = time.monotonic()
+
+            service_time = end - start
+            self.total_wait_time += start - operation.submit_time
+            self.total_service_time += service_time
+            if service_time > self.max_service_time:
+                self.max_service_time = service_time
+
+        if self.watchdog:
+            self.watchdog.stop()
+        self._cancel_pending()
+
+    def _wait_healthy(self):
+        # Operations wait while the MFRC522 is recovered instead of running into timeouts, until the service is stopped
+        while not self.watchdog.wait_healthy(0.1):
+            with self._lock:
+                if self._stopped:
+                    return False
+        return True
+
+    def _cancel_pending(self):
+        # Operations left in the queue would never be executed, their callers must not wait forever
+        while True:
+            try:
+                __, __, operation = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if operation is not self._stop:
+                operation.future.cancel()
+        with self._lock:
+            self._pending.clear()
+
+
+def _coalesce_id(auth_command):
+    # AuthPlanner instances are only coalesced with themselves
+    return auth_command if isinstance(auth_command, PICC_Command) else id(auth_command)
+
+def _select(rfid, wakeup):
+    if wakeup:
+        present = rfid.picc_is_card_present()
+    else:
+        present = rfid.picc_is_new_card_present()
+    if not present:
+        return StatusCode.STATUS_TIMEOUT, None
+
+    status, uid = rfid.picc_select()
+    if status == StatusCode.STATUS_OK:
+        rfid.picc_halt_a()
+    return status, uid
+
+def _inventory(rfid, max_cards):
+    uids = []
+    while len(uids) < max_cards and rfid.picc_is_new_card_present():
+        status, uid = rfid.picc_select()
+        if status != StatusCode.STATUS_OK:
+            break
+        rfid.picc_halt_a()
+        uids.append(uid)
+    return uids
+
+def _group_by_sector(block_addrs):
+    sectors = {}
+    for block_addr in block_addrs:
+        sectors.setdefault(get_block_position(block_addr)[0], []).append(block_addr)
+    return sectors
+
+def _select_mifare_classic(rfid):
+    if not rfid.picc_is_card_present():
+        return StatusCode.STATUS_TIMEOUT, None
+    status, uid = rfid.picc_select()
+    if status != StatusCode.STATUS_OK:
+        return status, uid
+    if not uid.get_picc_type().is_mifare_classic():
+        rfid.picc_halt_a()
+        return StatusCode.STATUS_INVALID, uid
+    return StatusCode.STATUS_OK, uid
+
+def _authenticate(rfid, uid, key, auth_command, block_addrs, operation):
+    if not isinstance(auth_command, PICC_Command):          # Let the planner decide
+        auth_command = auth_command.get_common_auth_command(block_addrs, [operation])
+        if auth_command is None:
+            return StatusCode.STATUS_INVALID
+    return rfid.pcd_authenticate(auth_command, block_addrs[0], key, uid)
+
+def _read_blocks(rfid, block_addrs, key, auth_command):
+    status, uid = _select_mifare_classic(rfid)
+    if status != StatusCode.STATUS_OK:
+        return status, uid, None
+
+    blocks = {}
+    try:
+        for sector_blocks in _group_by_sector(block_addrs).values():
+            status = _authenticate(rfid, uid, key, auth_command, sector_blocks, AccessOperation.READ)
+            if status != StatusCode.STATUS_OK:
+                logger_debug.error(_F('Authentication failed (block_addr: {:#04x}, uid: [{}])', sector_blocks[0], format_hex(uid.uid())))
+                return status, uid, None
+            for block_addr in sector_blocks:
+                status, data = rfid.mifare_read(block_addr)
+                if status != StatusCode.STATUS_OK:
+                    return status, uid, None
+                blocks[block_addr] = data[:16]
+    finally:
+        rfid.picc_halt_a()
+        rfid.pcd_stop_crypto1()
+    return StatusCode.STATUS_OK, uid, blocks
+
+def _write_blocks(rfid, blocks, key, auth_command):
+    status, uid = _select_mifare_classic(rfid)
+    if status != StatusCode.STATUS_OK:
+        return status, uid
+
+    try:
+        for sector_blocks in _group_by_sector(sorted(blocks)).values():
+            status = _authenticate(rfid, uid, key, auth_command, sector_blocks, AccessOperation.WRITE)
+            if status != StatusCode.STATUS_OK:
+                logger_debug.error(_F('Authentication failed (block_addr: {:#04x}, uid: [{}])', sector_blocks[0], format_hex(uid.uid())))
+                return status, uid
+            for block_addr in sector_blocks:
+                status = rfid.mifare_write(block_addr, blocks[block_addr])
+                if status != StatusCode.STATUS_OK:
+                    return status, uid
+    finally:
+        rfid.picc_halt_a()
+        rfid.pcd_stop_crypto1()
+    return StatusCode.STATUS_OK, uid
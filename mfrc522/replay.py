@@ -0,0 +1,172 @@
+'''
+Deterministic replay of recorded SPI sessions.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import logging
+
+from .utils import FormatString as _F
+from .trace import (
+    TraceDirection,
+    read_trace
+)
+
+
+logger_debug = logging.getLogger('mfrc522.log')
+
+
+class ReplayError(Exception):
+    '''
+    The driver deviated from the recorded session (strict replay only)
+    '''
+    pass
+
+
+class ReplayTransport(object):
+    '''
+    Drop-in replacement for spidev.SpiDev that answers the register reads of the driver from a recorded session,
+    that way real card traffic can be replayed off-hardware, deterministically and as fast as possible.
+
+    Record a session with a BinaryTracer (IRQ edges are recorded by SimpleMFRC522 / AsyncMFRC522):
+    >>> rfid.tracer = BinaryTracer(open('session.trace', 'wb'))
+
+    Replay it:
+    >>> replay = ReplayTransport.from_file('session.trace')
+    >>> rfid = MFRC522(pin_reset=0, pin_irq=0, spi=replay)
+    >>> rfid.picc_is_new_card_present()
+
+    In strict mode every transfer must match the recording, otherwise a ReplayError is raised. By default the replay
+    tolerates a driver doing fewer or other transfers than the recorded one (e. g. after an optimization): writes
+    that do not match the next recorded write are ignored, a read is answered by the next recorded read of the same
+    register within lookahead records (the records in between are skipped). Reads without a recorded answer return
+    the last value recorded for the register. get_stats() reports how well the driver followed the recording.
+    '''
+
+    def __init__(self, records, strict=False, lookahead=64, irq_callback=None):
+        '''
+        Create a new ReplayTransport
+
+        @param records: List of TraceRecords (see read_trace)
+        @param strict: Raise a ReplayError if a transfer does not match the recording (default = False)
+        @param lookahead: Maximum number of records skipped to find the answer of a read (default = 64)
+        @param irq_callback: Optional function called without arguments for each recorded IRQ edge, when the replay reaches it
+        '''
+        self.records = list(records)
+        self.strict = strict
+        self.lookahead = lookahead
+        self.irq_callback = irq_callback
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.is_open = False
+
+        self.position = 0
+        self._last_values = {}                  # Register -> last recorded value, answer of reads that are not in the recording
+        self.matched = 0
+        self.skipped = 0
+        self.unmatched = 0
+        self.irqs = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        '''
+        @param path: Path of a file written by BinaryTracer
+        '''
+        with open(path, 'rb') as f:
+            return cls(read_trace(f), **kwargs)
+
+    @property
+    def finished(self):
+        return self.position >= len(self.records)
+
+    def open(self, bus, device):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def xfer2(self, data):
+        self._deliver_irqs()
+        if data[0] & 0x80:
+            return self._read(data[0] & 0x7E, len(data) - 1)
+        self._write(data[0], data[1:])
+        return [0] * len(data)
+
+    def get_stats(self):
+        '''
+        @return: dict with the number of matched, skipped and unmatched transfers, the delivered IRQs,
+                 the remaining records and the duration of the recorded session in seconds
+        '''
+        timestamps = [record.timestamp for record in self.records]
+        return {
+            'matched': self.matched,
+            'skipped': self.skipped,
+            'unmatched': self.unmatched,
+            'irqs': self.irqs,
+            'remaining': len(self.records) - self.position,
+            'recorded_duration': timestamps[-1] - timestamps[0] if timestamps else 0.0,
+        }
+
+    def _write(self, register, values):
+        if not self.finished:
+            record = self.records[self.position]
+            if record.direction == TraceDirection.WRITE and record.register == register and record.data == list(values):
+                self.position += 1
+                self.matched += 1
+                return
+        self._mismatch('write', register, values)
+
+    def _read(self, register, count):
+        end = min(len(self.records), self.position + (1 if self.strict else self.lookahead + 1))
+        for index in range(self.position, end):
+            record = self.records[index]
+            if record.direction == TraceDirection.READ and record.register == register and len(record.data) == count:
+                self._skip_to(index)
+                self.position += 1
+                self.matched += 1
+                self._last_values[register] = record.data[-1]
+                return [0] + list(record.data)
+        self._mismatch('read', register, [])
+        return [0] + [self._last_values.get(register, 0)] * count
+
+    def _skip_to(self, index):
+        while self.position < index:
+            record = self.records[self.position]
+            if record.direction == TraceDirection.IRQ:
+                self._fire_irq()
+            else:
+                self.skipped += 1
+                if record.direction == TraceDirection.READ and record.data:
+                    self._last_values[record.register] = record.data[-1]
+            self.position += 1
+
+    def _deliver_irqs(self):
+        while not self.finished and self.records[self.position].direction == TraceDirection.IRQ:
+            self.position += 1
+            self._fire_irq()
+
+    def _fire_irq(self):
+        self.irqs += 1
+        if self.irq_callback:
+            self.irq_callback()
+
+    def _mismatch(self, operation, register, values):
+        self.unmatched += 1
+        if self.strict:
+            expected = self.records[self.position] if not self.finished else 'end of recording'
+            raise ReplayError('Unexpected {} of register {:#04x} {} at record {} (expected: {})'.format(
+                operation, register, list(values), self.position, expected))
+        logger_debug.debug(_F('Replay: unmatched {} of register {:#04x} at record {}', operation, register, self.position))
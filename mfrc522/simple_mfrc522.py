@@ -20,7 +20,6 @@ along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import logging
 import threading
-import RPi.GPIO as GPIO
 from .utils import (
     format_hex,
     FormatString as _F
@@ -33,6 +32,8 @@ from .mfrc522 import (
     PCD_Command,
     MIFARE_Key
 )
+from .presence import PresenceTracker
+from .access_bits import get_block_position
 
 
 logger_debug = logging.getLogger('mfrc522.log')
@@ -42,7 +43,7 @@ class SimpleMFRC522(object):
     '''
     '''
 
-    def __init__(self, bus=0, device=0, speed=1000000, pin_reset=25, pin_ce=0, pin_irq=24, pin_mode=GPIO.BCM):
+    def __init__(self, bus=0, device=0, speed=1000000, pin_reset=25, pin_ce=0, pin_irq=24, pin_mode=None, dedupe=None, content_cache=None):
         '''
         Create a new SimpleMFRC522 instance
         
@@ -52,19 +53,28 @@ class SimpleMFRC522(object):
         @param pin_reset: The GPIO reset pin number (default = 25)
         @param pin_ce: The GPIO chip select pin number (default = 0, not connected)
         @param pin_irq: The GPIO IRQ pin number (default = 24)
-        @param pin_mode: GPIO pin numbering mode (default = GPIO.BCM)
+        @param pin_mode: GPIO pin numbering mode (default = None, GPIO.BCM)
+        @param dedupe: Optional DedupeCache, a PICC seen again within its ttl is ignored by read_bytes and read_text (writes and value transactions are not deduplicated)
+        @param content_cache: Optional ContentCache, read_bytes returns the cached data of a known PICC if its probe block did not change
         '''
         self.rfid = MFRC522(bus=bus, device=device, speed=speed, pin_reset=pin_reset, pin_ce=pin_ce, pin_irq=pin_irq, pin_mode=pin_mode)
+        self.dedupe = dedupe
+        self.content_cache = content_cache
         self.irq = threading.Event()
         self.cancel_irq = threading.Event()
+        self.last_uid = None
+        self.last_removal_latency = None
     
     def init(self):
         self.irq.clear()
         self.rfid.pcd_init()
-        GPIO.add_event_detect(self.rfid.pin_irq, GPIO.FALLING, callback=self.__interrupt_callback)
+        if self.rfid.pin_irq != 0:
+            self.rfid.gpio.add_event_detect(self.rfid.pin_irq, self.rfid.gpio.FALLING, callback=self.__interrupt_callback)
     
     def cleanup(self):
         self.rfid.pcd_cleanup()
+        if self.content_cache is not None:
+            self.content_cache.close()
     
     def is_new_card_present(self):
         return self.rfid.picc_is_new_card_present()
@@ -91,18 +101,18 @@ class SimpleMFRC522(object):
             waiting = True
             while waiting and not canceled:
                 # The receiving block needs regular retriggering (tell the tag it should transmit??)
-                self.__activate_reception()
+                self._activate_reception()
                 waiting = not self.irq.wait(0.1)
                 canceled = self.cancel_irq.is_set()
             logger_debug.debug('Interrupt from MFRC522')
         finally:
-            self.__clear_interrupt()
+            self._clear_interrupt()
             self.cancel_irq.clear()
             self.irq.clear()
         
         return not canceled
 
-    def __activate_reception(self):
+    def _activate_reception(self):
         '''
         The function sending to the MFRC522 the needed commands to activate the reception
         '''
@@ -116,36 +126,37 @@ class SimpleMFRC522(object):
         self.rfid.pcd_write_register(PCD_Register.CommandReg, PCD_Command.PCD_Transceive.value)
         self.rfid.pcd_write_register(PCD_Register.BitFramingReg, 0x87)
     
-    def __clear_interrupt(self):
+    def _clear_interrupt(self):
         '''
         The function to clear the pending interrupt bits after interrupt serving routine
         '''
         self.rfid.pcd_write_register(PCD_Register.ComIrqReg, 0x7F)
 
     def __interrupt_callback(self, __):
+        self.rfid.trace_irq()
         self.irq.set()
     
-    def wait_for_card_removed(self, retries=5):
+    def wait_for_card_removed(self, retries=5, removal_latency=0.2, uid=None):
         '''
-        Blocks until no cards are present (polls for new cards and if none are found in 5 times in a row 
-        assumes that no card is present)
-        
+        Blocks until the card is removed. The last selected card (or the given uid) is followed with keep-alive 
+        probes (see PresenceTracker), it is assumed to be removed if it did not answer to the given number of 
+        consecutive probes. If no card was selected before, any card answering to WUPA counts as present.
+        The measured detection latency is available in last_removal_latency afterwards.
+        
+        @param retries: Number of consecutive failed probes before the card is assumed to be removed (default = 5)
+        @param removal_latency: Target latency in seconds for detecting the removal (default = 0.2)
+        @param uid: Uid of the card to follow (default = the last card selected by this instance)
         @return: True if no cards are present, False if operation was canceled
         '''
         self.cancel_irq.clear()
         
-        is_card_present = True
-        canceled = False
-        while is_card_present and not canceled:
-            is_card_present = False
-            for __ in range(0, retries):            # Assumes that if 5 consecutive requests fail, that no card is present
-                if self.is_card_present():
-                    is_card_present = True
-            if is_card_present:                     # Check if the operation should be canceled
-                canceled = self.cancel_irq.wait(0.5)
+        tracker = PresenceTracker(self.rfid, removal_latency=removal_latency, miss_threshold=retries)
+        tracker.track(uid if uid else self.last_uid)
+        removed = tracker.wait_for_removal(cancel_event=self.cancel_irq)
+        self.last_removal_latency = tracker.last_removal_latency
         
         self.cancel_irq.clear()
-        return not canceled
+        return removed
     
     def cancel_wait(self):
         self.cancel_irq.set()
@@ -182,39 +193,55 @@ class SimpleMFRC522(object):
         @param terminal_byte: Byte value that indicates end of data (default = 0x00), set to None if all data should be returned
         @return: (StatusCode, Uid, data)
         '''
-        uid = None
-        is_card_present = False
-        while not is_card_present:
-            canceled = not self.wait_for_interrupt()
-            if canceled:
-                return StatusCode.STATUS_CANCELED, None, None
-            
-            status, uid = self.rfid.picc_read_card_serial()
-            if status != StatusCode.STATUS_OK::
-                logger_debug.warn(_F('Failed to read UID in read_bytes (status: {}, uid: {})', status, uid))
-                continue
-            
-            picc_type = uid.get_picc_type()
-            if picc_type.is_mifare_classic():
-                logger_debug.info(_F('Card found: MIFARE Classic PICC (uid: {})', uid))
-                is_card_present = True
-            else:
-                logger_debug.warn(_F('Unsupported PICC type (type: {}, uid: {})', picc_type, uid))
-                # Halt PICC
-                self.rfid.picc_halt_a()
+        status, uid = self._wait_for_mifare_classic('read_bytes', dedupe=True)
+        if status != StatusCode.STATUS_OK:
+            return status, None, None
         
-        status, data = self._read_mifare_classic(uid, terminal_byte=terminal_byte)
+        status, data = self._read_cached_mifare_classic(uid, terminal_byte=terminal_byte)
         
         # Halt PICC
         self.rfid.picc_halt_a()
         # Stop encryption on PCD
         self.rfid.pcd_stop_crypto1()
         
-        if status != StatusCode.STATUS_OK::
+        if status != StatusCode.STATUS_OK:
             return status, uid, None
         
         return status, uid, data
     
+    def _wait_for_mifare_classic(self, caller, dedupe=False):
+        '''
+        Blocks until a MIFARE Classic card is present and selected. Other PICCs are halted.
+        
+        @param caller: Name of the calling method (used for logging)
+        @param dedupe: Ignore PICCs reported as duplicate by the DedupeCache (default = False)
+        @return: (StatusCode, Uid) - STATUS_CANCELED if the operation was canceled
+        '''
+        while True:
+            canceled = not self.wait_for_interrupt()
+            if canceled:
+                return StatusCode.STATUS_CANCELED, None
+            
+            status, uid = self.rfid.picc_read_card_serial()
+            if not status:
+                logger_debug.warn(_F('Failed to read UID in {} (status: {}, uid: {})', caller, status, uid))
+                continue
+            
+            if dedupe and self.dedupe is not None and self.dedupe.is_duplicate(uid):
+                logger_debug.debug(_F('Duplicate PICC ignored in {} (uid: {})', caller, uid))
+                self.rfid.picc_halt_a()
+                continue
+            
+            picc_type = uid.get_picc_type()
+            if picc_type.is_mifare_classic():           # Only MIFARE Classic cards are supported for now
+                logger_debug.info(_F('Card found: MIFARE Classic PICC (uid: {})', uid))
+                self.last_uid = uid
+                return StatusCode.STATUS_OK, uid
+            
+            logger_debug.warn(_F('Unsupported PICC type (type: {}, uid: {})', picc_type, uid))
+            # Halt PICC
+            self.rfid.picc_halt_a()
+    
     def _read_mifare_classic(self, uid, terminal_byte=0x00):
         '''
         Read all data blocks from a previously selected MIFARE Classic card
@@ -231,7 +258,7 @@ class SimpleMFRC522(object):
             
             # Authenticate using key A
             status = self.rfid.pcd_authenticate(PICC_Command.PICC_CMD_MF_AUTH_KEY_A, trailer_block, key, uid)
-            if status != StatusCode.STATUS_OK::
+            if status != StatusCode.STATUS_OK:
                 logger_debug.error(_F('Authentication failed (block_addr: {:#04x}, uid: [{}])', trailer_block, format_hex(uid.uid())))
                 return status, None
             
@@ -250,7 +277,47 @@ class SimpleMFRC522(object):
         
         return StatusCode.STATUS_OK, data
     
-    def write_text(self, text, terminal_byte=0x00, encoding='UTF-8', errors='ignore'):
+    def _read_cached_mifare_classic(self, uid, terminal_byte=0x00):
+        '''
+        Read all data blocks from a previously selected MIFARE Classic card through the content cache (if configured).
+        The probe block is read first, if its checksum matches the cached entry of the PICC the cached data is returned.
+        
+        @param uid: UID from the selected PICC
+        @param terminal_byte: Byte value that indicates end of data (default = 0x00), set to None if all data should be returned
+        @return: (StatusCode, data)
+        '''
+        cache = self.content_cache
+        if cache is None:
+            return self._read_mifare_classic(uid, terminal_byte=terminal_byte)
+        
+        __, block_offset, no_of_blocks = get_block_position(cache.probe_block)
+        trailer_block = cache.probe_block - block_offset + no_of_blocks - 1
+        status = self.rfid.pcd_authenticate(PICC_Command.PICC_CMD_MF_AUTH_KEY_A, trailer_block, MIFARE_Key(), uid)
+        if status != StatusCode.STATUS_OK:
+            logger_debug.error(_F('Authentication failed (block_addr: {:#04x}, uid: [{}])', trailer_block, format_hex(uid.uid())))
+            return status, None
+        
+        status, block_data = self.rfid.mifare_read(cache.probe_block)
+        if status != StatusCode.STATUS_OK:
+            logger_debug.error(_F('Error reading from MIFARE Classic PICC (block_addr: {:#04x}, uid: [{}])', cache.probe_block, format_hex(uid.uid())))
+            return status, None
+        
+        checksum = cache.checksum(block_data)
+        data = cache.lookup(uid, checksum, terminal_byte)
+        if data is not None:
+            logger_debug.debug(_F('Content cache hit (uid: [{}])', format_hex(uid.uid())))
+            return StatusCode.STATUS_OK, data
+        
+        status, data = self._read_mifare_classic(uid, terminal_byte=terminal_byte)
+        if status == StatusCode.STATUS_OK:
+            cache.store(uid, checksum, data, terminal_byte)
+        return status, data
+    
+    def _forget_cached_content(self, uid):
+        if self.content_cache is not None and uid:
+            self.content_cache.forget(uid)
+    
+    def write_text(self, text, terminal_byte=0x00, encoding='UTF-8', errors='ignore', read_old_data=True, single_pass=False):
         '''
         Write given text to a MIFARE Classic card.
         The given terminal byte (default is 0x00) is appended as last data byte (pass None as parameter to not append any).
@@ -262,65 +329,83 @@ class SimpleMFRC522(object):
         @param terminal_byte: Byte value that indicates end of data (default = 0x00), set to None if no terminal byte should be used
         @param encoding: The encoding used to decode the byte array into a string (default = 'UTF-8')
         @param errors: The error handling scheme if an decoding error occures (default = 'ignore', other possible values are 'strict' and 'replace')
+        @param read_old_data: If False the old text is not read from the PICC and None is returned instead (default = True)
+        @param single_pass: If True each sector is authenticated only once for reading and writing (see write_bytes)
         @return: (StatusCode, Uid, text)
         '''
         data = list(bytearray(text, encoding=encoding))
-        status, uid, old_data = self.write_bytes(data, terminal_byte=terminal_byte)
+        status, uid, old_data = self.write_bytes(data, terminal_byte=terminal_byte, read_old_data=read_old_data, single_pass=single_pass)
         
-        if status != StatusCode.STATUS_OK::
+        if status != StatusCode.STATUS_OK or old_data is None:
             return status, uid, None
         
         old_byte_data = bytearray(old_data)
         return StatusCode.STATUS_OK, uid, old_byte_data.decode(encoding=encoding, errors=errors)
     
-    def write_bytes(self, data, terminal_byte=0x00):
+    def write_bytes(self, data, terminal_byte=0x00, read_old_data=True, single_pass=False, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A):
         '''
         Write given byte data list to a MIFARE Classic card.
         The given terminal byte (default is 0x00) is appended as last data byte (pass None as parameter to not append any).
         Returns the old data stored on the PICC.
         
+        By default the old data is read in a first pass (authenticated with key A) and the new data is written in a
+        second pass (authenticated with key B), which costs two authentications per sector.
+        In single pass mode each sector is authenticated only once with the given auth_command, the old data of a block
+        is read and the new data is written in the same session. The key used must be allowed to read and write the 
+        data blocks (true for key A with the transport configuration of the access bits).
+        
         This method blocks until a MIFARE Classic card is present, that can be written.
         
         @param data: The list of bytes to to write to the PICC
         @param terminal_byte: Byte value that indicates end of data (default = 0x00), set to None if no terminal byte should be used
-        @return: (StatusCode, Uid, text)
+        @param read_old_data: If False the old data is not read from the PICC and None is returned instead (default = True)
+        @param single_pass: If True read and write each sector in one authenticated session (default = False)
+        @param auth_command: Authentication command used in single pass mode (default = PICC_CMD_MF_AUTH_KEY_A)
+        @return: (StatusCode, Uid, old_data)
         '''
-        # Wait for interrupt
-        uid = None
-        is_card_present = False
-        while not is_card_present:
-            canceled = not self.wait_for_interrupt()
-            if canceled:
-                return StatusCode.STATUS_CANCELED, None, None
-            
-            status, uid = self.rfid.picc_read_card_serial()
-            if status != StatusCode.STATUS_OK::
-                logger_debug.warn(_F('Failed to read UID in write_bytes (status: {}, uid: {})', status, uid))
-                continue
+        status, uid = self._wait_for_mifare_classic('write_bytes')
+        if status != StatusCode.STATUS_OK:
+            return status, None, None
+        
+        old_data = None
+        if single_pass:
+            # Read old data and write new data with one authentication per sector
+            status, old_data = self._read_write_mifare_classic(uid, data, terminal_byte=terminal_byte, read_old_data=read_old_data, auth_command=auth_command)
+        else:
+            status = StatusCode.STATUS_OK
+            # Read old data from PICC
+            if read_old_data:
+                status, old_data = self._read_mifare_classic(uid, terminal_byte=terminal_byte)
             
-            picc_type = uid.get_picc_type()
-            if picc_type.is_mifare_classic():           # Only MIFARE Classic cards are supported for now
-                logger_debug.info(_F('Card found: MIFARE Classic PICC (uid: {})', uid))
-                is_card_present = True
-            else:
-                logger_debug.warn(_F('Unsupported PICC type (type: {}, uid: {})', picc_type, uid))
-                # Halt PICC
-                self.rfid.picc_halt_a()
-        
-        # Read old data from PICC
-        status, old_data = self._read_mifare_classic(uid, terminal_byte=terminal_byte)
-        
-        # Write new data to PICC
-        if status == StatusCode.STATUS_OK::
-            status = self._write_mifare_classic(uid, data)
+            # Write new data to PICC
+            if status == StatusCode.STATUS_OK:
+                status = self._write_mifare_classic(uid, data, terminal_byte=terminal_byte)
+        self._forget_cached_content(uid)
         
         # Halt PICC
         self.rfid.picc_halt_a()
         # Stop encryption on PCD
         self.rfid.pcd_stop_crypto1()
         
+        if status != StatusCode.STATUS_OK:
+            return status, uid, None
+        
         return status, uid, old_data
 
+    def _split_block_data(self, data, terminal_byte=0x00):
+        '''
+        Split the given data into blocks of 16 bytes, the last block is padded with 0x00
+        
+        @param data: The list of bytes to to write to the PICC
+        @param terminal_byte: Byte value that indicates end of data (default = 0x00), set to None if no terminal byte should be used
+        @return: List of blocks (each a list of 16 bytes)
+        '''
+        all_data = data if not isinstance(terminal_byte, int) else data + [terminal_byte]           # Append terminal_byte if given
+        all_block_data = [all_data[i:i + 16] for i in range(0, len(all_data), 16)]
+        if all_block_data and len(all_block_data[-1]) < 16:
+            all_block_data[-1] = all_block_data[-1] + [0x00] * (16 - len(all_block_data[-1]))
+        return all_block_data
+
     def _write_mifare_classic(self, uid, data, terminal_byte=0x00):
         '''
         Write data to a previously selected MIFARE Classic card
@@ -332,26 +417,24 @@ class SimpleMFRC522(object):
         '''
         key = MIFARE_Key()
         picc_type = uid.get_picc_type()
-        all_data = data if not isinstance(terminal_byte, int) else data + [terminal_byte]           # Append terminal_byte if given
-        all_block_data = [all_data[i:i + 16] for i in range(0, len(all_data), 16)]
-        data = []
+        all_block_data = self._split_block_data(data, terminal_byte=terminal_byte)
         for sector in range(0, picc_type.get_sector_count()):
+            if len(all_block_data) == 0:
+                return StatusCode.STATUS_OK
+            
             first_data_block, trailer_block, __ = picc_type.get_sector_definition(sector)
             
             # Authenticate using key B
             status = self.rfid.pcd_authenticate(PICC_Command.PICC_CMD_MF_AUTH_KEY_B, trailer_block, key, uid)
             if status != StatusCode.STATUS_OK:
                 logger_debug.error(_F('Authentication failed (block_addr: {:#04x}, uid: [{}])', trailer_block, format_hex(uid.uid())))
-                return status, None
+                return status
             
             for block_addr in range(first_data_block, trailer_block):
-                block_data = all_block_data.pop(0)
-                if len(block_data) < 16:
-                    block_data += [0x00] * (16 - len(block_data))
-                status = self.rfid.mifare_write(block_addr, block_data)
+                status = self.rfid.mifare_write(block_addr, all_block_data.pop(0))
                 if status != StatusCode.STATUS_OK:
                     logger_debug.error(_F('Error writing to MIFARE Classic PICC (block_addr: {:#04x}, uid: [{}])', block_addr, format_hex(uid.uid())))
-                    return status, uid, None
+                    return status
                 
                 if len(all_block_data) == 0:
                     return StatusCode.STATUS_OK
@@ -360,3 +443,91 @@ class SimpleMFRC522(object):
             logger_debug.error(_F('To much data, could not write all data to MIFARE Classic PICC (uid: [{}])', format_hex(uid.uid())))
         
         return StatusCode.STATUS_OK
+
+    def _read_write_mifare_classic(self, uid, data, terminal_byte=0x00, read_old_data=True, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A):
+        '''
+        Read the old data and write new data to a previously selected MIFARE Classic card in a single pass.
+        Each sector is authenticated only once, the old data of a block is read right before the new data is written.
+        Sectors are visited until all new data is written and (if requested) the old data is read up to the terminal byte.
+        
+        @param uid: UID from the selected PICC
+        @param data: The list of bytes to to write to the PICC
+        @param terminal_byte: Byte value that indicates end of data (default = 0x00), set to None if no terminal byte should be used
+        @param read_old_data: If False the old data is not read (default = True)
+        @param auth_command: PICC_CMD_MF_AUTH_KEY_A or PICC_CMD_MF_AUTH_KEY_B, the key must be allowed to read and write the data blocks
+        @return: (StatusCode, old_data) - old_data is None if read_old_data is False
+        '''
+        key = MIFARE_Key()
+        picc_type = uid.get_picc_type()
+        all_block_data = self._split_block_data(data, terminal_byte=terminal_byte)
+        old_data = [] if read_old_data else None
+        reading = read_old_data
+        for sector in range(0, picc_type.get_sector_count()):
+            if not reading and len(all_block_data) == 0:
+                return StatusCode.STATUS_OK, old_data
+            
+            first_data_block, trailer_block, __ = picc_type.get_sector_definition(sector)
+            
+            # Authenticate once for reading and writing the sector
+            status = self.rfid.pcd_authenticate(auth_command, trailer_block, key, uid)
+            if status != StatusCode.STATUS_OK:
+                logger_debug.error(_F('Authentication failed (block_addr: {:#04x}, uid: [{}])', trailer_block, format_hex(uid.uid())))
+                return status, None
+            
+            for block_addr in range(first_data_block, trailer_block):
+                if reading:
+                    status, block_data = self.rfid.mifare_read(block_addr)
+                    if status != StatusCode.STATUS_OK:
+                        logger_debug.error(_F('Error reading from MIFARE Classic PICC (block_addr: {:#04x}, uid: [{}])', block_addr, format_hex(uid.uid())))
+                        return status, None
+                    
+                    block_data = block_data[:16]            # A block contains exactly 16 bytes of data
+                    if terminal_byte in block_data:         # Terminal byte found, stop reading following blocks
+                        old_data += block_data[:block_data.index(terminal_byte)]
+                        reading = False
+                    else:
+                        old_data += block_data
+                
+                if len(all_block_data) > 0:
+                    status = self.rfid.mifare_write(block_addr, all_block_data.pop(0))
+                    if status != StatusCode.STATUS_OK:
+                        logger_debug.error(_F('Error writing to MIFARE Classic PICC (block_addr: {:#04x}, uid: [{}])', block_addr, format_hex(uid.uid())))
+                        return status, None
+                
+                if not reading and len(all_block_data) == 0:
+                    return StatusCode.STATUS_OK, old_data
+        
+        if len(all_block_data) > 0:
+            logger_debug.error(_F('To much data, could not write all data to MIFARE Classic PICC (uid: [{}])', format_hex(uid.uid())))
+        
+        return StatusCode.STATUS_OK, old_data
+
+    def value_transaction(self, block_addr, delta, backup_block_addr=None, auth_command=PICC_Command.PICC_CMD_MF_AUTH_KEY_A):
+        '''
+        Adds the given delta to the value block of a MIFARE Classic card (negative values are subtracted), optionally
+        mirrors the new value into a backup block of the same sector and returns the new value.
+        All operations are done on the card in one authenticated session (see MFRC522.mifare_value_transaction).
+        
+        This method blocks until a MIFARE Classic card is present.
+        
+        @param block_addr: The value block (0x00-0xff) number.
+        @param delta: The value to add to the block (negative values are subtracted)
+        @param backup_block_addr: Optional block (in the same sector) that receives a copy of the new value
+        @param auth_command: PICC_CMD_MF_AUTH_KEY_A or PICC_CMD_MF_AUTH_KEY_B, or an AuthPlanner (default = PICC_CMD_MF_AUTH_KEY_A)
+        @return: (StatusCode, Uid, value)
+        '''
+        status, uid = self._wait_for_mifare_classic('value_transaction')
+        if status != StatusCode.STATUS_OK:
+            return status, None, None
+        
+        status, value = self.rfid.mifare_value_transaction(uid, MIFARE_Key(), block_addr, delta, backup_block_addr=backup_block_addr, auth_command=auth_command)
+        self._forget_cached_content(uid)
+        if status != StatusCode.STATUS_OK:
+            logger_debug.error(_F('Value transaction failed (status: {}, block_addr: {:#04x}, uid: [{}])', status, block_addr, format_hex(uid.uid())))
+        
+        # Halt PICC
+        self.rfid.picc_halt_a()
+        # Stop encryption on PCD
+        self.rfid.pcd_stop_crypto1()
+        
+        return status, uid, value
@@ -0,0 +1,686 @@
+'''
+Simulated SPI transport with a MFRC522 register model and MIFARE PICCs, for running the driver off-device.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import logging
+from enum import Enum
+
+from .utils import format_hex
+from .utils import FormatString as _F
+from .mfrc522 import (
+    MFRC522,
+    PCD_Register,
+    PCD_Command,
+    PICC_Command,
+    MIFARE_Misc
+)
+from .faults import FaultType
+from .access_bits import (
+    AccessOperation,
+    SectorTrailer,
+    get_block_position
+)
+
+
+logger_sim = logging.getLogger('mfrc522.sim')
+
+
+def crc_a(data):
+    '''
+    Calculates the CRC_A of ISO/IEC 14443-3 (preset 0x6363), like the CalcCRC command of the MFRC522.
+
+    @param data: List of bytes
+    @return: The 2 CRC bytes [LSB, MSB]
+    '''
+    crc = 0x6363
+    for byte in data:
+        byte ^= crc & 0xFF
+        byte = (byte ^ (byte << 4)) & 0xFF
+        crc = (crc >> 8) ^ (byte << 8) ^ (byte << 3) ^ (byte >> 4)
+    return [crc & 0xFF, (crc >> 8) & 0xFF]
+
+
+# Register values after reset (datasheet chapter 9), index is the register address (not shifted)
+_RESET_VALUES = {
+    0x01: 0x20,     # CommandReg
+    0x02: 0x80,     # ComIEnReg
+    0x04: 0x14,     # ComIrqReg
+    0x0B: 0x08,     # WaterLevelReg
+    0x0C: 0x10,     # ControlReg
+    0x0E: 0x80,     # CollReg
+    0x11: 0x3F,     # ModeReg
+    0x14: 0x80,     # TxControlReg
+    0x16: 0x10,     # TxSelReg
+    0x17: 0x84,     # RxSelReg
+    0x18: 0x84,     # RxThresholdReg
+    0x19: 0x4D,     # DemodReg
+    0x1C: 0x62,     # MfTxReg
+    0x1F: 0xEB,     # SerialSpeedReg
+    0x21: 0xFF,     # CRCResultRegH
+    0x22: 0xFF,     # CRCResultRegL
+    0x24: 0x26,     # ModWidthReg
+    0x26: 0x48,     # RFCfgReg
+    0x27: 0x88,     # GsNReg
+    0x28: 0x20,     # CWGsPReg
+    0x29: 0x20,     # ModGsPReg
+}
+
+_SELF_TEST_REFERENCES = {
+    0x88: MFRC522.FM17522_firmware_reference,
+    0x90: MFRC522.MFRC522_firmware_referenceV0_0,
+    0x91: MFRC522.MFRC522_firmware_referenceV1_0,
+    0x92: MFRC522.MFRC522_firmware_referenceV2_0,
+}
+
+# Number of blocks of the MIFARE Classic types (by SAK)
+_CLASSIC_BLOCKS = {
+    0x09: 20,       # MIFARE Mini
+    0x08: 64,       # MIFARE 1K
+    0x18: 256,      # MIFARE 4K
+}
+
+_MF_NAK = 0x4       # NAK: invalid operation
+
+
+def _reg(register):
+    return register.value >> 1
+
+
+class PiccState(Enum):
+    '''
+    States of a PICC (ISO/IEC 14443-3 section 6.3)
+    '''
+
+    IDLE                    = 0
+    READY                   = 1
+    ACTIVE                  = 2
+    HALT                    = 3
+
+
+class SimulatedPicc(object):
+    '''
+    A MIFARE Classic (Mini, 1K, 4K) or MIFARE Ultralight PICC in the field of a SimulatedSpi.
+
+    The Crypto1 cipher is not simulated: the MFRC522 encrypts and decrypts transparently, so the driver
+    sees the same plain frames. Access conditions and value block formats are enforced.
+    '''
+
+    def __init__(self, uid, sak=None, atqa=None, memory=None):
+        '''
+        Create a new SimulatedPicc
+
+        @param uid: List of 4, 7 or 10 UID bytes
+        @param sak: SAK byte (default = 0x08 (MIFARE 1K) for 4 byte UIDs, 0x00 (MIFARE Ultralight) otherwise)
+        @param atqa: ATQA (2 bytes, default depends on the UID size)
+        @param memory: Optional list of blocks (16 bytes each, pages of 4 bytes for MIFARE Ultralight), defaults to the factory content
+        '''
+        self.uid = list(uid)
+        if sak is None:
+            sak = 0x08 if len(self.uid) == 4 else 0x00
+        self.sak = sak
+        if atqa is None:
+            atqa = [{4: 0x04, 7: 0x44, 10: 0x84}[len(self.uid)], 0x00]
+        self.atqa = list(atqa)
+        self.memory = [list(block) for block in memory] if memory is not None else self._factory_memory()
+
+        self.power_on()
+
+    def is_mifare_classic(self):
+        return self.sak in _CLASSIC_BLOCKS
+
+    def power_on(self):
+        '''
+        Resets the PICC to state IDLE (PICC entered the field)
+        '''
+        self.state = PiccState.IDLE
+        self.halted = False             # Woken up from HALT (state READY* / ACTIVE*)
+        self.level = 1                  # Cascade level
+        self.auth = None                # (sector, auth command)
+        self.pending = None             # First step of a two step command
+        self.transfer_buffer = None     # Value of the internal data register
+
+    def get_cascade_bytes(self, level):
+        '''
+        @return: The 4 UID bytes (with cascade tag) and the BCC for the given cascade level
+        '''
+        uid = self.uid
+        if len(uid) == 4:
+            data = uid[0:4]
+        elif len(uid) == 7:
+            data = [PICC_Command.PICC_CMD_CT.value] + uid[0:3] if level == 1 else uid[3:7]
+        elif level < 3:
+            data = [PICC_Command.PICC_CMD_CT.value] + uid[3 * level - 3:3 * level]
+        else:
+            data = uid[6:10]
+        return data + [data[0] ^ data[1] ^ data[2] ^ data[3]]
+
+    def get_sak(self, level):
+        if level < {4: 1, 7: 2, 10: 3}[len(self.uid)]:
+            return 0x04                 # Cascade bit set - UID not complete
+        return self.sak
+
+    def deselect(self):
+        self.state = PiccState.HALT if self.halted else PiccState.IDLE
+        self.auth = None
+        self.pending = None
+
+    def _factory_memory(self):
+        if self.is_mifare_classic():
+            memory = [[0] * 16 for __ in range(_CLASSIC_BLOCKS[self.sak])]
+            bcc = self.uid[0] ^ self.uid[1] ^ self.uid[2] ^ self.uid[3]
+            memory[0][:8] = self.uid[0:4] + [bcc, self.sak, self.atqa[0], self.atqa[1]]
+            for block_addr in range(len(memory)):
+                __, block_offset, no_of_blocks = get_block_position(block_addr)
+                if block_offset == no_of_blocks - 1:
+                    memory[block_addr] = SectorTrailer().to_bytes()
+            return memory
+        # MIFARE Ultralight: 16 pages of 4 bytes
+        memory = [[0] * 4 for __ in range(16)]
+        uid = self.uid + [0] * 7
+        bcc0 = PICC_Command.PICC_CMD_CT.value ^ uid[0] ^ uid[1] ^ uid[2]
+        memory[0] = uid[0:3] + [bcc0]
+        memory[1] = uid[3:7]
+        memory[2] = [uid[3] ^ uid[4] ^ uid[5] ^ uid[6], 0x48, 0x00, 0x00]
+        return memory
+
+    #====================================================================================
+    # Commands in state ACTIVE
+    #====================================================================================
+
+    def authenticate(self, command, block_addr, key):
+        '''
+        MFAuthent command of the PCD
+
+        @return: True on success
+        '''
+        if self.state != PiccState.ACTIVE or not self.is_mifare_classic() or block_addr >= len(self.memory):
+            return False
+        sector, block_offset, no_of_blocks = get_block_position(block_addr)
+        trailer = self.memory[block_addr - block_offset + no_of_blocks - 1]
+        expected = trailer[0:6] if command == PICC_Command.PICC_CMD_MF_AUTH_KEY_A.value else trailer[10:16]
+        if list(key) != expected:
+            self.deselect()             # The PICC does not answer anymore
+            return False
+        self.auth = (sector, PICC_Command(command))
+        return True
+
+    def transceive(self, frame):
+        '''
+        Executes a command frame (CRC_A already checked and removed).
+
+        @return: (data, valid_bits) or None if the PICC does not answer
+        '''
+        if self.pending:
+            command, block_addr = self.pending
+            self.pending = None
+            return self._second_step(command, block_addr, frame)
+
+        command = frame[0]
+        if command == PICC_Command.PICC_CMD_HLTA.value:
+            self.state = PiccState.HALT
+            self.halted = True
+            self.auth = None
+            return None
+        if len(frame) < 2:
+            return self._nak()
+
+        block_addr = frame[1]
+        if command == PICC_Command.PICC_CMD_MF_READ.value:
+            return self._read(block_addr)
+        if command == PICC_Command.PICC_CMD_UL_WRITE.value and not self.is_mifare_classic() and len(frame) == 6:
+            if block_addr < 4 or block_addr >= len(self.memory):
+                return self._nak()
+            self.memory[block_addr] = list(frame[2:6])
+            return self._ack()
+        if command in (PICC_Command.PICC_CMD_MF_WRITE.value, PICC_Command.PICC_CMD_MF_INCREMENT.value,
+                       PICC_Command.PICC_CMD_MF_DECREMENT.value, PICC_Command.PICC_CMD_MF_RESTORE.value):
+            operation = {
+                PICC_Command.PICC_CMD_MF_WRITE.value: AccessOperation.WRITE,
+                PICC_Command.PICC_CMD_MF_INCREMENT.value: AccessOperation.INCREMENT,
+            }.get(command, AccessOperation.DECREMENT)
+            if not self._is_allowed(block_addr, operation):
+                return self._nak()
+            if operation != AccessOperation.WRITE and not self._is_value_block(self.memory[block_addr], block_addr):
+                return self._nak()
+            self.pending = (command, block_addr)
+            return self._ack()
+        if command == PICC_Command.PICC_CMD_MF_TRANSFER.value:
+            if self.transfer_buffer is None or not self._is_allowed(block_addr, AccessOperation.DECREMENT):
+                return self._nak()
+            value = self.transfer_buffer.to_bytes(4, 'little', signed=True)
+            inverted = bytes(~b & 0xFF for b in value)
+            self.memory[block_addr] = list(value + inverted + value) + [block_addr, ~block_addr & 0xFF, block_addr, ~block_addr & 0xFF]
+            return self._ack()
+        return self._nak()
+
+    def _read(self, block_addr):
+        if not self.is_mifare_classic():
+            if block_addr >= len(self.memory):
+                return self._nak()
+            data = []
+            for i in range(4):
+                data += self.memory[(block_addr + i) % len(self.memory)]
+            return self._with_crc(data)
+
+        if not self._is_allowed(block_addr, AccessOperation.READ):
+            return self._nak()
+        data = list(self.memory[block_addr])
+        __, block_offset, no_of_blocks = get_block_position(block_addr)
+        if block_offset == no_of_blocks - 1:
+            trailer = SectorTrailer.from_bytes(data)
+            data[0:6] = [0] * 6                             # Key A is never readable
+            if not trailer.is_key_b_readable():
+                data[10:16] = [0] * 6
+        return self._with_crc(data)
+
+    def _second_step(self, command, block_addr, frame):
+        if command == PICC_Command.PICC_CMD_MF_WRITE.value:
+            if len(frame) != 16:
+                return self._nak()
+            self.memory[block_addr] = list(frame)
+            return self._ack()
+        # Value operations: 4 byte operand, the PICC does not answer (the PCD accepts the timeout)
+        if len(frame) != 4:
+            return self._nak()
+        value = int.from_bytes(bytes(self._block_value(block_addr)), 'little', signed=True)
+        operand = int.from_bytes(bytes(frame), 'little', signed=True)
+        if command == PICC_Command.PICC_CMD_MF_INCREMENT.value:
+            value += operand
+        elif command == PICC_Command.PICC_CMD_MF_DECREMENT.value:
+            value -= operand
+        if not -0x80000000 <= value <= 0x7FFFFFFF:
+            return self._nak()
+        self.transfer_buffer = value
+        return None
+
+    def _block_value(self, block_addr):
+        return self.memory[block_addr][0:4]
+
+    def _is_value_block(self, data, block_addr):
+        inverted = [~b & 0xFF for b in data[4:8]]
+        return data[0:4] == inverted and data[0:4] == data[8:12] and data[12] == data[14] and data[13] == data[15] and data[12] == (~data[13] & 0xFF)
+
+    def _is_allowed(self, block_addr, operation):
+        if self.auth is None or block_addr >= len(self.memory):
+            return False
+        sector, block_offset, no_of_blocks = get_block_position(block_addr)
+        if sector != self.auth[0]:
+            return False
+        trailer = SectorTrailer.from_bytes(self.memory[block_addr - block_offset + no_of_blocks - 1])
+        return self.auth[1] in trailer.get_allowed_keys(operation, block_offset, no_of_blocks)
+
+    def _with_crc(self, data):
+        return data + crc_a(data), 0
+
+    def _ack(self):
+        return [MIFARE_Misc.MF_ACK.value], 4
+
+    def _nak(self):
+        self.deselect()                 # A MIFARE Classic PICC must be selected again after a NAK
+        return [_MF_NAK], 4
+
+
+class SimulatedSpi(object):
+    '''
+    Drop-in replacement for spidev.SpiDev that simulates the register interface of the MFRC522 and
+    the RF communication with the SimulatedPiccs in its field.
+
+    The commands of the MFRC522 complete instantly, optionally after latency_polls reads of ComIrqReg.
+    A FaultInjector adds RF errors, card removals and dead SPI periods.
+
+    Example:
+    >>> spi = SimulatedSpi([SimulatedPicc([0x01, 0x02, 0x03, 0x04])])
+    >>> rfid = MFRC522(pin_reset=0, pin_irq=0, spi=spi)
+    >>> rfid.pcd_init()
+    >>> rfid.picc_is_new_card_present()
+    True
+    '''
+
+    def __init__(self, piccs=None, version=0x92, latency_polls=0, faults=None):
+        '''
+        Create a new SimulatedSpi
+
+        @param piccs: List of SimulatedPiccs in the field (default = no PICC)
+        @param version: Value of the VersionReg (default = 0x92, MFRC522 version 2.0)
+        @param latency_polls: Number of ComIrqReg reads before a command completes (default = 0)
+        @param faults: Optional FaultInjector
+        '''
+        self.piccs = []
+        for picc in piccs if piccs else []:
+            self.add_picc(picc)
+        self.version = version
+        self.latency_polls = latency_polls
+        self.faults = faults
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.is_open = False
+
+        self.transfers = 0
+        self.bytes_transferred = 0
+
+        self.reset()
+
+    def open(self, bus, device):
+        self.bus = bus
+        self.device = device
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def add_picc(self, picc):
+        '''
+        Moves a PICC into the field
+        '''
+        picc.power_on()
+        self.piccs.append(picc)
+
+    def remove_picc(self, picc):
+        '''
+        Removes a PICC from the field
+        '''
+        self.piccs.remove(picc)
+
+    def reset(self):
+        '''
+        Resets the registers to their reset values
+        '''
+        self.regs = [0] * 64
+        for address, value in _RESET_VALUES.items():
+            self.regs[address] = value
+        self.regs[_reg(PCD_Register.VersionReg)] = self.version
+        self.fifo = []
+        self.transceiving = False
+        self.pending_irq = None         # (ComIrqReg bits, remaining polls)
+        self.wakeup_polls = 0
+
+    def xfer2(self, data):
+        '''
+        Full duplex SPI transfer (datasheet section 8.1.2).
+        Reading: every byte is an address, the value is returned in the next byte.
+        Writing: the first byte is the address, all following bytes are written to it.
+
+        @param data: List of bytes
+        @return: List of received bytes (same length)
+        '''
+        self.transfers += 1
+        self.bytes_transferred += len(data)
+        if not data:
+            return []
+        stuck = self.faults.spi_fault() if self.faults is not None else None
+        if data[0] & 0x80:
+            rx = [0]
+            for address in data[:-1]:
+                rx.append(self._read((address >> 1) & 0x3F))
+            if stuck is not None:
+                return [stuck] * len(data)
+            return rx
+
+        address = (data[0] >> 1) & 0x3F
+        for value in data[1:]:
+            self._write(address, value)
+        return [0] * len(data)
+
+    #====================================================================================
+    # Register model
+    #====================================================================================
+
+    def _read(self, address):
+        if address == _reg(PCD_Register.FIFODataReg):
+            return self.fifo.pop(0) if self.fifo else 0
+        if address == _reg(PCD_Register.FIFOLevelReg):
+            return len(self.fifo)
+        if address == _reg(PCD_Register.ComIrqReg) and self.pending_irq:
+            bits, polls = self.pending_irq
+            if polls <= 0:
+                self.pending_irq = None
+                self.regs[address] |= bits
+            else:
+                self.pending_irq = (bits, polls - 1)
+        if address == _reg(PCD_Register.CommandReg) and self.wakeup_polls:
+            self.wakeup_polls -= 1
+            if not self.wakeup_polls:
+                self.regs[address] &= ~0x10
+        return self.regs[address]
+
+    def _write(self, address, value):
+        if address == _reg(PCD_Register.CommandReg):
+            self._write_command(value)
+        elif address in (_reg(PCD_Register.ComIrqReg), _reg(PCD_Register.DivIrqReg)):
+            if value & 0x80:            # Set1/Set2: set the marked bits, otherwise clear them
+                self.regs[address] |= value & 0x7F
+            else:
+                self.regs[address] &= ~value & 0x7F
+        elif address == _reg(PCD_Register.FIFODataReg):
+            if len(self.fifo) < 64:
+                self.fifo.append(value)
+            else:
+                self.regs[_reg(PCD_Register.ErrorReg)] |= 0x10        # BufferOvfl
+        elif address == _reg(PCD_Register.FIFOLevelReg):
+            if value & 0x80:            # FlushBuffer
+                self.fifo = []
+                self.regs[_reg(PCD_Register.ErrorReg)] &= ~0x10
+        elif address == _reg(PCD_Register.BitFramingReg):
+            self.regs[address] = value & 0x7F
+            if value & 0x80 and self.transceiving:                      # StartSend
+                self._transmit()
+        elif address == _reg(PCD_Register.Status2Reg):
+            crypto = self.regs[address] & value & 0x08                  # MFCrypto1On can only be cleared by software
+            self.regs[address] = (value & 0xF0) | crypto
+            if not crypto:
+                for picc in self.piccs:
+                    picc.auth = None
+        elif address != _reg(PCD_Register.VersionReg):
+            self.regs[address] = value
+
+    def _write_command(self, value):
+        address = _reg(PCD_Register.CommandReg)
+        if value & 0x10:                                                # PowerDown
+            self.regs[address] |= 0x10
+            return
+        if self.regs[address] & 0x10:                                   # Wake up, the oscillator needs some time
+            self.wakeup_polls = self.latency_polls
+            if not self.wakeup_polls:
+                self.regs[address] &= ~0x10
+
+        command = value & 0x0F
+        if command == PCD_Command.PCD_NoCmdChange.value:
+            return
+        self.regs[address] = (self.regs[address] & 0xF0) | command
+        self.transceiving = False
+        self.pending_irq = None
+
+        if command == PCD_Command.PCD_SoftReset.value:
+            self.reset()
+        elif command == PCD_Command.PCD_CalcCRC.value:
+            self._calculate_crc()
+        elif command == PCD_Command.PCD_Transceive.value:
+            self.transceiving = True
+            self.regs[_reg(PCD_Register.ErrorReg)] = 0
+        elif command == PCD_Command.PCD_MFAuthent.value:
+            self.regs[_reg(PCD_Register.ErrorReg)] = 0
+            self._authenticate()
+        elif command == PCD_Command.PCD_Mem.value:
+            self.fifo = self.fifo[25:]
+
+    def _calculate_crc(self):
+        if self.regs[_reg(PCD_Register.AutoTestReg)] & 0x0F == 0x09:   # Digital self-test
+            self.fifo = list(_SELF_TEST_REFERENCES.get(self.version, [0] * 64))
+        else:
+            crc = crc_a(self.fifo)
+            self.fifo = []
+            self.regs[_reg(PCD_Register.CRCResultRegL)] = crc[0]
+            self.regs[_reg(PCD_Register.CRCResultRegH)] = crc[1]
+        self.regs[_reg(PCD_Register.DivIrqReg)] |= 0x04                # CRCIRq
+        self._set_command_idle()
+
+    def _authenticate(self):
+        data, self.fifo = self.fifo[:12], self.fifo[12:]
+        active = self._get_active_picc()
+        if len(data) == 12 and self._is_field_on() and active and active.uid[-4:] == data[8:12]:
+            if active.authenticate(data[0], data[1], data[2:8]):
+                self.regs[_reg(PCD_Register.Status2Reg)] |= 0x08       # MFCrypto1On
+                self._set_command_idle()
+                self._complete(0x10)                                    # IdleIRq
+                return
+        elif active:
+            active.deselect()
+        logger_sim.debug(_F('Authentication failed ({})', format_hex(data[0:2])))
+        self._complete(0x01)                                            # TimerIRq
+
+    def _transmit(self):
+        frame, self.fifo = self.fifo, []
+        tx_last_bits = self.regs[_reg(PCD_Register.BitFramingReg)] & 0x07
+        rx_align = (self.regs[_reg(PCD_Register.BitFramingReg)] >> 4) & 0x07
+
+        if self.faults is not None:
+            self.faults.before_frame(self)
+        response = self._rf_exchange(frame, tx_last_bits) if self._is_field_on() else None
+        fault = self.faults.frame_fault() if self.faults is not None and response is not None else None
+        if response is None or fault == FaultType.TIMEOUT:
+            self._complete(0x01)                                        # TimerIRq
+            return
+
+        data, valid_bits, collision_pos = response
+        if data and fault == FaultType.CRC_ERROR:
+            bit = self.faults.random.randrange(len(data) * 8)
+            data[bit // 8] ^= 1 << (bit % 8)
+        elif data and fault == FaultType.COLLISION and collision_pos is None:
+            collision_pos = self.faults.random.randint(1, len(data) * 8)
+        if data and rx_align:
+            data[0] &= (0xFF << rx_align) & 0xFF
+        self.fifo = data
+        control = _reg(PCD_Register.ControlReg)
+        self.regs[control] = (self.regs[control] & ~0x07) | valid_bits
+        coll = _reg(PCD_Register.CollReg)
+        if fault == FaultType.PARITY_ERROR:
+            self.regs[_reg(PCD_Register.ErrorReg)] |= 0x02              # ParityErr
+            self._complete(0x22)                                        # RxIRq ErrIRq
+        elif collision_pos is None:
+            self.regs[coll] = (self.regs[coll] & 0x80) | 0x20           # CollPosNotValid
+            self._complete(0x20)                                        # RxIRq
+        else:
+            self.regs[_reg(PCD_Register.ErrorReg)] |= 0x08              # CollErr
+            self.regs[coll] = (self.regs[coll] & 0x80) | (collision_pos & 0x1F if collision_pos <= 32 else 0x20)
+            self._complete(0x22)                                        # RxIRq ErrIRq
+
+    def _complete(self, irq_bits):
+        if self.latency_polls:
+            self.pending_irq = (irq_bits, self.latency_polls)
+        else:
+            self.regs[_reg(PCD_Register.ComIrqReg)] |= irq_bits
+
+    def _set_command_idle(self):
+        address = _reg(PCD_Register.CommandReg)
+        self.regs[address] &= 0xF0
+
+    def _is_field_on(self):
+        return bool(self.regs[_reg(PCD_Register.TxControlReg)] & 0x03) and not self.regs[_reg(PCD_Register.CommandReg)] & 0x10
+
+    def _get_active_picc(self):
+        for picc in self.piccs:
+            if picc.state == PiccState.ACTIVE:
+                return picc
+        return None
+
+    #====================================================================================
+    # RF interface
+    #====================================================================================
+
+    def _rf_exchange(self, frame, tx_last_bits):
+        '''
+        @return: (data, valid_bits, collision_pos) or None if no PICC answered
+        '''
+        if not frame:
+            return None
+        command = frame[0]
+
+        # REQA / WUPA: short frame
+        if tx_last_bits == 7 and len(frame) == 1 and command in (PICC_Command.PICC_CMD_REQA.value, PICC_Command.PICC_CMD_WUPA.value):
+            answers = []
+            for picc in self.piccs:
+                if picc.state == PiccState.IDLE or (picc.state == PiccState.HALT and command == PICC_Command.PICC_CMD_WUPA.value):
+                    picc.halted = picc.state == PiccState.HALT
+                    picc.state = PiccState.READY
+                    picc.level = 1
+                    answers.append(picc.atqa)
+                elif picc.state in (PiccState.READY, PiccState.ACTIVE):
+                    picc.deselect()
+            return self._merge(answers, 0, 16)
+
+        # ANTICOLLISION / SELECT
+        if command in (PICC_Command.PICC_CMD_SEL_CL1.value, PICC_Command.PICC_CMD_SEL_CL2.value, PICC_Command.PICC_CMD_SEL_CL3.value) and len(frame) >= 2:
+            level = (command - PICC_Command.PICC_CMD_SEL_CL1.value) // 2 + 1
+            ready = [p for p in self.piccs if p.state == PiccState.READY and p.level == level]
+            if frame[1] == 0x70:
+                return self._select(frame, level, ready)
+            known_bits = ((frame[1] >> 4) - 2) * 8 + (frame[1] & 0x0F)
+            candidates = [p.get_cascade_bytes(level) for p in ready if self._matches(p.get_cascade_bytes(level), frame[2:], known_bits)]
+            return self._merge(candidates, known_bits, 40)
+
+        # Frames for the active PICC, must end with a valid CRC_A
+        active = self._get_active_picc()
+        if active is None or tx_last_bits or len(frame) < 3 or crc_a(frame[:-2]) != frame[-2:]:
+            return None
+        response = active.transceive(frame[:-2])
+        if response is None:
+            return None
+        data, valid_bits = response
+        return list(data), valid_bits, None
+
+    def _select(self, frame, level, ready):
+        if len(frame) != 9 or crc_a(frame[:7]) != frame[7:9]:
+            return None
+        selected = None
+        for picc in ready:
+            if selected is None and picc.get_cascade_bytes(level) == frame[2:7]:
+                selected = picc
+            else:
+                picc.deselect()
+        if selected is None:
+            return None
+        sak = selected.get_sak(level)
+        if sak & 0x04:
+            selected.level = level + 1
+        else:
+            selected.state = PiccState.ACTIVE
+        return [sak] + crc_a([sak]), 0, None
+
+    def _matches(self, data, known, known_bits):
+        for bit in range(known_bits):
+            if (data[bit // 8] >> (bit % 8)) & 1 != (known[bit // 8] >> (bit % 8)) & 1:
+                return False
+        return True
+
+    def _merge(self, answers, start_bit, end_bit):
+        '''
+        Superposes the answers of several PICCs starting at bit start_bit. Bits after the first collision are cleared.
+
+        @return: (data, valid_bits, collision_pos) - collision_pos is the 1-based position of the collision or None
+        '''
+        if not answers:
+            return None
+        merged = list(answers[0])
+        collision_pos = None
+        for bit in range(start_bit, end_bit):
+            values = set((a[bit // 8] >> (bit % 8)) & 1 for a in answers)
+            if collision_pos is None and len(values) > 1:
+                collision_pos = bit + 1
+            if collision_pos is not None:
+                merged[bit // 8] &= ~(1 << (bit % 8)) & 0xFF
+        return merged[start_bit // 8:end_bit // 8], 0, collision_pos
@@ -0,0 +1,182 @@
+'''
+Structured tracing of the SPI transactions of the MFRC522.
+
+Copyright (c) 2019 Christian Meffert <christian.meffert@googlemail.com>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Lesser General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License
+along with this program. If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import collections
+import logging
+import struct
+from enum import IntEnum
+
+from .utils import format_hex
+
+
+logger_spi = logging.getLogger('mfrc522.spi')
+
+
+class TraceDirection(IntEnum):
+    '''
+    Direction of a traced SPI transaction
+    '''
+
+    WRITE                   = 0    # Bytes written to a register (e. g. FIFODataReg)
+    READ                    = 1    # Bytes read from a register
+    IRQ                     = 2    # Falling edge on the IRQ pin (register and data are not used)
+    FRAME                   = 3    # End of a PICC frame (register is the PICC command, data the StatusCode value)
+
+
+TraceRecord = collections.namedtuple('TraceRecord', ['timestamp', 'direction', 'register', 'data'])
+TraceRecord.__doc__ = '''
+A traced SPI transaction: timestamp (time.monotonic()), TraceDirection, register (PCD_Register value) and the bytes written or read
+'''
+
+
+class Tracer(object):
+    '''
+    Base class of the tracers. MFRC522 calls record() for each SPI transfer if a tracer is set (MFRC522.tracer).
+    record() is called on the hot path, implementations should store the values and defer any formatting.
+    '''
+
+    def record(self, timestamp, direction, register, data):
+        '''
+        @param timestamp: time.monotonic() of the transfer
+        @param direction: TraceDirection
+        @param register: The register (PCD_Register value, without the read bit)
+        @param data: List of bytes written to or read from the register
+        '''
+        pass
+
+    def close(self):
+        pass
+
+
+class MemoryTracer(Tracer):
+    '''
+    Keeps the last max_records TraceRecords in memory (all records if max_records is None)
+    '''
+
+    def __init__(self, max_records=None):
+        self.records = collections.deque(maxlen=max_records)
+
+    def record(self, timestamp, direction, register, data):
+        self.records.append(TraceRecord(timestamp, direction, register, data))
+
+
+class BinaryTracer(Tracer):
+    '''
+    Writes the records into a binary file, without any formatting. Use read_trace() and format_record()
+    to decode the file later.
+
+    File format: the magic b'MFRC522T' followed by the records, each record is the header
+    timestamp (f64), direction (u8), register (u8), length (u16), little endian, followed by length data bytes.
+
+    Example:
+    >>> rfid.tracer = BinaryTracer(open('spi.trace', 'wb'))
+    >>> ...
+    >>> rfid.tracer.close()
+    >>> for record in read_trace(open('spi.trace', 'rb')):
+    >>>     print(format_record(record))
+    '''
+
+    MAGIC = b'MFRC522T'
+    HEADER = struct.Struct('<dBBH')
+
+    def __init__(self, file):
+        '''
+        @param file: Binary file object opened for writing (buffered)
+        '''
+        self.file = file
+        self.file.write(self.MAGIC)
+        self._pack = self.HEADER.pack
+        self._write = file.write
+
+    def record(self, timestamp, direction, register, data):
+        # One write per record, IRQ edges are recorded from the GPIO thread
+        self._write(self._pack(timestamp, direction, register, len(data)) + bytes(data))
+
+    def close(self):
+        self.file.close()
+
+
+class LoggingTracer(Tracer):
+    '''
+    Logs each record to the logger 'mfrc522.spi' at DEBUG level. The message is formatted only if the record is logged.
+    Much slower than BinaryTracer, intended for debugging.
+    '''
+
+    def __init__(self, logger=logger_spi):
+        self.logger = logger
+
+    def record(self, timestamp, direction, register, data):
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(_FormattedRecord(TraceRecord(timestamp, direction, register, list(data))))
+
+
+class _FormattedRecord(object):
+
+    def __init__(self, record):
+        self.record = record
+
+    def __str__(self):
+        return format_record(self.record)
+
+
+def read_trace(file):
+    '''
+    Reads the records of a file written by BinaryTracer
+
+    @param file: Binary file object opened for reading
+    @return: Generator of TraceRecords
+    '''
+    if file.read(len(BinaryTracer.MAGIC)) != BinaryTracer.MAGIC:
+        raise ValueError('Not a MFRC522 trace file')
+    header = BinaryTracer.HEADER
+    while True:
+        head = file.read(header.size)
+        if len(head) < header.size:
+            return
+        timestamp, direction, register, length = header.unpack(head)
+        data = file.read(length)
+        if len(data) < length:
+            return                              # Truncated last record (e. g. the process was killed)
+        yield TraceRecord(timestamp, TraceDirection(direction), register, list(data))
+
+
+def format_record(record):
+    '''
+    @param record: A TraceRecord
+    @return: Human readable representation, e. g. "12.345678 write CommandReg [0x0c]"
+    '''
+    if record.direction == TraceDirection.IRQ:
+        return '{:.6f} irq'.format(record.timestamp)
+    from .mfrc522 import (
+        PCD_Register,
+        PICC_Command,
+        StatusCode
+    )
+    if record.direction == TraceDirection.FRAME:
+        try:
+            command = PICC_Command(record.register).name
+        except ValueError:
+            command = '{:#04x}'.format(record.register)
+        status = StatusCode(record.data[0]).name if record.data else '-'
+        return '{:.6f} frame {} {}'.format(record.timestamp, command, status)
+    try:
+        register = PCD_Register(record.register).name
+    except ValueError:
+        register = '{:#04x}'.format(record.register)
+    return '{:.6f} {} {} [{}]'.format(record.timestamp, record.direction.name.lower(), register, format_hex(record.data))
@@ -7,6 +7,7 @@ setup(name='MFRC522-python',
     description='Raspberry Pi Python library for SPI RFID RC522 module.',
     install_requires=['spidev', 'RPi.GPIO'],
     packages=['mfrc522'],
+    scripts=['bin/mfrc522d'],
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: GNU Lesser General Public License v3 (LGPLv3)",
@@ -0,0 +1,15 @@
+'''
+Helpers shared by the tests
+'''
+
+
+class FakeClock(object):
+    '''
+    Clock for the clock parameters (e. g. time.monotonic), the tests advance it by setting now
+    '''
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
@@ -0,0 +1,133 @@
+'''
+Tests for the sector trailer codec and the AuthPlanner
+'''
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import (
+    AccessOperation,
+    AuthPlanner,
+    PICC_Command,
+    SectorTrailer,
+    StatusCode,
+    decode_access_bits,
+    encode_access_bits,
+)
+
+KEY_A = PICC_Command.PICC_CMD_MF_AUTH_KEY_A
+KEY_B = PICC_Command.PICC_CMD_MF_AUTH_KEY_B
+
+
+class TestAccessBits(unittest.TestCase):
+
+    def test_decode_transport_configuration(self):
+        # act
+        groups, inverted_error = decode_access_bits([0xFF, 0x07, 0x80])
+
+        # assert
+        self.assertEqual([0b000, 0b000, 0b000, 0b001], groups)
+        self.assertFalse(inverted_error)
+
+    def test_encode_decode_roundtrip(self):
+        for groups in ([0b000, 0b000, 0b000, 0b001], [0b110, 0b001, 0b100, 0b011], [0b111, 0b010, 0b101, 0b100]):
+            groups_decoded, inverted_error = decode_access_bits(encode_access_bits(groups))
+            self.assertEqual(groups, groups_decoded)
+            self.assertFalse(inverted_error)
+
+    def test_decode_inverted_error(self):
+        # act
+        __, inverted_error = decode_access_bits([0xFF, 0x07, 0x81])
+
+        # assert
+        self.assertTrue(inverted_error)
+
+    def test_sector_trailer_roundtrip(self):
+        # arrange
+        data = [0x00] * 6 + [0xFF, 0x07, 0x80, 0x69] + [0x01, 0x02, 0x03, 0x04, 0x05, 0x06]
+
+        # act
+        trailer = SectorTrailer.from_bytes(data)
+
+        # assert
+        self.assertEqual(data, trailer.to_bytes())
+        self.assertEqual([0x01, 0x02, 0x03, 0x04, 0x05, 0x06], trailer.key_b)
+        self.assertTrue(trailer.is_key_b_readable())
+
+    def test_allowed_keys(self):
+        # arrange (value block in group 0, read/write block with key B write in group 1, trailer 011)
+        trailer = SectorTrailer(groups=[0b110, 0b100, 0b111, 0b011])
+
+        # act / assert
+        self.assertEqual([KEY_A, KEY_B], trailer.get_allowed_keys(AccessOperation.DECREMENT, 0))
+        self.assertEqual([KEY_B], trailer.get_allowed_keys(AccessOperation.INCREMENT, 0))
+        self.assertEqual([KEY_B], trailer.get_allowed_keys(AccessOperation.WRITE, 1))
+        self.assertEqual([], trailer.get_allowed_keys(AccessOperation.READ, 2))
+        self.assertEqual([KEY_B], trailer.get_allowed_keys(AccessOperation.WRITE, 3))
+        self.assertTrue(trailer.is_value_block(0))
+        self.assertFalse(trailer.is_value_block(1))
+
+    def test_key_b_readable_restricts_to_key_a(self):
+        # arrange (transport configuration, key B is readable and cannot be used for authentication)
+        trailer = SectorTrailer()
+
+        # act / assert
+        self.assertEqual([KEY_A], trailer.get_allowed_keys(AccessOperation.WRITE, 1))
+
+
+class TestAuthPlanner(unittest.TestCase):
+
+    def test_unknown_sector_uses_preferred_key(self):
+        # arrange
+        sut = AuthPlanner(preferred_command=KEY_B)
+
+        # act / assert
+        self.assertEqual(KEY_B, sut.get_auth_command(4, AccessOperation.READ))
+
+    def test_planned_keys(self):
+        # arrange
+        sut = AuthPlanner()
+        sut.set_sector_trailer(1, SectorTrailer(groups=[0b110, 0b100, 0b101, 0b011]))
+        sut.set_sector_trailer(32, SectorTrailer(groups=[0b111, 0b000, 0b000, 0b011]))
+
+        # act / assert
+        self.assertEqual(KEY_A, sut.get_auth_command(4, AccessOperation.READ))
+        self.assertEqual(KEY_B, sut.get_auth_command(4, AccessOperation.INCREMENT))
+        self.assertEqual(KEY_B, sut.get_auth_command(6, AccessOperation.READ))
+        self.assertIsNone(sut.get_auth_command(6, AccessOperation.WRITE))
+        self.assertIsNone(sut.get_auth_command(128 + 4, AccessOperation.READ))
+        self.assertEqual(KEY_A, sut.get_auth_command(128 + 5, AccessOperation.WRITE))
+        self.assertEqual(KEY_B, sut.get_common_auth_command([4, 5], [AccessOperation.READ, AccessOperation.WRITE]))
+        self.assertIsNone(sut.get_common_auth_command([4, 6], [AccessOperation.WRITE]))
+        self.assertEqual(KEY_B, sut.get_session_auth_command([(4, [AccessOperation.INCREMENT]), (6, [AccessOperation.READ])]))
+        self.assertIsNone(sut.get_session_auth_command([(4, [AccessOperation.INCREMENT]), (6, [AccessOperation.WRITE])]))
+
+    def test_load_sector_trailer(self):
+        # arrange
+        sut = AuthPlanner()
+        rfid = mock.MagicMock()
+        rfid.pcd_authenticate.return_value = StatusCode.STATUS_OK
+        rfid.mifare_read.return_value = (StatusCode.STATUS_OK, [0x00] * 6 + encode_access_bits([0b000, 0b100, 0b000, 0b011]) + [0x69] + [0x00] * 6 + [0x12, 0x34])
+        uid = mock.MagicMock()
+        uid.get_picc_type.return_value.get_sector_definition.return_value = (4, 7, 3)
+
+        # act
+        status, trailer = sut.load_sector_trailer(rfid, uid, 1, mock.MagicMock())
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual([0b000, 0b100, 0b000, 0b011], trailer.groups)
+        rfid.mifare_read.assert_called_once_with(7)
+        self.assertEqual(KEY_B, sut.get_auth_command(5, AccessOperation.WRITE))
+
+
+if __name__ == "__main__":
+    unittest.main()
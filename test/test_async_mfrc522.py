@@ -0,0 +1,131 @@
+'''
+Tests for AsyncMFRC522 and AsyncSimpleMFRC522
+'''
+import asyncio
+import sys
+import threading
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import AsyncMFRC522, AsyncSimpleMFRC522, CardEventType, StatusCode, Uid
+
+
+class TestAsyncMFRC522(unittest.TestCase):
+
+    def test_methods_are_coroutines(self):
+        # arrange
+        rfid = mock.MagicMock()
+        rfid.picc_select.return_value = (StatusCode.STATUS_OK, None)
+        sut = AsyncMFRC522(rfid=rfid)
+
+        # act
+        result = asyncio.run(sut.picc_select())
+
+        # assert
+        self.assertEqual((StatusCode.STATUS_OK, None), result)
+
+    def test_operations_do_not_block_the_loop(self):
+        # arrange
+        rfid = mock.MagicMock()
+        rfid.picc_select.side_effect = lambda: threading.current_thread()
+        sut = AsyncMFRC522(rfid=rfid)
+        other = AsyncMFRC522(rfid=mock.MagicMock())
+
+        # act
+        thread = asyncio.run(sut.picc_select())
+
+        # assert
+        self.assertIsNot(threading.main_thread(), thread)
+        self.assertIs(sut.executor, other.executor)
+
+    def test_cleanup_without_init(self):
+        # arrange
+        rfid = mock.MagicMock(pin_irq=24, gpio=None)
+        sut = AsyncMFRC522(rfid=rfid)
+
+        # act
+        sut.cleanup()
+
+        # assert
+        rfid.pcd_cleanup.assert_called_once_with()
+
+    def test_irq_is_delivered_to_loop(self):
+        # arrange
+        sut = AsyncMFRC522(rfid=mock.MagicMock(pin_irq=24))
+
+        async def run():
+            await sut.init()
+            sut.loop.call_later(0.01, sut._interrupt_callback, 24)
+            return await sut.wait_for_irq(1), await sut.wait_for_irq(0.01)
+
+        # act
+        result = asyncio.run(run())
+
+        # assert
+        self.assertEqual((True, False), result)
+
+
+class TestAsyncSimpleMFRC522(unittest.TestCase):
+
+    def setUp(self):
+        self.sut = AsyncSimpleMFRC522(pin_irq=0)
+        self.sut.poll_interval = 0.001
+        self.rfid = mock.MagicMock(pin_irq=0)
+        self.sut.rfid = self.sut.simple.rfid = self.sut.reader.rfid = self.rfid
+        self.uid = Uid([0x01, 0x02, 0x03, 0x04], 0x08)
+
+    def test_cards(self):
+        # arrange
+        self.rfid.picc_is_new_card_present.return_value = True
+        self.rfid.picc_is_card_present.side_effect = [True, True] + [False] * 10
+        self.rfid.picc_select.return_value = (StatusCode.STATUS_OK, self.uid)
+
+        async def run():
+            events = []
+            async for event in self.sut.cards(removal_latency=0.003):
+                events.append(event)
+                if len(events) == 2:
+                    return events
+
+        # act
+        events = asyncio.run(run())
+
+        # assert
+        self.assertEqual([CardEventType.ARRIVED, CardEventType.REMOVED], [e.event_type for e in events])
+        self.assertEqual([0x01, 0x02, 0x03, 0x04], events[1].uid.uid())
+
+    def test_read_bytes_timeout(self):
+        # arrange
+        self.rfid.picc_is_new_card_present.return_value = False
+
+        # act
+        result = asyncio.run(self.sut.read_bytes(timeout=0.01))
+
+        # assert
+        self.assertEqual((StatusCode.STATUS_TIMEOUT, None, None), result)
+
+    def test_read_and_write_text_timeout(self):
+        # arrange
+        self.rfid.picc_is_new_card_present.return_value = False
+
+        async def run():
+            return await self.sut.read_text(timeout=0.01), await self.sut.write_text('text', timeout=0.01)
+
+        # act
+        read_result, write_result = asyncio.run(run())
+
+        # assert
+        self.assertEqual((StatusCode.STATUS_TIMEOUT, None, None), read_result)
+        self.assertEqual((StatusCode.STATUS_TIMEOUT, None, None), write_result)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+'''
+Tests for the benchmark suite
+'''
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import MFRC522, SimulatedSpi, SimulatedPicc, BinaryTracer, FaultType
+from benchmarks import hot_paths, soak
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_all_benchmarks_run(self):
+        # arrange
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+
+            # act
+            with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+                hot_paths.main(['--min-time', '0', '--json', path])
+                hot_paths.main(['--min-time', '0', '--compare', path, 'crc'])
+            with open(path) as f:
+                results = json.load(f)['results']
+
+        # assert
+        self.assertEqual([b.name for b in hot_paths.BENCHMARKS], list(results))
+        self.assertEqual(9, results['crc']['spi_transfers_per_op'])
+        self.assertLess(results['select_uid4']['spi_transfers_per_op'], results['select_uid7']['spi_transfers_per_op'])
+        self.assertLess(results['select_uid7']['spi_transfers_per_op'], results['select_uid10']['spi_transfers_per_op'])
+        self.assertIn('ops/sec', stdout.getvalue().splitlines()[-1])
+
+    def test_replay_benchmark(self):
+        # arrange
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'session.trace')
+            with open(path, 'wb') as f:
+                rfid = MFRC522(pin_reset=0, pin_irq=0, spi=SimulatedSpi([SimulatedPicc(hot_paths.UID4)]), tracer=BinaryTracer(f))
+                rfid.pcd_init()
+                rfid.picc_is_new_card_present()
+                rfid.picc_read_card_serial()
+            sut = hot_paths.trace_benchmark(path)
+
+            # act
+            result = sut.run(min_time=0, min_ops=3)
+
+        # assert
+        self.assertEqual(3, result['ops'])
+        self.assertGreater(result['spi_transfers_per_op'], 0)
+
+    def test_soak_with_faults(self):
+        # arrange
+        rates = {FaultType.CRC_ERROR: 0.05, FaultType.TIMEOUT: 0.05}
+
+        # act
+        result = soak.soak(soak.InventoryWorkload, rates, duration=0.1, seed=1)
+
+        # assert
+        self.assertGreater(result['operations'], 0)
+        self.assertEqual(result['operations'], result['succeeded'] + result['failed'])
+        self.assertTrue(result['verified'])
+        self.assertGreater(sum(result['injected'].values()), 0)
+        self.assertLessEqual(result['latency']['p50'], result['latency']['max'])
+
+    def test_soak_cli_with_rate(self):
+        # arrange
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'soak.json')
+
+            # act
+            with mock.patch('sys.stdout', new_callable=io.StringIO), mock.patch('sys.stderr', new_callable=io.StringIO):
+                status = soak.main(['inventory', '--duration', '0.05', '--rate', 'crc_error=0.1', '--json', path])
+            with open(path) as f:
+                results = json.load(f)
+
+        # assert
+        self.assertEqual(0, status)
+        self.assertEqual(0.1, results['rates']['crc_error'])
+        self.assertEqual(['inventory'], list(results['results']))
+
+    def test_fault_profiles(self):
+        # act
+        profiles = soak.fault_profiles({FaultType.CRC_ERROR: 0.01, FaultType.TIMEOUT: 0.0})
+
+        # assert
+        self.assertEqual(['baseline', 'crc_error', 'all'], [name for name, __ in profiles])
@@ -0,0 +1,144 @@
+'''
+Tests for the ContentCache
+'''
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import ContentCache, MFRC522, SimpleMFRC522, SimulatedSpi, SimulatedPicc, StatusCode, Uid
+
+
+class TestContentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.uid = Uid([0x11, 0x22, 0x33, 0x44], 0x08)
+
+    def test_lookup_validates_checksum(self):
+        # arrange
+        sut = ContentCache()
+        checksum = ContentCache.checksum([0x01] * 16 + [0xAA, 0xBB])
+        sut.store(self.uid, checksum, [0x41, 0x42])
+
+        # act
+        hit = sut.lookup(self.uid, checksum)
+        other_terminal_byte = sut.lookup(self.uid, checksum, terminal_byte=None)
+        sut.store(self.uid, checksum, [0x41, 0x42])
+        changed = sut.lookup(self.uid, ContentCache.checksum([0x02] * 16))
+
+        # assert
+        self.assertEqual([0x41, 0x42], hit)
+        self.assertIsNone(other_terminal_byte)
+        self.assertIsNone(changed)
+        self.assertEqual(0, len(sut))
+        stats = sut.get_stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(2, stats['stale'])
+
+    def test_lru_eviction_and_persistence(self):
+        # arrange
+        path = os.path.join(tempfile.mkdtemp(), 'cache.json')
+        sut = ContentCache(max_size=2, path=path)
+        uids = [Uid([0x11, 0x22, 0x33, n], 0x08) for n in range(3)]
+
+        # act
+        sut.store(uids[0], 1, [0x00])
+        sut.store(uids[1], 2, [0x01])
+        sut.lookup(uids[0], 1)                              # uids[1] is the least recently used now
+        sut.store(uids[2], 3, [0x02])
+        sut.close()
+        loaded = ContentCache(max_size=2, path=path)
+
+        # assert
+        self.assertEqual(1, sut.get_stats()['evictions'])
+        self.assertIsNone(loaded.lookup(uids[1], 2))
+        self.assertEqual([0x00], loaded.lookup(uids[0], 1))
+        self.assertEqual([0x02], loaded.lookup(uids[2], 3))
+
+    def test_saves_are_batched(self):
+        # arrange
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'cache.json')
+        sut = ContentCache(path=path, save_interval=60.0)
+        uids = [Uid([0x11, 0x22, 0x33, n], 0x08) for n in range(10)]
+
+        # act
+        with mock.patch('mfrc522.content_cache.os.replace', wraps=os.replace) as replace:
+            for n, uid in enumerate(uids):
+                sut.store(uid, n, [n])
+            sut.forget(uids[0])
+            saved_before_close = os.path.exists(path)
+            sut.close()
+            sut.close()                                     # Nothing changed, nothing to save
+
+        # assert
+        self.assertFalse(saved_before_close)
+        self.assertEqual(1, replace.call_count)
+        self.assertEqual(9, len(ContentCache(path=path)))
+        self.assertEqual(['cache.json'], os.listdir(directory))
+
+    def test_concurrent_saves_use_own_temp_files(self):
+        # arrange
+        path = os.path.join(tempfile.mkdtemp(), 'cache.json')
+        caches = [ContentCache(path=path, save_interval=0.0) for __ in range(4)]
+        errors = []
+
+        def store(cache, n):
+            try:
+                for i in range(20):
+                    cache.store(Uid([n, 0x22, 0x33, i], 0x08), i, [i])
+            except Exception as e:
+                errors.append(e)
+
+        # act
+        threads = [threading.Thread(target=store, args=(cache, n)) for n, cache in enumerate(caches)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # assert
+        self.assertEqual([], errors)
+        self.assertEqual(20, len(ContentCache(path=path)))
+
+    def test_read_bytes_uses_probe_block(self):
+        # arrange
+        picc = SimulatedPicc([0x11, 0x22, 0x33, 0x44])
+        picc.memory[1] = [0x48, 0x69] + [0x00] * 14
+        sut = SimpleMFRC522(content_cache=ContentCache(probe_block=1))
+        sut.rfid = MFRC522(pin_reset=0, pin_irq=0, spi=SimulatedSpi([picc]))
+        sut.rfid.pcd_init()
+        sut.wait_for_interrupt = mock.MagicMock(return_value=True)
+        sut.rfid.mifare_read = mock.MagicMock(wraps=sut.rfid.mifare_read)
+
+        # act
+        results = []
+        reads = []
+        for content in ([0x48, 0x69], [0x48, 0x69], [0x48, 0x6F]):
+            picc.memory[1] = content + [0x00] * (16 - len(content))
+            sut.rfid.picc_is_card_present()                 # Wake up the halted PICC
+            sut.rfid.mifare_read.reset_mock()
+            results.append(sut.read_bytes(terminal_byte=None))
+            reads.append(sut.rfid.mifare_read.call_count)
+
+        # assert
+        self.assertEqual([StatusCode.STATUS_OK] * 3, [status for status, __, __ in results])
+        self.assertEqual(results[0][2], results[1][2])
+        self.assertEqual([0x48, 0x6F], results[2][2][:2])
+        self.assertEqual(1 + 47, reads[0])                   # Probe + all 47 data blocks of a MIFARE 1K
+        self.assertEqual(1, reads[1])
+        self.assertEqual(1 + 47, reads[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
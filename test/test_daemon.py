@@ -0,0 +1,136 @@
+'''
+Tests for the ReaderDaemon and the ReaderClient
+'''
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import MFRC522, ReaderDaemon, ReaderClient, ReaderClientPool, CardEventType, StatusCode, SimulatedSpi, SimulatedPicc
+
+
+class TestReaderDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmpdir.name, 'mfrc522d.sock')
+        self.picc = SimulatedPicc([0x11, 0x22, 0x33, 0x44])
+        self.spi = SimulatedSpi()
+        self.sut = ReaderDaemon(MFRC522(pin_reset=0, pin_irq=0, spi=self.spi), socket_path=self.socket_path)
+        self.sut.start()
+        self.thread = threading.Thread(target=self.sut.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        self.sut.shutdown()
+        self.thread.join()
+        self.tmpdir.cleanup()
+
+    def test_write_and_read_blocks(self):
+        # arrange
+        self.spi.add_picc(self.picc)
+        pool = ReaderClientPool(self.socket_path, size=2)
+
+        # act
+        write_status, uid = pool.write_blocks({4: [0x42] * 16, 8: list(range(16))})
+        read_status, __, blocks = pool.read_blocks([4, 8])
+        pool.close()
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, write_status)
+        self.assertEqual([0x11, 0x22, 0x33, 0x44], uid.uid())
+        self.assertEqual(StatusCode.STATUS_OK, read_status)
+        self.assertEqual({4: [0x42] * 16, 8: list(range(16))}, blocks)
+
+    def test_pool_closes_client_on_error(self):
+        # arrange
+        pool = ReaderClientPool(self.socket_path, size=1)
+
+        # act
+        with self.assertRaises(RuntimeError):
+            with pool.client() as client:
+                raise RuntimeError()
+        with pool.client() as other:
+            pass
+        pool.close()
+
+        # assert
+        self.assertIsNot(client, other)
+        self.assertRaises(OSError, client.request, 'ping')
+
+    def test_no_card(self):
+        with ReaderClient(self.socket_path) as client:
+            status, uid, blocks = client.read_blocks([4])
+
+        self.assertEqual(StatusCode.STATUS_TIMEOUT, status)
+        self.assertIsNone(blocks)
+
+    def test_invalid_request(self):
+        with ReaderClient(self.socket_path) as client:
+            response = client.request('write_blocks', blocks={'4': '00'})
+
+        self.assertEqual(StatusCode.STATUS_INVALID, response['status'])
+
+    def test_request_with_wrong_types(self):
+        for request in (b'{"op": "write_blocks", "blocks": [1]}', b'{"op": "read_blocks", "auth": 1, "blocks": [4]}',
+                        b'{"op": "read_blocks", "blocks": {"4": "00"}}'):
+            with self.subTest(request=request):
+                # act
+                response = self.sut.handle_request(None, request)
+
+                # assert
+                self.assertEqual(StatusCode.STATUS_INVALID.name, response['status'])
+
+    def test_subscribe(self):
+        with ReaderClient(self.socket_path) as client:
+            # act
+            client.subscribe()
+            self.spi.add_picc(self.picc)
+            arrived = client.get_event(timeout=2)
+            self.spi.remove_picc(self.picc)
+            removed = client.get_event(timeout=2)
+
+        # assert
+        self.assertEqual(CardEventType.ARRIVED, arrived.event_type)
+        self.assertEqual([0x11, 0x22, 0x33, 0x44], arrived.uid.uid())
+        self.assertEqual(CardEventType.REMOVED, removed.event_type)
+
+    def test_slow_subscriber_is_disconnected(self):
+        # arrange
+        self.sut.max_queued_events = 4
+        slow = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        slow.connect(self.socket_path)
+        slow.sendall(b'{"id": 1, "op": "subscribe"}\n')
+        deadline = time.monotonic() + 2
+        while not self.sut._subscribers and time.monotonic() < deadline:
+            time.sleep(0.01)
+        message = {'event': 'ARRIVED', 'padding': 'x' * 65536}
+
+        # act
+        start = time.monotonic()
+        for __ in range(100):
+            self.sut._broadcast(message)
+            if not self.sut._subscribers:
+                break
+        duration = time.monotonic() - start
+        slow.close()
+
+        # assert
+        self.assertEqual(set(), self.sut._subscribers)
+        self.assertLess(duration, 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+'''
+Tests for the DedupeCache
+'''
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import DedupeCache, PresenceTracker, CardEventType, StatusCode, Uid
+from .helpers import FakeClock
+
+
+class TestDedupeCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.uid = Uid([0x01, 0x02, 0x03, 0x04], 0x08)
+
+    def test_sliding_ttl(self):
+        # arrange
+        sut = DedupeCache(ttl=1.0, clock=self.clock)
+
+        # act
+        duplicates = []
+        for __ in range(5):
+            duplicates.append(sut.is_duplicate(self.uid))
+            self.clock.now += 0.5                          # PICC stays on the reader, each sighting extends the window
+        self.clock.now += 1.0
+        duplicates.append(sut.is_duplicate(self.uid))
+
+        # assert
+        self.assertEqual([False, True, True, True, True, False], duplicates)
+        stats = sut.get_stats()
+        self.assertEqual(6, stats['seen'])
+        self.assertEqual(4, stats['duplicates'])
+        self.assertAlmostEqual(4 / 6, stats['duplicate_rate'])
+
+    def test_size_is_bounded(self):
+        # arrange
+        sut = DedupeCache(ttl=10.0, max_size=3, clock=self.clock)
+        uids = [Uid([0x01, 0x02, 0x03, n], 0x08) for n in range(4)]
+
+        # act
+        for uid in uids:
+            sut.is_duplicate(uid)
+        sut.is_duplicate(uids[1])                           # Most recently seen, uids[2] is evicted next
+        sut.is_duplicate(Uid([0xAA, 0xBB, 0xCC, 0xDD], 0x08))
+
+        # assert
+        self.assertEqual(3, len(sut))
+        self.assertNotIn(uids[0], sut)
+        self.assertIn(uids[1], sut)
+        self.assertNotIn(uids[2], sut)
+        self.assertEqual(2, sut.get_stats()['evictions'])
+
+    def test_presence_tracker_suppresses_reappearing_card(self):
+        # arrange
+        rfid = mock.MagicMock()
+        rfid.picc_is_card_present.return_value = True
+        rfid.picc_select.return_value = (StatusCode.STATUS_OK, self.uid)
+        sut = DedupeCache(ttl=1.0, clock=self.clock)
+        tracker = PresenceTracker(rfid, removal_latency=0.03, miss_threshold=1, clock=self.clock, dedupe=sut)
+
+        # act
+        events = tracker.poll()
+        rfid.picc_is_card_present.return_value = False
+        self.clock.now += 0.5
+        events += tracker.poll()                            # REMOVED
+        rfid.picc_is_card_present.return_value = True
+        self.clock.now += 0.3
+        events += tracker.poll()                            # Back within 1s after the last sighting
+        rfid.picc_is_card_present.return_value = False
+        self.clock.now += 0.1
+        events += tracker.poll()
+
+        # assert
+        self.assertEqual([CardEventType.ARRIVED, CardEventType.REMOVED], [e.event_type for e in events])
+        self.assertEqual(1, sut.get_stats()['duplicates'])
+
+
+if __name__ == '__main__':
+    unittest.main()
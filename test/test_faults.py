@@ -0,0 +1,74 @@
+'''
+Tests for the FaultInjector of the SimulatedSpi
+'''
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import MFRC522, MIFARE_Key, PICC_Command, StatusCode, SimulatedSpi, SimulatedPicc, FaultInjector, FaultType
+
+
+class TestFaultInjector(unittest.TestCase):
+
+    def setUp(self):
+        self.picc = SimulatedPicc([0x11, 0x22, 0x33, 0x44])
+        self.faults = FaultInjector(seed=1)
+        self.spi = SimulatedSpi([self.picc], faults=self.faults)
+        self.rfid = MFRC522(pin_reset=0, pin_irq=0, spi=self.spi)
+        self.rfid.pcd_init()
+        self.rfid.picc_is_card_present()
+        status, self.uid = self.rfid.picc_select()
+        self.rfid.pcd_authenticate(PICC_Command.PICC_CMD_MF_AUTH_KEY_A, 7, MIFARE_Key(), self.uid)
+
+    def read_with_fault(self, fault):
+        self.faults.rates = {fault: 1.0}
+        status, __ = self.rfid.mifare_read(4)
+        self.faults.rates = {}
+        return status
+
+    def test_rf_faults_reach_the_error_branches(self):
+        # act / assert
+        self.assertEqual(StatusCode.STATUS_CRC_WRONG, self.read_with_fault(FaultType.CRC_ERROR))
+        self.assertEqual(StatusCode.STATUS_ERROR, self.read_with_fault(FaultType.PARITY_ERROR))
+        self.assertEqual(StatusCode.STATUS_COLLISION, self.read_with_fault(FaultType.COLLISION))
+        self.assertEqual(StatusCode.STATUS_TIMEOUT, self.read_with_fault(FaultType.TIMEOUT))
+        self.assertEqual(1, self.faults.injected[FaultType.CRC_ERROR])
+        self.assertEqual(1, self.rfid.metrics.crc_errors)
+        self.assertEqual(1, self.rfid.metrics.protocol_errors)
+        self.assertEqual(1, self.rfid.metrics.collisions)
+
+    def test_removed_picc_comes_back(self):
+        # arrange
+        self.faults.removal_frames = 2
+
+        # act
+        status = self.read_with_fault(FaultType.CARD_REMOVAL)
+        removed = self.picc not in self.spi.piccs
+        present = [self.rfid.picc_is_card_present() for __ in range(2)]
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_TIMEOUT, status)
+        self.assertTrue(removed)
+        self.assertEqual([False, True], present)
+
+    def test_dead_spi(self):
+        # arrange
+        self.faults.rates = {FaultType.DEAD_SPI: 1.0}
+        self.faults.dead_spi_transfers = 3
+
+        # act
+        stuck = [self.rfid.pcd_get_version() for __ in range(3)]
+        self.faults.rates = {}
+        version = self.rfid.pcd_get_version()
+
+        # assert
+        self.assertIn(stuck, ([0x00] * 3, [0xFF] * 3))
+        self.assertEqual(0x92, version)
@@ -0,0 +1,121 @@
+'''
+Tests for the EventRing and the FleetSupervisor
+'''
+import multiprocessing
+import sys
+import threading
+import time
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import MFRC522, EventRing, FleetSupervisor, CardEventType, StatusCode, Uid, SimulatedSpi, SimulatedPicc
+from mfrc522.fleet import _run_worker
+
+
+def simulated_reader_factory(bus, device):
+    picc = SimulatedPicc([0x10 + bus, 0x20 + device, 0x33, 0x44])
+    return MFRC522(bus=bus, device=device, pin_reset=0, pin_irq=0, spi=SimulatedSpi([picc]))
+
+
+class TestEventRing(unittest.TestCase):
+
+    def setUp(self):
+        self.sut = EventRing(capacity=2)
+
+    def tearDown(self):
+        self.sut.close()
+
+    def test_put_get(self):
+        # arrange
+        uid = Uid([0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07], 0x00)
+
+        # act
+        self.sut.put(CardEventType.ARRIVED, uid, 1.5, bus=1, device=2)
+        self.sut.put(CardEventType.REMOVED, uid, 2.5, 0.1)
+        events = self.sut.get()
+
+        # assert
+        self.assertEqual([CardEventType.ARRIVED, CardEventType.REMOVED], [e.event_type for e in events])
+        self.assertEqual(uid.uid(), events[0].uid.uid())
+        self.assertEqual((1, 2, 1.5, None, StatusCode.STATUS_OK), (events[0].bus, events[0].device, events[0].timestamp, events[0].latency, events[0].status))
+        self.assertAlmostEqual(0.1, events[1].latency)
+        self.assertEqual([], self.sut.get())
+
+    def test_full_ring_drops(self):
+        # act
+        results = [self.sut.put(CardEventType.ARRIVED, None, float(i)) for i in range(3)]
+
+        # assert
+        self.assertEqual([True, True, False], results)
+        self.assertEqual(1, self.sut.dropped)
+        self.assertEqual([0.0, 1.0], [e.timestamp for e in self.sut.get()])
+
+    def test_incomplete_record_is_not_read(self):
+        # arrange
+        self.sut.put(CardEventType.ARRIVED, None, 1.0)
+        self.sut.shm.buf[EventRing._HEADER_SIZE + 20] ^= 0xFF
+
+        # act / assert
+        self.assertEqual([], self.sut.get())
+        self.sut.shm.buf[EventRing._HEADER_SIZE + 20] ^= 0xFF
+        self.assertEqual(1, len(self.sut.get()))
+
+
+class TestFleetSupervisor(unittest.TestCase):
+
+    def test_worker_closes_its_ring(self):
+        # arrange
+        ring = EventRing(capacity=8)
+        stop_event = threading.Event()
+        closed = []
+        close = EventRing.close
+
+        # act
+        with mock.patch.object(EventRing, 'close', autospec=True, side_effect=lambda self: (closed.append(self), close(self))):
+            worker = threading.Thread(target=_run_worker, args=(1, [0, 2], ring, simulated_reader_factory, stop_event, 0.01))
+            worker.start()
+            deadline = time.monotonic() + 5
+            while len(ring) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            stop_event.set()
+            worker.join()
+        events = ring.get()
+        ring.close()
+
+        # assert
+        self.assertEqual([(1, 0, [0x11, 0x20, 0x33, 0x44]), (1, 2, [0x11, 0x22, 0x33, 0x44])],
+                         sorted((e.bus, e.device, e.uid.uid()) for e in events))
+        self.assertEqual(1, len(closed))
+        self.assertIsNot(ring, closed[0])                  # The worker's own attachment, the owner's memory is not unlinked
+
+    def test_workers_publish_events(self):
+        # arrange
+        sut = FleetSupervisor({0: [0], 1: [0, 1]}, reader_factory=simulated_reader_factory, poll_interval=0.01,
+                              mp_context=multiprocessing.get_context('fork'))
+
+        # act
+        events = []
+        with sut:
+            deadline = time.monotonic() + 10
+            while len(events) < 3 and time.monotonic() < deadline:
+                events.extend(sut.read_events())
+                time.sleep(0.01)
+            stats = sut.get_stats()
+
+        # assert
+        self.assertEqual([(0, 0, [0x10, 0x20, 0x33, 0x44]), (1, 0, [0x11, 0x20, 0x33, 0x44]), (1, 1, [0x11, 0x21, 0x33, 0x44])],
+                         sorted((e.bus, e.device, e.uid.uid()) for e in events))
+        self.assertTrue(stats[1]['alive'])
+        self.assertEqual(0, stats[0]['dropped'])
+
+
+if __name__ == "__main__":
+    unittest.main()
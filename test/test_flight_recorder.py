@@ -0,0 +1,97 @@
+'''
+Tests for the FlightRecorder
+'''
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import (MFRC522, MIFARE_Key, PCD_Register, PICC_Command, StatusCode, SimulatedSpi, SimulatedPicc, FlightRecorder,
+                     TraceDirection, format_record)
+from .helpers import FakeClock
+
+
+class TestFlightRecorder(unittest.TestCase):
+
+    def test_ring_keeps_last_records(self):
+        # arrange
+        sut = FlightRecorder(size=3)
+
+        # act
+        for value in range(5):
+            sut.record_transfer(float(value), [PCD_Register.FIFODataReg.value, value], [0, 0])
+        records = sut.dump()
+
+        # assert
+        self.assertEqual([2.0, 3.0, 4.0], [r.timestamp for r in records])
+        self.assertEqual([[2], [3], [4]], [r.data for r in records])
+        self.assertEqual(TraceDirection.WRITE, records[0].direction)
+        self.assertEqual(5, sut.count)
+
+    def test_auto_dump_on_error_is_rate_limited(self):
+        # arrange
+        clock = FakeClock()
+        callback = mock.MagicMock()
+        sut = FlightRecorder(size=8, dump_callback=callback, min_dump_interval=10.0, clock=clock)
+        sut.record_transfer(1.0, [PCD_Register.ComIrqReg.value | 0x80, 0], [0, 0x30])
+
+        # act
+        sut.record_frame(2.0, PICC_Command.PICC_CMD_MF_READ.value, StatusCode.STATUS_TIMEOUT)
+        sut.record_frame(3.0, PICC_Command.PICC_CMD_MF_READ.value, StatusCode.STATUS_CRC_WRONG)
+        sut.record_frame(4.0, PICC_Command.PICC_CMD_MF_READ.value, StatusCode.STATUS_CRC_WRONG)
+        clock.now += 10.0
+        sut.record_frame(5.0, PICC_Command.PICC_CMD_MF_READ.value, StatusCode.STATUS_ERROR)
+
+        # assert
+        self.assertEqual(2, callback.call_count)
+        records = callback.call_args_list[0][0][0]
+        self.assertEqual((TraceDirection.READ, PCD_Register.ComIrqReg.value, [0x30]), records[0][1:])
+        self.assertEqual('3.000000 frame PICC_CMD_MF_READ STATUS_CRC_WRONG', format_record(records[-1]))
+
+    def test_driver_records_frames(self):
+        # arrange
+        sut = MFRC522(pin_reset=0, pin_irq=0, spi=SimulatedSpi([SimulatedPicc([0x11, 0x22, 0x33, 0x44])]))
+        sut.pcd_init()
+
+        # act
+        sut.picc_is_new_card_present()
+        sut.picc_halt_a()
+        present = sut.picc_is_new_card_present()
+
+        # assert
+        self.assertFalse(present)
+        frames = [(r.register, StatusCode(r.data[0])) for r in sut.flight_recorder.dump() if r.direction == TraceDirection.FRAME]
+        self.assertEqual([(PICC_Command.PICC_CMD_REQA.value, StatusCode.STATUS_OK),
+                          (PICC_Command.PICC_CMD_HLTA.value, StatusCode.STATUS_TIMEOUT),
+                          (PICC_Command.PICC_CMD_REQA.value, StatusCode.STATUS_TIMEOUT)], frames)
+
+
+    def test_driver_records_data_frames_under_their_command(self):
+        # arrange
+        picc = SimulatedPicc([0x11, 0x22, 0x33, 0x44])
+        picc.memory[5] = [0, 0, 0, 0, 0xFF, 0xFF, 0xFF, 0xFF, 0, 0, 0, 0, 5, 0xFA, 5, 0xFA]      # Value block, value 0
+        sut = MFRC522(pin_reset=0, pin_irq=0, spi=SimulatedSpi([picc]))
+        sut.pcd_init()
+        sut.picc_is_new_card_present()
+        status, uid = sut.picc_select()
+        sut.pcd_authenticate(PICC_Command.PICC_CMD_MF_AUTH_KEY_A, 4, MIFARE_Key(), uid)
+        count = sut.flight_recorder.count
+
+        # act
+        sut.mifare_write(4, [0x60] + [0] * 15)                      # The data frame starts with AUTH_KEY_A
+        sut.mifare_increment(5, 0x30)
+
+        # assert
+        records = sut.flight_recorder.dump()[-(sut.flight_recorder.count - count):]
+        frames = [r.register for r in records if r.direction == TraceDirection.FRAME]
+        self.assertEqual([PICC_Command.PICC_CMD_MF_WRITE.value] * 2 + [PICC_Command.PICC_CMD_MF_INCREMENT.value] * 2, frames)
+
+if __name__ == '__main__':
+    unittest.main()
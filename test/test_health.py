@@ -0,0 +1,133 @@
+'''
+Tests for the HealthWatchdog
+'''
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import MFRC522, HealthWatchdog, HealthState, RecoveryStep, PCD_Register, PCD_RxGain, SimulatedSpi
+from .helpers import FakeClock
+
+
+class TestHealthWatchdog(unittest.TestCase):
+
+    def setUp(self):
+        self.spi = SimulatedSpi()
+        self.rfid = MFRC522(pin_reset=0, pin_irq=0, spi=self.spi)
+        self.rfid._READY_TIMEOUT = 0.0
+        self.rfid.pcd_init()
+        self.rfid.pcd_set_antenna_gain(PCD_RxGain.RxGain_max.value)
+        self.clock = FakeClock()
+
+    def kill_spi(self):
+        self.spi.xfer2 = lambda data: [0xFF] * len(data)
+
+    def test_probe_is_one_transfer(self):
+        # arrange
+        sut = HealthWatchdog(self.rfid, clock=self.clock)
+        sut.poll()
+        transfers = self.spi.transfers
+
+        # act
+        state = sut.poll()
+
+        # assert
+        self.assertEqual(HealthState.HEALTHY, state)
+        self.assertEqual(1, self.spi.transfers - transfers)
+        self.assertEqual(0x92, sut.version)
+        self.assertTrue(sut.wait_healthy(0))
+
+    def test_brown_out_recovered_by_soft_reset(self):
+        # arrange
+        callback = mock.MagicMock()
+        sut = HealthWatchdog(self.rfid, failure_threshold=2, callback=callback, clock=self.clock)
+        sut.poll()
+        self.spi.reset()                                # Registers back to their reset values
+
+        # act
+        states = [sut.poll(), sut.poll()]
+
+        # assert
+        self.assertEqual([HealthState.SUSPECT, HealthState.HEALTHY], states)
+        self.assertEqual([mock.call(HealthState.SUSPECT), mock.call(HealthState.RECOVERING), mock.call(HealthState.HEALTHY)], callback.call_args_list)
+        self.assertEqual(RecoveryStep.SOFT_RESET, sut.last_recovery_step)
+        self.assertEqual(0x80, self.rfid.pcd_read_register(PCD_Register.TModeReg))
+        self.assertEqual(PCD_RxGain.RxGain_max.value, self.rfid.pcd_get_antenna_gain())
+        stats = sut.get_stats()
+        self.assertEqual(1, stats['recoveries'])
+        self.assertEqual(1, stats['recoveries_by_step']['SOFT_RESET'])
+        self.assertEqual(2, stats['failed_probes'])
+
+    def test_dead_chip_backs_off(self):
+        # arrange
+        sut = HealthWatchdog(self.rfid, failure_threshold=1, backoff=0.5, max_backoff=0.8, clock=self.clock)
+        sut.poll()
+        self.kill_spi()
+
+        # act
+        state = sut.poll()
+        delays = [sut.next_poll_delay()]
+        self.clock.now += 0.5
+        sut.poll()
+        delays.append(sut.next_poll_delay())
+        self.clock.now += 0.8
+        sut.poll()
+        delays.append(sut.next_poll_delay())
+
+        # assert
+        self.assertEqual(HealthState.FAILED, state)
+        self.assertFalse(sut.wait_healthy(0))
+        self.assertEqual([0.5, 0.8, 0.8], [round(delay, 6) for delay in delays])
+        self.assertEqual(3, sut.get_stats()['recovery_attempts'])
+        self.assertEqual(0, sut.get_stats()['recoveries'])
+        self.assertAlmostEqual(1.3, sut.get_stats()['downtime'])
+
+    def test_failed_chip_waits_for_backoff(self):
+        # arrange
+        sut = HealthWatchdog(self.rfid, failure_threshold=1, backoff=0.5, clock=self.clock)
+        sut.poll()
+        self.kill_spi()
+        sut.poll()
+        del self.spi.xfer2                              # The chip is back
+        transfers = self.spi.transfers
+
+        # act
+        early = sut.poll()
+        self.clock.now += 0.5
+        late = sut.poll()
+
+        # assert
+        self.assertEqual(HealthState.FAILED, early)
+        self.assertEqual(HealthState.HEALTHY, late)
+        self.assertTrue(sut.wait_healthy(0))
+        self.assertEqual(RecoveryStep.SOFT_RESET, sut.last_recovery_step)
+        self.assertLess(0, self.spi.transfers - transfers)
+
+    def test_without_snapshot_only_reinit(self):
+        # arrange
+        rfid = mock.MagicMock()
+        rfid.pcd_read_registers.side_effect = [[0xFF, 0xFF, 0xFF], [0x92, 0x80, 0xA9]]
+        rfid.pcd_read_register.return_value = 0x92
+        sut = HealthWatchdog(rfid, failure_threshold=1, clock=self.clock)
+
+        # act
+        state = sut.poll()
+
+        # assert
+        self.assertEqual(HealthState.HEALTHY, state)
+        self.assertEqual(RecoveryStep.REINIT, sut.last_recovery_step)
+        rfid.pcd_reset.assert_not_called()
+        rfid.pcd_init.assert_called_once_with()
+        self.assertIsNotNone(sut.snapshot)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+'''
+Tests that the package works without the hardware libraries (RPi.GPIO, spidev)
+'''
+import os
+import subprocess
+import sys
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter: None in sys.modules makes each import of the hardware libraries fail
+SCRIPT = '''
+import sys
+sys.modules['RPi'] = sys.modules['RPi.GPIO'] = sys.modules['spidev'] = None
+from mfrc522 import MFRC522, SimpleMFRC522, PICC_Command, SimulatedSpi, SimulatedPicc
+rfid = MFRC522(pin_reset=0, pin_irq=0, spi=SimulatedSpi([SimulatedPicc([0x11, 0x22, 0x33, 0x44])]))
+rfid.pcd_init()
+print(rfid.picc_is_new_card_present())
+try:
+    MFRC522().pcd_init()
+except ImportError:
+    print('ImportError')
+'''
+
+
+class TestImports(unittest.TestCase):
+
+    def test_no_hardware_libraries_needed(self):
+        # act
+        output = subprocess.run([sys.executable, '-c', SCRIPT], cwd=ROOT, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+        # assert
+        self.assertEqual(['True', 'ImportError'], output.split())
+
+    def test_service_modules_are_imported_lazily(self):
+        # arrange
+        script = ("import sys; import mfrc522; "
+                  "print([name for name in ('asyncio', 'http.server', 'socketserver', 'multiprocessing') if name in sys.modules]); "
+                  "print(mfrc522.ReaderDaemon.__module__, 'asyncio' in sys.modules)")
+
+        # act
+        output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+        # assert
+        self.assertEqual(['[]', 'mfrc522.daemon False'], output.splitlines())
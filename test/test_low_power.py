@@ -0,0 +1,114 @@
+'''
+Tests for the LowPowerDetector
+'''
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import MFRC522, LowPowerDetector, PCD_Register, SimulatedSpi, SimulatedPicc
+from .helpers import FakeClock
+
+
+class TestLowPowerDetector(unittest.TestCase):
+
+    def setUp(self):
+        self.spi = SimulatedSpi(latency_polls=2)
+        self.rfid = MFRC522(pin_reset=0, pin_irq=0, spi=self.spi)
+        self.rfid.pcd_init()
+        self.clock = FakeClock()
+
+    def probe_takes(self, on_time):
+        probe = self.rfid.picc_is_new_card_present
+        def timed_probe():
+            self.clock.now += on_time
+            return probe()
+        self.rfid.picc_is_new_card_present = timed_probe
+
+    def test_empty_field_powers_down(self):
+        # arrange
+        sut = LowPowerDetector(self.rfid, clock=self.clock)
+
+        # act
+        detected = [sut.poll(), sut.poll()]
+
+        # assert
+        self.assertEqual([False, False], detected)
+        self.assertTrue(sut.powered_down)
+        self.assertTrue(self.rfid.pcd_read_register(PCD_Register.CommandReg) & 0x10)
+        self.assertEqual([0x00, 0x28], self.rfid.pcd_read_registers([PCD_Register.TReloadRegH, PCD_Register.TReloadRegL]))  # 1ms = 40 ticks
+        self.assertEqual(0, sut.get_stats()['wakeup_failures'])
+
+    def test_detection_keeps_pcd_powered_up(self):
+        # arrange
+        sut = LowPowerDetector(self.rfid, clock=self.clock)
+        sut.poll()
+        self.clock.now += 0.1
+        self.spi.add_picc(SimulatedPicc([0x11, 0x22, 0x33, 0x44]))
+
+        # act
+        detected = sut.poll()
+
+        # assert
+        self.assertTrue(detected)
+        self.assertFalse(sut.powered_down)
+        self.assertEqual([0x03, 0xE8], self.rfid.pcd_read_registers([PCD_Register.TReloadRegH, PCD_Register.TReloadRegL]))
+        status, uid = self.rfid.picc_select()
+        self.assertEqual([0x11, 0x22, 0x33, 0x44], uid.uid())
+        stats = sut.get_stats()
+        self.assertEqual(1, stats['detections'])
+        self.assertAlmostEqual(0.1, stats['last_detection_latency'])
+
+    def test_pause_follows_duty_cycle(self):
+        # arrange
+        self.probe_takes(0.002)
+        sut = LowPowerDetector(self.rfid, duty_cycle=0.02, max_interval=0.5, clock=self.clock)
+
+        # act
+        sut.poll()
+        delay = sut.next_poll_delay()
+        self.clock.now += delay
+        sut.poll()
+
+        # assert
+        self.assertAlmostEqual(0.098, delay)
+        self.assertAlmostEqual(0.004, sut.get_stats()['on_time'])
+        self.assertAlmostEqual(0.004 / 0.102, sut.get_stats()['duty_cycle'])
+        sut.duty_cycle = 0.001
+        self.assertEqual(0.5, sut.next_poll_delay())
+
+    def test_wakeup_failure(self):
+        # arrange
+        sut = LowPowerDetector(self.rfid, clock=self.clock)
+        sut.poll()
+        self.rfid.pcd_soft_power_up = mock.MagicMock(return_value=False)
+
+        # act
+        sut.poll()
+
+        # assert
+        self.assertEqual(1, sut.get_stats()['wakeup_failures'])
+
+    def test_power_up_restores_timeout(self):
+        # arrange
+        sut = LowPowerDetector(self.rfid, clock=self.clock)
+        sut.poll()
+
+        # act
+        ready = sut.power_up()
+
+        # assert
+        self.assertTrue(ready)
+        self.assertFalse(self.rfid.pcd_read_register(PCD_Register.CommandReg) & 0x10)
+        self.assertEqual([0x03, 0xE8], self.rfid.pcd_read_registers([PCD_Register.TReloadRegH, PCD_Register.TReloadRegL]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+'''
+Tests for the ReaderMetrics of the MFRC522
+'''
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import MFRC522, MIFARE_Key, PICC_Command, StatusCode, SimulatedSpi, SimulatedPicc, LatencyHistogram
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.spi = SimulatedSpi([SimulatedPicc([0x11, 0x22, 0x33, 0x44]), SimulatedPicc([0x11, 0x2A, 0x35, 0x46])])
+        self.sut = MFRC522(pin_reset=0, pin_irq=0, spi=self.spi)
+        self.sut.pcd_init()
+        self.sut.metrics.reset()
+
+    def test_histogram_buckets(self):
+        # arrange
+        sut = LatencyHistogram(buckets=(0.001, 0.01))
+
+        # act
+        for value in (0.0005, 0.001, 0.002, 0.5):
+            sut.observe(value)
+
+        # assert
+        snapshot = sut.snapshot()
+        self.assertEqual([(0.001, 2), (0.01, 1), (float('inf'), 1)], snapshot['buckets'])
+        self.assertEqual(4, snapshot['count'])
+        self.assertEqual(0.5, snapshot['max'])
+
+    def test_counts_spi_frames_and_collisions(self):
+        # arrange
+        transfers = self.spi.transfers
+        bytes_transferred = self.spi.bytes_transferred
+
+        # act
+        self.sut.picc_is_new_card_present()
+        status, uid = self.sut.picc_select()
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        snapshot = self.sut.metrics.snapshot()
+        self.assertEqual(self.spi.transfers - transfers, snapshot['spi_transfers'])
+        self.assertEqual(self.spi.bytes_transferred - bytes_transferred, snapshot['spi_bytes'])
+        self.assertEqual(1, snapshot['frames']['PICC_CMD_REQA'])
+        self.assertGreaterEqual(snapshot['frames']['PICC_CMD_SEL_CL1'], 2)
+        self.assertEqual(1, snapshot['collisions'])
+        self.assertEqual(1, snapshot['operations']['picc_select']['count'])
+        self.assertEqual(1, snapshot['operations']['picc_is_new_card_present']['count'])
+
+    def test_counts_data_frames_under_their_command(self):
+        # arrange
+        self.spi.remove_picc(self.spi.piccs[1])
+        self.sut.picc_is_new_card_present()
+        status, uid = self.sut.picc_select()
+        self.sut.pcd_authenticate(PICC_Command.PICC_CMD_MF_AUTH_KEY_A, 4, MIFARE_Key(), uid)
+        self.sut.metrics.reset()
+
+        # act
+        self.sut.mifare_write(4, [0x60] + [0] * 15)                 # The data frames start with AUTH_KEY_A and READ
+        self.sut.mifare_write(5, [0x30] + [0] * 15)
+
+        # assert
+        self.assertEqual({'PICC_CMD_MF_WRITE': 2}, self.sut.metrics.snapshot()['frames'])
+
+    def test_counts_timeouts_and_reset(self):
+        # arrange
+        self.sut.picc_is_new_card_present()
+        __, uid = self.sut.picc_select()
+
+        key = MIFARE_Key()
+        key.key_byte = [0x00] * 6                           # Wrong key
+
+        # act
+        status = self.sut.pcd_authenticate(PICC_Command.PICC_CMD_MF_AUTH_KEY_A, 7, key, uid)
+        timeouts = self.sut.metrics.timeouts
+        self.sut.metrics.reset()
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_TIMEOUT, status)
+        self.assertEqual(1, timeouts)
+        self.assertEqual(0, self.sut.metrics.snapshot()['spi_transfers'])
+        self.assertEqual({}, self.sut.metrics.snapshot()['operations'])
+
+    def test_metrics_can_be_disabled(self):
+        # arrange
+        sut = MFRC522(pin_reset=0, pin_irq=0, spi=self.spi, metrics=False)
+
+        # act
+        present = sut.picc_is_card_present()
+
+        # assert
+        self.assertTrue(present)
+        self.assertIsNone(sut.metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,7 +16,7 @@ sys.modules['RPi.GPIO'] = mock.MagicMock()
 sys.modules['spidev'] = mock.MagicMock()
 
 # After mocking libraries import the system under test (sut)
-from mfrc522 import MFRC522
+from mfrc522 import MFRC522, PCD_Register, PCD_RxGain, PICC_Command, StatusCode, SimulatedSpi, RegisterSnapshot, AuthPlanner, SectorTrailer
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -42,6 +42,269 @@ class TestMFRC522(unittest.TestCase):
         
         # assert
 
+    def _mock_mifare_transceive(self, sut):
+        frames = []
+        def pcd_mifare_transceive(send_data, accept_timeout=False, picc_command=None):
+            frames.append(list(send_data))
+            return StatusCode.STATUS_OK
+        sut.pcd_mifare_transceive = pcd_mifare_transceive
+        sut.pcd_authenticate = mock.MagicMock(return_value=StatusCode.STATUS_OK)
+        return frames
+
+    def test_spi_transfer_with_chip_select_before_init(self):
+        # arrange
+        sut = MFRC522(pin_reset=0, pin_ce=5, pin_irq=0, spi=SimulatedSpi())
+
+        # act
+        version = sut.pcd_read_register(PCD_Register.VersionReg)
+        sut.gpio = mock.MagicMock()
+        sut.pcd_read_register(PCD_Register.VersionReg)
+
+        # assert
+        self.assertEqual(0x92, version)
+        self.assertEqual([mock.call(5, 0), mock.call(5, 1)], sut.gpio.output.call_args_list)
+
+    def test_mifare_value_transaction(self):
+        # arrange
+        sut = MFRC522()
+        frames = self._mock_mifare_transceive(sut)
+        sut.mifare_read = mock.MagicMock(return_value=(StatusCode.STATUS_OK, [0xF6, 0xFF, 0xFF, 0xFF] + [0] * 14))
+
+        # act
+        status, value = sut.mifare_value_transaction(mock.MagicMock(), mock.MagicMock(), 5, -300, backup_block_addr=6)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual(-10, value)
+        sut.pcd_authenticate.assert_called_once()
+        self.assertEqual([
+            [PICC_Command.PICC_CMD_MF_DECREMENT.value, 5], [0x2C, 0x01, 0x00, 0x00],
+            [PICC_Command.PICC_CMD_MF_TRANSFER.value, 5],
+            [PICC_Command.PICC_CMD_MF_RESTORE.value, 5], [0x00, 0x00, 0x00, 0x00],
+            [PICC_Command.PICC_CMD_MF_TRANSFER.value, 6]], frames)
+
+    def test_mifare_value_transaction_zero_delta_restores(self):
+        # arrange
+        sut = MFRC522()
+        frames = self._mock_mifare_transceive(sut)
+
+        # act
+        status, value = sut.mifare_value_transaction(mock.MagicMock(), mock.MagicMock(), 5, 0, read_back=False)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual([
+            [PICC_Command.PICC_CMD_MF_RESTORE.value, 5], [0x00, 0x00, 0x00, 0x00],
+            [PICC_Command.PICC_CMD_MF_TRANSFER.value, 5]], frames)
+
+    def test_mifare_value_transaction_backup_needs_only_transfer(self):
+        # arrange
+        sut = MFRC522()
+        frames = self._mock_mifare_transceive(sut)
+        planner = AuthPlanner()
+        planner.set_sector_trailer(1, SectorTrailer(groups=[0b110, 0b001, 0b000, 0b011]))     # Block 5 does not allow increment
+
+        # act
+        status, value = sut.mifare_value_transaction(mock.MagicMock(), mock.MagicMock(), 4, 1, backup_block_addr=5, auth_command=planner, read_back=False)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual(PICC_Command.PICC_CMD_MF_AUTH_KEY_B, sut.pcd_authenticate.call_args[0][0])
+        self.assertEqual(6, len(frames))
+
+    def test_mifare_value_transaction_backup_in_other_sector(self):
+        # arrange
+        sut = MFRC522()
+        frames = self._mock_mifare_transceive(sut)
+
+        # act
+        status, value = sut.mifare_value_transaction(mock.MagicMock(), mock.MagicMock(), 5, 1, backup_block_addr=8)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_INVALID, status)
+        self.assertEqual([], frames)
+
+    def test_mifare_backup_value_blocks(self):
+        # arrange
+        sut = MFRC522()
+        frames = self._mock_mifare_transceive(sut)
+
+        # act
+        status = sut.mifare_backup_value_blocks(mock.MagicMock(), mock.MagicMock(), [(4, 5), (6, 5)])
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        sut.pcd_authenticate.assert_called_once()
+        self.assertEqual([
+            [PICC_Command.PICC_CMD_MF_RESTORE.value, 4], [0x00, 0x00, 0x00, 0x00],
+            [PICC_Command.PICC_CMD_MF_TRANSFER.value, 5],
+            [PICC_Command.PICC_CMD_MF_RESTORE.value, 6], [0x00, 0x00, 0x00, 0x00],
+            [PICC_Command.PICC_CMD_MF_TRANSFER.value, 5]], frames)
+
+    def test_mifare_backup_value_blocks_across_sectors(self):
+        # arrange
+        sut = MFRC522()
+        frames = self._mock_mifare_transceive(sut)
+
+        # act
+        status = sut.mifare_backup_value_blocks(mock.MagicMock(), mock.MagicMock(), [(4, 8)])
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_INVALID, status)
+        sut.pcd_authenticate.assert_not_called()
+
+    def test_mifare_set_value(self):
+        # arrange
+        sut = MFRC522()
+        sut.mifare_write = mock.MagicMock(return_value=StatusCode.STATUS_OK)
+
+        # act
+        sut.mifare_set_value(5, 0x01020304)
+
+        # assert
+        sut.mifare_write.assert_called_once_with(5, [0x04, 0x03, 0x02, 0x01, 0xFB, 0xFC, 0xFD, 0xFE, 0x04, 0x03, 0x02, 0x01, 0x05, 0xFA, 0x05, 0xFA])
+
+
+    def test_picc_select_rejects_oversized_answer(self):
+        # arrange - e. g. the FIFO level of a stuck SPI bus reads 0xFF
+        sut = MFRC522()
+        sut.pcd_calulate_crc = mock.MagicMock(return_value=(StatusCode.STATUS_OK, [0, 0]))
+        sut.pcd_transceive_data = mock.MagicMock(return_value=(StatusCode.STATUS_OK, [0xFF] * 255, 0))
+
+        # act
+        status, uid = sut.picc_select()
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_NO_ROOM, status)
+
+    def test_pcd_reset_polls_until_ready(self):
+        # arrange
+        sut = MFRC522()
+        sut.pcd_write_register = mock.MagicMock()
+        sut.pcd_read_register = mock.MagicMock(side_effect=[0x30, 0x30, 0x20])     # PowerDown bit set while the oscillator starts
+
+        # act
+        with mock.patch('mfrc522.mfrc522.sleep') as sleep:
+            ready = sut.pcd_reset()
+
+        # assert
+        self.assertTrue(ready)
+        self.assertEqual(3, sut.pcd_read_register.call_count)
+        self.assertEqual(2, sleep.call_count)
+        self.assertLess(sum(c[0][0] for c in sleep.call_args_list), 0.01)
+
+    def test_pcd_reset_stuck_bus_times_out(self):
+        # arrange
+        sut = MFRC522()
+        sut.pcd_write_register = mock.MagicMock()
+        sut.pcd_read_register = mock.MagicMock(return_value=0x00)
+
+        # act
+        with mock.patch('mfrc522.mfrc522.sleep'), mock.patch('mfrc522.mfrc522.monotonic', side_effect=[0.0, 0.1, 0.2]):
+            ready = sut.pcd_reset()
+
+        # assert
+        self.assertFalse(ready)
+
+    def test_pcd_soft_power_up_waits_for_power_down_bit(self):
+        # arrange
+        spi = SimulatedSpi(latency_polls=3)
+        sut = MFRC522(pin_reset=0, pin_irq=0, spi=spi)
+        sut.pcd_init()
+        sut.pcd_soft_power_down()
+        transfers = spi.transfers
+
+        # act
+        with mock.patch('mfrc522.mfrc522.sleep'):
+            ready = sut.pcd_soft_power_up()
+
+        # assert
+        self.assertTrue(ready)
+        self.assertEqual(1 + 3, spi.transfers - transfers)      # Write, 3 polls until the oscillator is up
+        self.assertFalse(sut.pcd_read_register(PCD_Register.CommandReg) & 0x10)
+
+    def test_pcd_soft_power_up_stuck_bus_times_out(self):
+        for value in (0x00, 0xFF):
+            with self.subTest(value=value):
+                # arrange
+                sut = MFRC522()
+                sut.pcd_write_register = mock.MagicMock()
+                sut.pcd_read_register = mock.MagicMock(return_value=value)
+
+                # act
+                with mock.patch('mfrc522.mfrc522.sleep'), mock.patch('mfrc522.mfrc522.monotonic', side_effect=[0.0, 0.1, 0.2]):
+                    ready = sut.pcd_soft_power_up()
+
+                # assert
+                self.assertFalse(ready)
+                self.assertEqual(2, sut.pcd_read_register.call_count)
+
+    def test_pcd_init_writes_only_changed_registers(self):
+        # arrange
+        spi = SimulatedSpi()
+        sut = MFRC522(pin_reset=0, pin_irq=0, spi=spi)
+
+        # act
+        with mock.patch('mfrc522.mfrc522.sleep') as sleep:
+            sut.pcd_init()
+
+        # assert
+        sleep.assert_not_called()
+        self.assertEqual(9, spi.transfers)          # Soft reset, readiness check, 6 registers, antenna
+        for reg, value in ((PCD_Register.TModeReg, 0x80), (PCD_Register.TPrescalerReg, 0xA9), (PCD_Register.TReloadRegH, 0x03),
+                           (PCD_Register.TReloadRegL, 0xE8), (PCD_Register.TxASKReg, 0x40), (PCD_Register.ModeReg, 0x3D),
+                           (PCD_Register.TxModeReg, 0x00), (PCD_Register.RxModeReg, 0x00), (PCD_Register.ModWidthReg, 0x26),
+                           (PCD_Register.TxControlReg, 0x83)):
+            self.assertEqual(value, sut.pcd_read_register(reg), reg)
+
+    def test_pcd_init_without_confirmed_reset_writes_all_registers(self):
+        # arrange
+        sut = MFRC522(pin_reset=0, pin_irq=0, spi=SimulatedSpi())
+        sut.pcd_reset = mock.MagicMock(return_value=False)
+        sut.pcd_write_register = mock.MagicMock()
+        sut.antenna_on = mock.MagicMock()
+
+        # act
+        sut.pcd_init()
+
+        # assert
+        self.assertEqual(len(MFRC522._INIT_REGISTERS), sut.pcd_write_register.call_count)
+        sut.antenna_on.assert_called_once_with()
+
+    def test_pcd_restore_registers_after_soft_reset(self):
+        # arrange
+        spi = SimulatedSpi()
+        sut = MFRC522(pin_reset=0, pin_irq=0, spi=spi)
+        sut.pcd_init()
+        sut.pcd_set_antenna_gain(PCD_RxGain.RxGain_max.value)
+        snapshot = sut.pcd_save_registers()
+        sut.pcd_reset()
+        transfers = spi.transfers
+
+        # act
+        written = sut.pcd_restore_registers(snapshot)
+
+        # assert
+        self.assertEqual(8, written)                # 6 registers of pcd_init, gain, antenna
+        self.assertEqual(1 + written, spi.transfers - transfers)
+        self.assertEqual(snapshot, sut.pcd_save_registers())
+        self.assertEqual(PCD_RxGain.RxGain_max.value, sut.pcd_get_antenna_gain())
+
+    def test_register_snapshot_to_dict_from_dict(self):
+        # arrange
+        sut = MFRC522(pin_reset=0, pin_irq=0, spi=SimulatedSpi())
+        sut.pcd_init()
+        snapshot = sut.pcd_save_registers()
+
+        # act
+        registers = snapshot.to_dict()
+
+        # assert
+        self.assertEqual(len(RegisterSnapshot.REGISTERS), len(registers))
+        self.assertEqual(0x3D, registers['ModeReg'])
+        self.assertEqual(snapshot, RegisterSnapshot.from_dict(registers))
+        self.assertRaises(ValueError, RegisterSnapshot.from_dict, {'CommandReg': 0x00})
+        self.assertRaises(ValueError, RegisterSnapshot.from_dict, {'ModeReg': 0x100})
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'TestMFRC522.testName']
@@ -0,0 +1,83 @@
+'''
+Tests for the ReaderManager
+'''
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import ReaderManager, CardEventType, StatusCode, Uid
+from .helpers import FakeClock
+
+
+class TestReaderManager(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _mock_reader(self, polls, uid=None):
+        rfid = mock.MagicMock()
+        rfid.pcd_poll_communication.side_effect = polls
+        rfid.pcd_finish_communication.return_value = (StatusCode.STATUS_OK, [0x04, 0x00], 0)
+        rfid.picc_select.return_value = (StatusCode.STATUS_OK, uid)
+        return rfid
+
+    def test_requests_are_interleaved(self):
+        # arrange
+        uid = Uid([0x01, 0x02, 0x03, 0x04], 0x08)
+        calls = mock.MagicMock()
+        empty = self._mock_reader([None, None, StatusCode.STATUS_TIMEOUT])
+        card = self._mock_reader([None, StatusCode.STATUS_OK], uid)
+        calls.attach_mock(empty, 'empty')
+        calls.attach_mock(card, 'card')
+        callback = mock.MagicMock()
+        sut = ReaderManager(callback=callback, clock=self.clock)
+        sut.add_reader(empty, name='empty')
+        sut.add_reader(card, name='card')
+
+        # act
+        events = sut.run_cycle()
+
+        # assert
+        names = [c[0] for c in calls.mock_calls]
+        self.assertLess(names.index('card.pcd_start_communication'), names.index('empty.pcd_poll_communication'))
+        self.assertEqual(1, len(events))
+        reader, event = events[0]
+        self.assertEqual('card', reader.name)
+        self.assertEqual(CardEventType.ARRIVED, event.event_type)
+        callback.assert_called_once_with(reader, event)
+        card.picc_halt_a.assert_called_once()
+        stats = sut.get_stats()
+        self.assertEqual(1, stats['empty']['timeouts'])
+        self.assertEqual(1, stats['card']['cards'])
+
+    def test_weight_and_time_slice(self):
+        # arrange
+        def advance(wait_irq):
+            self.clock.now += 0.004
+        slow = self._mock_reader(advance)
+        fast = self._mock_reader(lambda wait_irq: StatusCode.STATUS_TIMEOUT)
+        sut = ReaderManager(clock=self.clock)
+        sut.add_reader(slow, name='slow', time_slice=0.01)
+        sut.add_reader(fast, name='fast', weight=3)
+
+        # act
+        sut.run_cycle()
+
+        # assert
+        stats = sut.get_stats()
+        self.assertEqual(1, stats['slow']['polls'])
+        self.assertEqual(1, stats['slow']['timeouts'])
+        self.assertEqual(3, stats['fast']['polls'])
+        slow.pcd_write_register.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
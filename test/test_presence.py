@@ -0,0 +1,109 @@
+'''
+Tests for the PresenceTracker
+'''
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import PresenceTracker, PresenceState, CardEventType, KeepAlive, StatusCode, Uid
+from .helpers import FakeClock
+
+
+class TestPresenceTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.rfid = mock.MagicMock()
+        self.uid = Uid([0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07], 0x00)
+        self.rfid.picc_is_card_present.return_value = True
+        self.rfid.picc_select.return_value = (StatusCode.STATUS_OK, self.uid)
+        self.clock = FakeClock()
+
+    def test_arrival(self):
+        # arrange
+        callback = mock.MagicMock()
+        sut = PresenceTracker(self.rfid, callback=callback, clock=self.clock)
+
+        # act
+        events = sut.poll()
+
+        # assert
+        self.assertEqual([CardEventType.ARRIVED], [e.event_type for e in events])
+        self.assertEqual(self.uid.uid(), events[0].uid.uid())
+        self.assertEqual(PresenceState.PRESENT, sut.state)
+        callback.assert_called_once_with(events[0])
+        self.rfid.picc_halt_a.assert_called_once()
+
+    def test_keep_alive_reselects_known_uid(self):
+        # arrange
+        sut = PresenceTracker(self.rfid, clock=self.clock)
+        sut.track(self.uid)
+
+        # act
+        events = sut.poll()
+
+        # assert
+        self.assertEqual([], events)
+        uid, valid_bits = self.rfid.picc_select.call_args[0]
+        self.assertEqual(self.uid.uid(), uid.uid())
+        self.assertEqual(56, valid_bits)
+
+    def test_removal_is_debounced(self):
+        # arrange
+        sut = PresenceTracker(self.rfid, removal_latency=0.09, miss_threshold=3, clock=self.clock)
+        sut.track(self.uid)
+        self.assertAlmostEqual(0.03, sut.next_poll_delay())
+        self.rfid.picc_is_card_present.return_value = False
+
+        # act
+        events = []
+        for __ in range(3):
+            self.clock.now += 0.03
+            events.append(sut.poll())
+
+        # assert
+        self.assertEqual([], events[0])
+        self.assertEqual([], events[1])
+        self.assertEqual([CardEventType.REMOVED], [e.event_type for e in events[2]])
+        self.assertAlmostEqual(0.09, events[2][0].latency)
+        self.assertEqual(PresenceState.ABSENT, sut.state)
+        self.assertEqual(1, sut.get_stats()['removals'])
+
+    def test_miss_is_reset_by_answer(self):
+        # arrange
+        sut = PresenceTracker(self.rfid, miss_threshold=2, keep_alive=KeepAlive.WAKEUP, clock=self.clock)
+        sut.track(self.uid)
+
+        # act
+        self.rfid.picc_is_card_present.return_value = False
+        sut.poll()
+        self.rfid.picc_is_card_present.return_value = True
+        sut.poll()
+        self.rfid.picc_is_card_present.return_value = False
+        events = sut.poll()
+
+        # assert
+        self.assertEqual([], events)
+        self.assertEqual(PresenceState.MISSING, sut.state)
+        self.rfid.picc_select.assert_not_called()
+
+    def test_wait_for_removal_canceled(self):
+        # arrange
+        sut = PresenceTracker(self.rfid, clock=self.clock)
+        sut.track(self.uid)
+        cancel = mock.MagicMock()
+        cancel.wait.return_value = True
+
+        # act / assert
+        self.assertFalse(sut.wait_for_removal(cancel_event=cancel))
+
+
+if __name__ == "__main__":
+    unittest.main()
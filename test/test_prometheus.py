@@ -0,0 +1,79 @@
+'''
+Tests for the Prometheus MetricsExporter
+'''
+import sys
+import unittest
+import urllib.request
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import MFRC522, MetricsExporter, HealthWatchdog, SimulatedSpi, SimulatedPicc
+from mfrc522.prometheus import render_metrics
+
+
+class TestPrometheus(unittest.TestCase):
+
+    def setUp(self):
+        self.rfid = MFRC522(bus=1, device=2, pin_reset=0, pin_ce=5, pin_irq=0, spi=SimulatedSpi([SimulatedPicc([0x11, 0x22, 0x33, 0x44])]))
+        self.rfid.pcd_init()
+
+    def test_render_health_and_histograms(self):
+        # arrange
+        self.rfid.pcd_get_version()
+        self.rfid.picc_is_new_card_present()
+        self.rfid.picc_select()
+        version_time = self.rfid.metrics.version_time
+
+        # act
+        text = render_metrics([self.rfid], now=version_time + 2.5)
+
+        # assert
+        lines = text.splitlines()
+        reader = 'bus="1",device="2",pin_ce="5"'
+        self.assertIn('mfrc522_version_register{%s} 146' % reader, lines)
+        self.assertIn('mfrc522_version_probe_age_seconds{%s} 2.5' % reader, lines)
+        self.assertIn('mfrc522_frames_total{%s,command="PICC_CMD_REQA"} 1' % reader, lines)
+        self.assertIn('mfrc522_operation_duration_seconds_count{%s,operation="picc_select"} 1' % reader, lines)
+        self.assertIn('mfrc522_operation_duration_seconds_bucket{%s,operation="picc_select",le="+Inf"} 1' % reader, lines)
+        self.assertEqual(1, lines.count('# TYPE mfrc522_operation_duration_seconds histogram'))
+        self.assertTrue(any(line.startswith('mfrc522_last_select_age_seconds{') for line in lines))
+
+    def test_render_health_watchdog(self):
+        # arrange
+        watchdog = HealthWatchdog(self.rfid)
+        watchdog.poll()
+
+        # act
+        text = render_metrics([self.rfid], watchdogs=[watchdog])
+
+        # assert
+        lines = text.splitlines()
+        reader = 'bus="1",device="2",pin_ce="5"'
+        self.assertIn('mfrc522_health_state{%s,state="HEALTHY"} 1' % reader, lines)
+        self.assertIn('mfrc522_health_state{%s,state="FAILED"} 0' % reader, lines)
+        self.assertIn('mfrc522_health_probes_total{%s} 1' % reader, lines)
+        self.assertIn('mfrc522_health_recoveries_total{%s,step="SOFT_RESET"} 0' % reader, lines)
+        self.assertIn('mfrc522_health_downtime_seconds_total{%s} 0.0' % reader, lines)
+
+    def test_http_endpoint(self):
+        # arrange
+        with MetricsExporter([self.rfid], port=0) as sut:
+            # act
+            with urllib.request.urlopen('http://127.0.0.1:{}/metrics'.format(sut.port), timeout=5) as response:
+                content_type = response.headers['Content-Type']
+                body = response.read().decode('utf-8')
+
+        # assert
+        self.assertTrue(content_type.startswith('text/plain; version=0.0.4'))
+        self.assertIn('mfrc522_spi_transfers_total{bus="1",device="2",pin_ce="5"}', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
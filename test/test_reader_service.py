@@ -0,0 +1,173 @@
+'''
+Tests for the ReaderService
+'''
+import sys
+import threading
+import unittest
+from concurrent.futures import wait
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import ReaderService, PRIORITY_HIGH, PRIORITY_LOW, StatusCode, Uid
+
+
+class TestReaderService(unittest.TestCase):
+
+    def setUp(self):
+        self.rfid = mock.MagicMock()
+        self.uid = Uid([0x01, 0x02, 0x03, 0x04], 0x08)
+        self.rfid.picc_is_card_present.return_value = True
+        self.rfid.picc_select.return_value = (StatusCode.STATUS_OK, self.uid)
+        self.rfid.pcd_authenticate.return_value = StatusCode.STATUS_OK
+        self.rfid.mifare_read.side_effect = lambda block_addr: (StatusCode.STATUS_OK, [block_addr] * 16 + [0xAA, 0xBB])
+        self.rfid.mifare_write.return_value = StatusCode.STATUS_OK
+
+    def test_read_blocks_authenticates_once_per_sector(self):
+        # arrange
+        sut = ReaderService(self.rfid)
+
+        # act
+        with sut:
+            status, uid, blocks = sut.read_blocks([4, 5, 8]).result(timeout=1)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual(self.uid.uid(), uid.uid())
+        self.assertEqual({4: [4] * 16, 5: [5] * 16, 8: [8] * 16}, blocks)
+        self.assertEqual(2, self.rfid.pcd_authenticate.call_count)
+        self.rfid.pcd_init.assert_called_once()
+        self.rfid.picc_halt_a.assert_called_once()
+        self.rfid.pcd_stop_crypto1.assert_called_once()
+
+    def test_write_blocks(self):
+        # arrange
+        sut = ReaderService(self.rfid)
+
+        # act
+        with sut:
+            status, __ = sut.write_blocks({1: [0x11] * 16, 2: [0x22] * 16}).result(timeout=1)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual([mock.call(1, [0x11] * 16), mock.call(2, [0x22] * 16)], self.rfid.mifare_write.call_args_list)
+
+    def test_priority_and_coalescing(self):
+        # arrange
+        sut = ReaderService(self.rfid, init=False)
+        blocker = threading.Event()
+        order = []
+        sut.submit(lambda rfid: blocker.wait(1))
+
+        # act
+        with sut:
+            low = sut.submit(lambda rfid: order.append('low'), priority=PRIORITY_LOW)
+            first = sut.select()
+            second = sut.select()
+            high = sut.submit(lambda rfid: order.append('high'), priority=PRIORITY_HIGH)
+            blocker.set()
+            low.result(timeout=1)
+
+        # assert
+        self.assertIs(first, second)
+        self.assertEqual(['high', 'low'], order)
+        self.rfid.picc_select.assert_called_once()
+        stats = sut.get_stats()
+        self.assertEqual(5, stats['submitted'])
+        self.assertEqual(1, stats['coalesced'])
+        self.assertEqual(4, stats['completed'])
+        self.assertEqual(0, stats['queue_depth'])
+
+    def test_exception_is_set_on_future(self):
+        # arrange
+        sut = ReaderService(self.rfid, init=False)
+
+        # act
+        with sut:
+            future = sut.submit(lambda rfid: 1 / 0)
+            error = future.exception(timeout=1)
+
+        # assert
+        self.assertIsInstance(error, ZeroDivisionError)
+        self.assertEqual(1, sut.get_stats()['failed'])
+
+    def test_stop_runs_all_queued_operations(self):
+        # arrange
+        sut = ReaderService(self.rfid, init=False)
+        futures = [sut.submit(lambda rfid, p=priority: p, priority=priority) for priority in (PRIORITY_LOW, PRIORITY_LOW + 5, 100)]
+
+        # act
+        sut.start()
+        sut.stop()
+
+        # assert
+        self.assertEqual([PRIORITY_LOW, PRIORITY_LOW + 5, 100], [future.result(timeout=1) for future in futures])
+
+    def test_submit_after_stop_raises(self):
+        # arrange
+        sut = ReaderService(self.rfid, init=False)
+        sut.start()
+        sut.stop()
+
+        # act / assert
+        self.assertRaises(RuntimeError, sut.submit, lambda rfid: None)
+        self.assertRaises(RuntimeError, sut.select)
+
+    def test_left_over_operations_are_canceled(self):
+        # arrange
+        sut = ReaderService(self.rfid, init=False)
+        future = sut.submit(lambda rfid: None)
+        sut._queue.put((-1, -1, sut._stop))                     # Worker ends before the operation
+
+        # act
+        sut.start()
+        sut._thread.join(1)
+
+        # assert
+        self.assertTrue(future.cancelled())
+
+    def test_operations_wait_for_healthy_watchdog(self):
+        # arrange
+        healthy = threading.Event()
+        watchdog = mock.MagicMock()
+        watchdog.bus_lock = threading.RLock()
+        watchdog.wait_healthy.side_effect = healthy.wait
+        sut = ReaderService(self.rfid, init=False, watchdog=watchdog)
+
+        # act
+        with sut:
+            future = sut.submit(lambda rfid: watchdog.bus_lock._is_owned())
+            done_while_unhealthy, __ = wait([future], timeout=0.2)
+            healthy.set()
+            holds_bus_lock = future.result(timeout=1)
+
+        # assert
+        self.assertEqual(set(), done_while_unhealthy)
+        self.assertTrue(holds_bus_lock)
+        watchdog.start.assert_called_once_with()
+        watchdog.stop.assert_called_once_with()
+
+    def test_stop_cancels_operations_waiting_for_unhealthy_watchdog(self):
+        # arrange
+        watchdog = mock.MagicMock()
+        watchdog.bus_lock = threading.RLock()
+        watchdog.wait_healthy.return_value = False
+        sut = ReaderService(self.rfid, init=False, watchdog=watchdog)
+        sut.start()
+        future = sut.submit(lambda rfid: None)
+
+        # act
+        sut.stop()
+
+        # assert
+        self.assertTrue(future.cancelled())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+'''
+Tests for the ReplayTransport
+'''
+import io
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import (MFRC522, MIFARE_Key, PICC_Command, PCD_Register, StatusCode, SimulatedSpi, SimulatedPicc, BinaryTracer,
+                     ReplayTransport, ReplayError, read_trace)
+
+
+def run_session(rfid):
+    rfid.pcd_init()
+    rfid.picc_is_new_card_present()
+    rfid.trace_irq()
+    status, uid = rfid.picc_select()
+    rfid.pcd_authenticate(PICC_Command.PICC_CMD_MF_AUTH_KEY_A, 7, MIFARE_Key(), uid)
+    status, data = rfid.mifare_read(4)
+    rfid.picc_halt_a()
+    rfid.pcd_stop_crypto1()
+    return status, uid, data
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        picc = SimulatedPicc([0x11, 0x22, 0x33, 0x44])
+        picc.memory[4] = list(range(16))
+        buffer = io.BytesIO()
+        rfid = MFRC522(pin_reset=0, pin_irq=0, spi=SimulatedSpi([picc]), tracer=BinaryTracer(buffer))
+        self.recorded = run_session(rfid)
+        buffer.seek(0)
+        self.records = list(read_trace(buffer))
+
+    def test_strict_replay_is_identical(self):
+        # arrange
+        irq_callback = mock.MagicMock()
+        sut = ReplayTransport(self.records, strict=True, irq_callback=irq_callback)
+        rfid = MFRC522(pin_reset=0, pin_irq=0, spi=sut)
+
+        # act
+        status, uid, data = run_session(rfid)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual(self.recorded[1].uid(), uid.uid())
+        self.assertEqual(list(range(16)), data[:16])
+        self.assertTrue(sut.finished)
+        self.assertEqual(0, sut.unmatched)
+        irq_callback.assert_called_once_with()
+
+    def test_strict_replay_detects_deviation(self):
+        # arrange
+        sut = ReplayTransport(self.records, strict=True)
+        rfid = MFRC522(pin_reset=0, pin_irq=0, spi=sut)
+        rfid.pcd_init()
+
+        # act / assert
+        with self.assertRaises(ReplayError):
+            rfid.pcd_write_register(PCD_Register.TxASKReg, 0x00)
+
+    def test_lenient_replay_tolerates_other_transfers(self):
+        # arrange
+        sut = ReplayTransport(self.records)
+        rfid = MFRC522(pin_reset=0, pin_irq=0, spi=sut)
+
+        # act
+        rfid.pcd_init()
+        version = rfid.pcd_get_version()                    # Not recorded
+        present = rfid.picc_is_new_card_present()
+        status, uid = rfid.picc_select()
+
+        # assert
+        self.assertEqual(0x00, version)
+        self.assertTrue(present)
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual([0x11, 0x22, 0x33, 0x44], uid.uid())
+        self.assertEqual(1, sut.get_stats()['unmatched'])
+
+
+if __name__ == '__main__':
+    unittest.main()
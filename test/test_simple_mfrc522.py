@@ -0,0 +1,122 @@
+'''
+Tests for SimpleMFRC522
+'''
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import SimpleMFRC522, StatusCode, PICC_Command, Uid, DedupeCache
+
+
+def create_uid():
+    uid = Uid()
+    uid.size = 4
+    uid.uid_byte = [0x01, 0x02, 0x03, 0x04] + [0] * 6
+    uid.sak = 0x08      # MIFARE 1K
+    return uid
+
+
+class TestSimpleMFRC522(unittest.TestCase):
+
+    def setUp(self):
+        self.sut = SimpleMFRC522()
+        self.sut.rfid = mock.MagicMock()
+        self.sut.wait_for_interrupt = mock.MagicMock(return_value=True)
+        self.sut.rfid.picc_read_card_serial.return_value = (True, create_uid())
+        self.sut.rfid.pcd_authenticate.return_value = StatusCode.STATUS_OK
+        self.sut.rfid.mifare_write.return_value = StatusCode.STATUS_OK
+        self.blocks = {}
+
+        def mifare_read(block_addr):
+            return StatusCode.STATUS_OK, self.blocks.get(block_addr, [0x41] * 16) + [0x00, 0x00]
+        self.sut.rfid.mifare_read.side_effect = mifare_read
+
+    def test_write_bytes_two_pass(self):
+        # arrange
+        self.blocks[1] = [0x42] * 8 + [0x00] * 8
+        data = [0x43] * 40
+
+        # act
+        status, __, old_data = self.sut.write_bytes(data)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual([0x42] * 8, old_data)
+        self.assertEqual(3, self.sut.rfid.pcd_authenticate.call_count)     # sector 0 for reading (A), sector 0 and 1 for writing (B)
+        self.assertEqual(3, self.sut.rfid.mifare_write.call_count)
+
+    def test_write_bytes_single_pass(self):
+        # arrange
+        self.blocks[4] = [0x42] * 8 + [0x00] * 8
+        data = [0x43] * 40
+
+        # act
+        status, __, old_data = self.sut.write_bytes(data, single_pass=True)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual([0x41] * 32 + [0x42] * 8, old_data)
+        commands = [c[0][0] for c in self.sut.rfid.pcd_authenticate.call_args_list]
+        self.assertEqual([PICC_Command.PICC_CMD_MF_AUTH_KEY_A] * 2, commands)   # sector 0 and 1, once each
+        self.assertEqual([1, 2, 4], [c[0][0] for c in self.sut.rfid.mifare_write.call_args_list])
+        self.assertEqual([1, 2, 4], [c[0][0] for c in self.sut.rfid.mifare_read.call_args_list])
+        self.assertEqual([0x43] * 8 + [0x00] * 8, self.sut.rfid.mifare_write.call_args_list[-1][0][1])
+
+    def test_write_bytes_without_old_data(self):
+        # act
+        status, __, old_data = self.sut.write_bytes([0x43] * 10, read_old_data=False, single_pass=True)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertIsNone(old_data)
+        self.assertEqual(1, self.sut.rfid.pcd_authenticate.call_count)
+        self.sut.rfid.mifare_read.assert_not_called()
+
+    def test_write_bytes_two_pass_without_old_data(self):
+        # act
+        status, __, old_data = self.sut.write_bytes([0x43] * 10, read_old_data=False)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertIsNone(old_data)
+        self.sut.rfid.mifare_read.assert_not_called()
+        self.assertEqual([PICC_Command.PICC_CMD_MF_AUTH_KEY_B], [c[0][0] for c in self.sut.rfid.pcd_authenticate.call_args_list])
+
+    def test_write_after_read_of_same_card_with_dedupe(self):
+        # arrange
+        self.sut.dedupe = DedupeCache(ttl=2.0)
+        self.sut.read_bytes()
+        self.sut.rfid.picc_halt_a.reset_mock()
+
+        # act
+        status, uid, __ = self.sut.write_bytes([0x43] * 10, read_old_data=False, single_pass=True)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual([0x01, 0x02, 0x03, 0x04], uid.uid())
+        self.assertEqual(2, self.sut.wait_for_interrupt.call_count)         # One wait for the read, one for the write
+        self.assertEqual(1, self.sut.rfid.picc_halt_a.call_count)           # Only the halt after writing
+
+    def test_read_of_same_card_with_dedupe_is_ignored(self):
+        # arrange
+        self.sut.dedupe = DedupeCache(ttl=2.0)
+        self.sut.read_bytes()
+        self.sut.wait_for_interrupt.side_effect = [True, False]
+
+        # act
+        status, __, __ = self.sut.read_bytes()
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_CANCELED, status)
+
+
+if __name__ == "__main__":
+    unittest.main()
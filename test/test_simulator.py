@@ -0,0 +1,114 @@
+'''
+Tests for the MFRC522 driver running against the SimulatedSpi
+'''
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import MFRC522, MIFARE_Key, PICC_Command, StatusCode, SimulatedSpi, SimulatedPicc
+from mfrc522.simulator import crc_a
+
+
+class TestSimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.picc = SimulatedPicc([0x11, 0x22, 0x33, 0x44])
+        self.spi = SimulatedSpi([self.picc])
+        self.sut = MFRC522(pin_reset=0, pin_irq=0, spi=self.spi)
+        self.sut.pcd_init()
+
+    def test_crc_a(self):
+        self.assertEqual([0x57, 0xCD], crc_a([0x50, 0x00]))
+
+    def test_self_test(self):
+        self.assertTrue(self.sut.pcd_perform_self_test())
+
+    def test_select_and_halt(self):
+        # act
+        present = self.sut.picc_is_new_card_present()
+        status, uid = self.sut.picc_select()
+        halt_status = self.sut.picc_halt_a()
+
+        # assert
+        self.assertTrue(present)
+        self.assertEqual(StatusCode.STATUS_OK, status)
+        self.assertEqual([0x11, 0x22, 0x33, 0x44], uid.uid())
+        self.assertEqual(0x08, uid.sak)
+        self.assertEqual(StatusCode.STATUS_OK, halt_status)
+        self.assertFalse(self.sut.picc_is_new_card_present())
+        self.assertTrue(self.sut.picc_is_card_present())
+
+    def test_anticollision(self):
+        # arrange
+        self.spi.add_picc(SimulatedPicc([0x11, 0x2A, 0x35, 0x46]))
+        self.spi.add_picc(SimulatedPicc([0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07]))
+
+        # act
+        uids = []
+        while self.sut.picc_is_new_card_present():
+            status, uid = self.sut.picc_select()
+            self.assertEqual(StatusCode.STATUS_OK, status)
+            self.sut.picc_halt_a()
+            uids.append(uid.uid())
+
+        # assert
+        self.assertEqual(sorted([[0x11, 0x22, 0x33, 0x44], [0x11, 0x2A, 0x35, 0x46], [0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07]]), sorted(uids))
+
+    def test_read_write_value(self):
+        # arrange
+        self.sut.picc_is_new_card_present()
+        __, uid = self.sut.picc_select()
+
+        # act
+        auth = self.sut.pcd_authenticate(PICC_Command.PICC_CMD_MF_AUTH_KEY_A, 4, MIFARE_Key(), uid)
+        write = self.sut.mifare_write(4, list(range(16)))
+        read = self.sut.mifare_read(4)
+        self.sut.mifare_set_value(5, 100)
+        self.sut.mifare_decrement(5, 30)
+        self.sut.mifare_transfer(5)
+        value = self.sut.mifare_get_value(5)
+        trailer = self.sut.mifare_read(7)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_OK, auth)
+        self.assertEqual(StatusCode.STATUS_OK, write)
+        self.assertEqual((StatusCode.STATUS_OK, list(range(16))), (read[0], read[1][:16]))
+        self.assertEqual((StatusCode.STATUS_OK, 70), value)
+        self.assertEqual([0] * 6 + [0xFF, 0x07, 0x80, 0x69] + [0xFF] * 6, trailer[1][:16])
+
+    def test_wrong_key_and_other_sector(self):
+        # arrange
+        self.sut.picc_is_new_card_present()
+        __, uid = self.sut.picc_select()
+        key = MIFARE_Key()
+        key.key_byte = [0x00] * 6
+
+        # act
+        wrong_key = self.sut.pcd_authenticate(PICC_Command.PICC_CMD_MF_AUTH_KEY_A, 4, key, uid)
+        self.sut.picc_is_card_present()
+        self.sut.picc_select()
+        self.sut.pcd_authenticate(PICC_Command.PICC_CMD_MF_AUTH_KEY_A, 4, MIFARE_Key(), uid)
+        other_sector, __ = self.sut.mifare_read(8)
+
+        # assert
+        self.assertEqual(StatusCode.STATUS_TIMEOUT, wrong_key)
+        self.assertEqual(StatusCode.STATUS_MIFARE_NACK, other_sector)
+
+    def test_no_card(self):
+        # arrange
+        self.spi.remove_picc(self.picc)
+
+        # act / assert
+        self.assertFalse(self.sut.picc_is_new_card_present())
+
+
+if __name__ == "__main__":
+    unittest.main()
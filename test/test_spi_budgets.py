@@ -0,0 +1,227 @@
+'''
+SPI transaction budgets of the public MFRC522 methods, measured against the SimulatedSpi.
+
+The number of SPI transfers predicts the latency on real hardware better than the CPU time, so every public
+method has a stored budget of transfers and bytes (spi_budgets.json). An operation exceeding its budget fails.
+After an intended change of the SPI traffic the budgets are rewritten with:
+
+    MFRC522_UPDATE_BUDGETS=1 python -m pytest test/test_spi_budgets.py
+'''
+import contextlib
+import inspect
+import io
+import json
+import os
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import (MFRC522, MIFARE_Key, PCD_Command, PCD_Register, PICC_Command, PICC_Type, StatusCode, SimulatedSpi,
+                     SimulatedPicc, RegisterSnapshot)
+
+
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'spi_budgets.json')
+
+UID4 = [0x11, 0x22, 0x33, 0x44]
+UID7 = [0x04, 0x11, 0x22, 0x33, 0x44, 0x55, 0x66]
+UID10 = [0x04, 0x11, 0x22, 0x33, 0x44, 0x55, 0x66, 0x77, 0x88, 0x99]
+AUTH_A = PICC_Command.PICC_CMD_MF_AUTH_KEY_A
+
+# Public methods without SPI traffic
+NO_SPI = {
+    'trace_irq',
+    'get_status_code_name',
+    'picc_get_type',
+    'picc_get_type_name',
+    'pcd_get_version_name',
+}
+
+
+def value_block(value, block_addr):
+    data = list(value.to_bytes(4, 'little'))
+    return data + [~b & 0xFF for b in data] + data + [block_addr, ~block_addr & 0xFF, block_addr, ~block_addr & 0xFF]
+
+
+def reader(piccs=()):
+    rfid = MFRC522(pin_reset=0, pin_irq=0, spi=SimulatedSpi(list(piccs)))
+    rfid.pcd_init()
+    return rfid
+
+
+def selected(uid=UID4, **kwargs):
+    picc = SimulatedPicc(uid, **kwargs)
+    picc.memory[4] = value_block(100, 4)
+    rfid = reader([picc])
+    rfid.picc_is_card_present()
+    status, uid = rfid.picc_select()
+    assert status == StatusCode.STATUS_OK, status
+    return rfid, uid
+
+
+def authenticated(block_addr=4):
+    rfid, uid = selected()
+    status = rfid.pcd_authenticate(AUTH_A, block_addr, MIFARE_Key(), uid)
+    assert status == StatusCode.STATUS_OK, status
+    return rfid, uid
+
+
+def on_selected(operation):
+    rfid, uid = selected()
+    return rfid, lambda rfid: operation(rfid, uid)
+
+
+def restored(block_addr=4):
+    rfid, uid = authenticated()
+    rfid.mifare_restore(block_addr)
+    return rfid
+
+
+def woken_up(uid=UID4):
+    rfid = reader([SimulatedPicc(uid)])
+    rfid.picc_is_card_present()
+    return rfid
+
+
+def with_reset_pin(rfid, pin_reset=25):
+    rfid.pin_reset = pin_reset
+    rfid.gpio = mock.MagicMock()
+    return rfid
+
+
+def started_request(rfid):
+    rfid.pcd_start_communication(PCD_Command.PCD_Transceive, [PICC_Command.PICC_CMD_REQA.value], 7)
+    return rfid
+
+
+# Scenario name -> function returning (rfid, operation). Only the SPI traffic of operation() is counted.
+SCENARIOS = {
+    'pcd_write_register': lambda: (reader(), lambda rfid: rfid.pcd_write_register(PCD_Register.ModeReg, 0x3D)),
+    'pcd_write_register2': lambda: (reader(), lambda rfid: rfid.pcd_write_register2(PCD_Register.FIFODataReg, list(range(16)))),
+    'pcd_read_register': lambda: (reader(), lambda rfid: rfid.pcd_read_register(PCD_Register.VersionReg)),
+    'pcd_read_register2': lambda: (reader(), lambda rfid: rfid.pcd_read_register2(PCD_Register.FIFODataReg, 16, 0)),
+    'pcd_read_registers': lambda: (reader(), lambda rfid: rfid.pcd_read_registers(RegisterSnapshot.REGISTERS)),
+    'pcd_set_register_bitmask': lambda: (reader(), lambda rfid: rfid.pcd_set_register_bitmask(PCD_Register.TxControlReg, 0x03)),
+    'pcd_clear_register_bitmask': lambda: (reader(), lambda rfid: rfid.pcd_clear_register_bitmask(PCD_Register.CollReg, 0x80)),
+    'pcd_calulate_crc': lambda: (reader(), lambda rfid: rfid.pcd_calulate_crc(list(range(16)))),
+    'pcd_init': lambda: (MFRC522(pin_reset=0, pin_irq=0, spi=SimulatedSpi([])), lambda rfid: rfid.pcd_init()),
+    'pcd_cleanup': lambda: (reader(), lambda rfid: rfid.pcd_cleanup()),
+    'pcd_reset': lambda: (reader(), lambda rfid: rfid.pcd_reset()),
+    'pcd_hard_reset': lambda: (with_reset_pin(reader()), lambda rfid: rfid.pcd_hard_reset()),
+    'antenna_on': lambda: (reader(), lambda rfid: rfid.antenna_on()),
+    'antenna_off': lambda: (reader(), lambda rfid: rfid.antenna_off()),
+    'pcd_get_antenna_gain': lambda: (reader(), lambda rfid: rfid.pcd_get_antenna_gain()),
+    'pcd_set_antenna_gain': lambda: (reader(), lambda rfid: rfid.pcd_set_antenna_gain(0x70)),
+    'pcd_save_registers': lambda: (reader(), lambda rfid: rfid.pcd_save_registers()),
+    'pcd_restore_registers': lambda: (reader(), lambda rfid: rfid.pcd_restore_registers(RegisterSnapshot.from_dict({'RFCfgReg': 0x70, 'ModeReg': 0x3D}))),
+    'pcd_perform_self_test': lambda: (reader(), lambda rfid: rfid.pcd_perform_self_test()),
+    'pcd_soft_power_down': lambda: (reader(), lambda rfid: rfid.pcd_soft_power_down()),
+    'pcd_soft_power_up': lambda: (reader(), lambda rfid: rfid.pcd_soft_power_up()),
+    'pcd_get_version': lambda: (reader(), lambda rfid: rfid.pcd_get_version()),
+    'pcd_transceive_data': lambda: (woken_up(), lambda rfid: rfid.pcd_transceive_data([PICC_Command.PICC_CMD_SEL_CL1.value, 0x20], True)),
+    'pcd_communicate_with_picc': lambda: (woken_up(), lambda rfid: rfid.pcd_communicate_with_picc(
+        PCD_Command.PCD_Transceive, 0x30, [PICC_Command.PICC_CMD_SEL_CL1.value, 0x20], True, 0)),
+    'pcd_start_communication': lambda: (reader([SimulatedPicc(UID4)]), lambda rfid: started_request(rfid)),
+    'pcd_poll_communication': lambda: (started_request(reader([SimulatedPicc(UID4)])), lambda rfid: rfid.pcd_poll_communication(0x30)),
+    'pcd_finish_communication': lambda: (started_request(reader([SimulatedPicc(UID4)])),
+                                         lambda rfid: rfid.pcd_finish_communication(PCD_Command.PCD_Transceive, True)),
+    'picc_request_a': lambda: (reader([SimulatedPicc(UID4)]), lambda rfid: rfid.picc_request_a()),
+    'picc_request_a (empty field)': lambda: (reader(), lambda rfid: rfid.picc_request_a()),
+    'picc_wakeup_a': lambda: (reader([SimulatedPicc(UID4)]), lambda rfid: rfid.picc_wakeup_a()),
+    'picc_reqa_or_wupa': lambda: (reader([SimulatedPicc(UID4)]), lambda rfid: rfid.picc_reqa_or_wupa(PICC_Command.PICC_CMD_REQA)),
+    'picc_select (4 byte UID)': lambda: (woken_up(UID4), lambda rfid: rfid.picc_select()),
+    'picc_select (7 byte UID)': lambda: (woken_up(UID7), lambda rfid: rfid.picc_select()),
+    'picc_select (10 byte UID)': lambda: (woken_up(UID10), lambda rfid: rfid.picc_select()),
+    'picc_halt_a': lambda: (selected()[0], lambda rfid: rfid.picc_halt_a()),
+    'pcd_authenticate': lambda: on_selected(lambda rfid, uid: rfid.pcd_authenticate(AUTH_A, 4, MIFARE_Key(), uid)),
+    'pcd_stop_crypto1': lambda: (authenticated()[0], lambda rfid: rfid.pcd_stop_crypto1()),
+    'mifare_read': lambda: (authenticated()[0], lambda rfid: rfid.mifare_read(5)),
+    'mifare_write': lambda: (authenticated()[0], lambda rfid: rfid.mifare_write(5, list(range(16)))),
+    'mifare_ultralight_write': lambda: (selected(UID7, sak=0x00)[0], lambda rfid: rfid.mifare_ultralight_write(4, [1, 2, 3, 4])),
+    'mifare_decrement': lambda: (authenticated()[0], lambda rfid: rfid.mifare_decrement(4, 1)),
+    'mifare_increment': lambda: (authenticated()[0], lambda rfid: rfid.mifare_increment(4, 1)),
+    'mifare_restore': lambda: (authenticated()[0], lambda rfid: rfid.mifare_restore(4)),
+    'mifare_transfer': lambda: (restored(), lambda rfid: rfid.mifare_transfer(5)),
+    'mifare_get_value': lambda: (authenticated()[0], lambda rfid: rfid.mifare_get_value(4)),
+    'mifare_set_value': lambda: (authenticated()[0], lambda rfid: rfid.mifare_set_value(5, 42)),
+    'mifare_copy_value_block': lambda: (authenticated()[0], lambda rfid: rfid.mifare_copy_value_block(4, 5)),
+    'mifare_backup_value_blocks': lambda: on_selected(lambda rfid, uid: rfid.mifare_backup_value_blocks(uid, MIFARE_Key(), [(4, 5)])),
+    'mifare_value_transaction': lambda: on_selected(lambda rfid, uid: rfid.mifare_value_transaction(uid, MIFARE_Key(), 4, 1, backup_block_addr=5)),
+    'pcd_mifare_transceive': lambda: (authenticated()[0], lambda rfid: rfid.pcd_mifare_transceive([PICC_Command.PICC_CMD_MF_WRITE.value, 5])),
+    'pcd_dump_version_to_serial': lambda: (reader(), lambda rfid: rfid.pcd_dump_version_to_serial()),
+    'picc_dump_to_serial': lambda: on_selected(lambda rfid, uid: rfid.picc_dump_to_serial(uid)),
+    'picc_dump_details_to_serial': lambda: on_selected(lambda rfid, uid: rfid.picc_dump_details_to_serial(uid)),
+    'picc_dump_mifare_classic_to_serial': lambda: on_selected(lambda rfid, uid: rfid.picc_dump_mifare_classic_to_serial(
+        uid, PICC_Type.PICC_TYPE_MIFARE_1K, MIFARE_Key())),
+    'picc_dump_mifare_classic_sector_to_serial': lambda: on_selected(lambda rfid, uid: rfid.picc_dump_mifare_classic_sector_to_serial(
+        uid, MIFARE_Key(), 1)),
+    'picc_dump_mifare_ultralight_to_serial': lambda: (selected(UID7, sak=0x00)[0], lambda rfid: rfid.picc_dump_mifare_ultralight_to_serial()),
+    'picc_is_new_card_present': lambda: (reader([SimulatedPicc(UID4)]), lambda rfid: rfid.picc_is_new_card_present()),
+    'picc_is_new_card_present (empty field)': lambda: (reader(), lambda rfid: rfid.picc_is_new_card_present()),
+    'picc_is_card_present': lambda: (reader([SimulatedPicc(UID4)]), lambda rfid: rfid.picc_is_card_present()),
+    'picc_read_card_serial': lambda: (woken_up(UID7), lambda rfid: rfid.picc_read_card_serial()),
+}
+
+
+def measure(scenario):
+    '''
+    @return: dict with the SPI transfers and bytes of the operation of the scenario
+    '''
+    rfid, operation = scenario()
+    transfers, bytes_transferred = rfid.spi.transfers, rfid.spi.bytes_transferred
+    with contextlib.redirect_stdout(io.StringIO()):             # The dump methods print
+        operation(rfid)
+    return {'transfers': rfid.spi.transfers - transfers, 'bytes': rfid.spi.bytes_transferred - bytes_transferred}
+
+
+def load_budgets():
+    with open(BUDGETS_PATH) as f:
+        return json.load(f)
+
+
+def public_methods():
+    return {name for name, member in inspect.getmembers(MFRC522, inspect.isfunction) if not name.startswith('_')}
+
+
+class TestSpiBudgets(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        if os.environ.get('MFRC522_UPDATE_BUDGETS'):
+            with open(BUDGETS_PATH, 'w') as f:
+                json.dump({name: measure(scenario) for name, scenario in SCENARIOS.items()}, f, indent=2)
+                f.write('\n')
+        cls.budgets = load_budgets()
+
+    def test_every_public_method_has_a_budget(self):
+        # arrange
+        covered = {name.split(' ')[0] for name in self.budgets} | NO_SPI
+
+        # act
+        missing = public_methods() - covered
+
+        # assert
+        self.assertEqual(set(), missing, 'Add a scenario to SCENARIOS or the method to NO_SPI')
+
+    def test_every_scenario_has_a_budget(self):
+        self.assertEqual(set(SCENARIOS), set(self.budgets))
+
+    def test_operations_within_budget(self):
+        for name, scenario in SCENARIOS.items():
+            with self.subTest(name):
+                # arrange
+                budget = self.budgets[name]
+
+                # act
+                used = measure(scenario)
+
+                # assert
+                self.assertLessEqual(used['transfers'], budget['transfers'], '{}: {} SPI transfers, budget {}'.format(name, used['transfers'], budget['transfers']))
+                self.assertLessEqual(used['bytes'], budget['bytes'], '{}: {} SPI bytes, budget {}'.format(name, used['bytes'], budget['bytes']))
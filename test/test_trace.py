@@ -0,0 +1,88 @@
+'''
+Tests for the SPI tracers
+'''
+import io
+import sys
+import unittest
+
+import unittest.mock as mock
+
+
+# Mock RPi.GPIO and spidev
+sys.modules['RPi'] = mock.MagicMock()
+sys.modules['RPi.GPIO'] = mock.MagicMock()
+sys.modules['spidev'] = mock.MagicMock()
+
+# After mocking libraries import the system under test (sut)
+from mfrc522 import (MFRC522, PCD_Register, SimulatedSpi, SimulatedPicc, MemoryTracer, BinaryTracer, LoggingTracer,
+                     TraceDirection, read_trace, format_record)
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.rfid = MFRC522(pin_reset=0, pin_irq=0, spi=SimulatedSpi([SimulatedPicc([0x11, 0x22, 0x33, 0x44])]))
+
+    def test_memory_tracer_records_registers(self):
+        # arrange
+        sut = MemoryTracer()
+        self.rfid.tracer = sut
+
+        # act
+        self.rfid.pcd_write_register2(PCD_Register.FIFODataReg, [0x01, 0x02])
+        version = self.rfid.pcd_get_version()
+
+        # assert
+        write, read = sut.records
+        self.assertEqual((TraceDirection.WRITE, PCD_Register.FIFODataReg.value, [0x01, 0x02]), write[1:])
+        self.assertEqual((TraceDirection.READ, PCD_Register.VersionReg.value, [version]), read[1:])
+        self.assertLessEqual(write.timestamp, read.timestamp)
+
+    def test_binary_tracer_round_trip(self):
+        # arrange
+        buffer = io.BytesIO()
+        sut = BinaryTracer(buffer)
+        self.rfid.tracer = sut
+
+        # act
+        self.rfid.pcd_init()
+        self.rfid.picc_is_new_card_present()
+        self.rfid.picc_select()
+        buffer.seek(0)
+        records = list(read_trace(buffer))
+
+        # assert
+        self.assertEqual(self.rfid.metrics.spi_transfers, len(records))
+        self.assertTrue(any(r.direction == TraceDirection.READ and r.register == PCD_Register.FIFODataReg.value and r.data[:4] == [0x11, 0x22, 0x33, 0x44]
+                            for r in records))
+        self.assertIn('write CommandReg [', format_record(records[0]))
+
+    def test_truncated_trace(self):
+        # arrange
+        buffer = io.BytesIO()
+        sut = BinaryTracer(buffer)
+        sut.record(1.0, TraceDirection.WRITE, PCD_Register.CommandReg.value, [0x0F])
+        sut.record(2.0, TraceDirection.READ, PCD_Register.ComIrqReg.value, [0x14])
+
+        # act
+        records = list(read_trace(io.BytesIO(buffer.getvalue()[:-1])))
+
+        # assert
+        self.assertEqual(1, len(records))
+        self.assertEqual([0x0F], records[0].data)
+
+    def test_logging_tracer(self):
+        # arrange
+        self.rfid.tracer = LoggingTracer()
+
+        # act
+        with self.assertLogs('mfrc522.spi', level='DEBUG') as logs:
+            self.rfid.pcd_write_register(PCD_Register.CommandReg, 0x0F)
+
+        # assert
+        self.assertEqual(1, len(logs.output))
+        self.assertIn('write CommandReg [0x0f]', logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()